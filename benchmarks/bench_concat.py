@@ -0,0 +1,337 @@
+"""ImageConcatNode 基准测试 | Benchmark harness for ImageConcatNode.
+
+生成合成图片文件夹（混合宽高比，JPEG/PNG/WebP，0.3~50 MP）与合成 a0_images 张量，按绘制模式 × 背景 × 保存模式 × 页宽
+逐一运行 generate_concat，记录每个阶段（dry run 规划 / 完整渲染）的耗时、图片/秒、峰值 RSS 与 tracemalloc 峰值，
+以及 b8_run_profile 中的分步耗时（decoding / resizing / saving 等），结果写入 JSON，并可与已保存的基线 JSON 逐步对比。tracemalloc 会拖慢 Python 代码，默认关闭（--tracemalloc 开启）。
+
+Usage:
+    python benchmarks/bench_concat.py --preset quick
+    python benchmarks/bench_concat.py --preset standard --output bench_new.json --baseline bench_base.json
+    python benchmarks/bench_concat.py --files 50000 --min-mp 0.3 --max-mp 2 --modes 3 5 --backgrounds light
+"""
+import os
+import gc
+import sys
+import json
+import time
+import math
+import shutil
+import hashlib
+import argparse
+import platform
+import threading
+import contextlib
+import tracemalloc
+import importlib
+import importlib.util
+import numpy as np
+import torch
+from PIL import Image
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "image_concat_bench"
+
+DRAW_MODES = ["1.smaller value filler", "2.Stretches image to fill", "3.zoom by long side (recommended)",
+              "4.crop square by short side", "5.equal title width up_down", "6.equal title height left_right"]
+BACKGROUNDS = {"light": "Light (white)", "dark": "Dark (black)", "transparent": "Transparent (alpha channel)"}
+SAVE_MODES = {"none": "none", "title": "save single title", "image": "save single image"}
+ASPECTS = [(1, 1), (4, 3), (3, 4), (16, 9), (9, 16), (3, 2), (2, 3), (3, 1), (1, 3)]
+FORMATS = [("JPEG", ".jpg", {"quality": 90}), ("PNG", ".png", {"compress_level": 1}),
+           ("WEBP", ".webp", {"quality": 85})]
+
+# 基线对比时忽略基线耗时低于该秒数的分步（b8_run_profile 中的 decoding/resizing 等）
+MIN_COMPARED_STEP_S = 0.05
+
+PRESETS = {
+    "quick": {"files": [24], "min_mp": 0.3, "max_mp": 2.0, "tensor_frames": [16], "tensor_size": [512, 512],
+              "page_widths": [2000], "save_modes": ["none"]},
+    "standard": {"files": [200], "min_mp": 0.3, "max_mp": 12.0, "tensor_frames": [64], "tensor_size": [768, 1024],
+                 "page_widths": [2000, 4000], "save_modes": ["none", "image"]},
+    "full": {"files": [10, 1000, 10000], "min_mp": 0.3, "max_mp": 50.0, "tensor_frames": [16, 256],
+             "tensor_size": [1024, 1024], "page_widths": [2000, 4000, 8000], "save_modes": ["none", "title", "image"]},
+}
+
+
+def load_node_class():
+    """以包的方式加载本插件（目录名可能含 '-'，不能直接 import），返回 ImageConcatNode"""
+    spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(PACKAGE_DIR, "__init__.py"),
+                                                  submodule_search_locations=[PACKAGE_DIR])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE_NAME] = package
+    spec.loader.exec_module(package)
+    return importlib.import_module(f"{PACKAGE_NAME}.node").ImageConcatNode
+
+
+def get_dataset_dir(workdir, file_count, min_mp, max_mp, seed):
+    key = hashlib.sha1(f"{file_count}|{min_mp}|{max_mp}|{seed}".encode("utf-8")).hexdigest()[:10]
+    return os.path.join(workdir, f"dataset_{file_count}_{key}")
+
+
+def make_synthetic_image(rng, width, height, mode):
+    """低频噪声放大得到的平滑图像：编码体积与真实照片接近，生成速度与像素数无关"""
+    small = rng.integers(0, 256, size=(max(2, height // 64), max(2, width // 64), len(mode)), dtype=np.uint8)
+    return Image.fromarray(small, mode).resize((width, height), Image.Resampling.BILINEAR)
+
+
+def ensure_dataset(workdir, file_count, min_mp, max_mp, seed=0):
+    """生成（或复用已生成的）合成图片文件夹：宽高比/格式轮换，像素数在 [min_mp, max_mp] 内按对数均匀分布"""
+    dataset_dir = get_dataset_dir(workdir, file_count, min_mp, max_mp, seed)
+    marker = os.path.join(dataset_dir, ".complete")
+    if os.path.exists(marker):
+        return dataset_dir
+    os.makedirs(dataset_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    for i in range(file_count):
+        aspect_w, aspect_h = ASPECTS[i % len(ASPECTS)]
+        pixels = math.exp(rng.uniform(math.log(min_mp), math.log(max_mp))) * 1e6
+        height = max(8, int(math.sqrt(pixels * aspect_h / aspect_w)))
+        width = max(8, int(height * aspect_w / aspect_h))
+        pil_format, ext, save_kwargs = FORMATS[i % len(FORMATS)]
+        mode = "RGBA" if pil_format == "PNG" and i % 4 == 1 else "RGB"
+        img = make_synthetic_image(rng, width, height, mode)
+        img.save(os.path.join(dataset_dir, f"bench_{i:06d}{ext}"), pil_format, **save_kwargs)
+    with open(marker, "w") as f:
+        f.write(str(file_count))
+    print(f"[✅] 合成数据集: {file_count} 个文件 | {time.perf_counter() - start:.1f}s | {dataset_dir}")
+    return dataset_dir
+
+
+def make_tensor_input(frames, height, width, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    small = torch.rand((frames, 3, max(2, height // 32), max(2, width // 32)), generator=generator)
+    images = torch.nn.functional.interpolate(small, size=(height, width), mode="bilinear", align_corners=False)
+    return images.permute(0, 2, 3, 1).contiguous()
+
+
+def read_rss_bytes():
+    """当前进程常驻内存；Linux 读 /proc，其余平台尽量用 psutil，都不可用时返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class PeakMemorySampler:
+    """Samples process RSS from a background thread and, optionally, tracks the tracemalloc peak of one phase."""
+
+    def __init__(self, interval=0.01, trace_python=False):
+        self.interval = interval
+        self.trace_python = trace_python
+        self.peak_rss = None
+        self.peak_traced = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        while not self.stop_event.is_set():
+            rss = read_rss_bytes()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        gc.collect()
+        if self.trace_python:
+            tracemalloc.start()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        if self.trace_python:
+            _, self.peak_traced = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return False
+
+
+def run_phase(node_cls, kwargs, image_count, verbose, trace_python=False):
+    """运行一次 generate_concat，返回 (阶段指标, 输出元组)；指标中 profile 为 b8_run_profile 的分步耗时"""
+    node = node_cls()
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        sampler = stack.enter_context(PeakMemorySampler(trace_python=trace_python))
+        start = time.perf_counter()
+        outputs = node.generate_concat(**kwargs)
+        wall = time.perf_counter() - start
+    metrics = {
+        "wall_s": round(wall, 4),
+        "images_per_s": round(image_count / wall, 2) if wall > 0 else None,
+        "peak_rss_mb": round(sampler.peak_rss / 1024 ** 2, 1) if sampler.peak_rss is not None else None,
+        "peak_traced_mb": round(sampler.peak_traced / 1024 ** 2, 1) if sampler.peak_traced is not None else None,
+    }
+    # b8_run_profile：{"phases": {步骤: {"seconds", "calls", "bytes"}}, "counters": {...}}
+    run_profile = json.loads(outputs[7])
+    metrics["profile"] = run_profile.get("phases", {})
+    metrics["counters"] = run_profile.get("counters", {})
+    return metrics, outputs
+
+
+def iter_cases(args, workdir):
+    """产出 (用例名, 输入描述, 图片数, generate_concat 参数)"""
+    inputs = []
+    for file_count in args.files:
+        dataset_dir = ensure_dataset(workdir, file_count, args.min_mp, args.max_mp)
+        inputs.append((f"folder:{file_count}", file_count, {"a1_image_dir": dataset_dir}))
+    tensor_h, tensor_w = args.tensor_size
+    for frames in args.tensor_frames:
+        inputs.append((f"tensor:{frames}x{tensor_h}x{tensor_w}", frames,
+                       {"a1_image_dir": "", "a0_images": make_tensor_input(frames, tensor_h, tensor_w)}))
+
+    for input_name, image_count, input_kwargs in inputs:
+        for mode_no in args.modes:
+            for bg_name in args.backgrounds:
+                for save_name in args.save_modes:
+                    for page_width in args.page_widths:
+                        case = f"{input_name}|m{mode_no}|{bg_name}|save={save_name}|w{page_width}"
+                        kwargs = dict(
+                            a2_page_width=page_width, a3_page_aspect_ratio=args.aspect,
+                            a4_cols_rows_per_page=args.cols, a5_page_margin=50, a6_title_padding=30,
+                            a8_title_first_position="start_from margin", a7_title_draw_mode=DRAW_MODES[mode_no - 1],
+                            a10_title_border="Rounded (radius=10px)", a11_title_border_style="Solid",
+                            a12_page_border="Rounded (radius=30px)", a13_page_border_style="Solid",
+                            a97_title_save_mode=SAVE_MODES[save_name],
+                            a98_title_save_dir=os.path.join(workdir, "out_titles"),
+                            a99_title_save_filename="source file name", a9_background_style=BACKGROUNDS[bg_name],
+                            a14_filename_position=args.filename_position, a15_filename_color="black",
+                            a17_render_workers=args.render_workers, a18_tile_workers=args.tile_workers,
+                            a20_output_mode=args.output_mode, a21_page_save_dir=os.path.join(workdir, "out_pages"),
+                            a25_tile_cache_mb=args.tile_cache_mb,
+                        )
+                        kwargs.update(input_kwargs)
+                        yield case, input_name, image_count, kwargs
+
+
+def iter_timings(phases):
+    """(阶段名, 秒数)：plan/render 的总耗时，以及各自 b8_run_profile 中的分步耗时（如 render/decoding）"""
+    for phase, metrics in phases.items():
+        yield phase, metrics["wall_s"]
+        for step, stats in metrics.get("profile", {}).items():
+            yield f"{phase}/{step}", stats["seconds"]
+
+
+def compare_with_baseline(results, baseline_path, threshold):
+    """按用例名与阶段（含分步耗时）对比，慢于基线 threshold 以上的记为回退；返回回退数"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {entry["case"]: entry for entry in json.load(f)["results"]}
+    regressions = 0
+    print(f"\n{'case':<70} {'phase':<26} {'base s':>9} {'new s':>9} {'ratio':>7}")
+    for entry in results:
+        base_entry = baseline.get(entry["case"])
+        if base_entry is None:
+            continue
+        base_timings = dict(iter_timings(base_entry["phases"]))
+        for phase, seconds in iter_timings(entry["phases"]):
+            base_seconds = base_timings.get(phase)
+            # 分步耗时太短时比值只反映计时抖动，不参与对比
+            if not base_seconds or ("/" in phase and base_seconds < MIN_COMPARED_STEP_S):
+                continue
+            ratio = seconds / base_seconds
+            flag = ""
+            if ratio > 1.0 + threshold:
+                flag = "  [REGRESSION]"
+                regressions += 1
+            elif ratio < 1.0 - threshold:
+                flag = "  [faster]"
+            print(f"{entry['case']:<70} {phase:<26} {base_seconds:>9.3f} {seconds:>9.3f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ImageConcatNode.generate_concat")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--files", type=int, nargs="*", help="synthetic folder sizes (number of files)")
+    parser.add_argument("--min-mp", type=float, help="smallest synthetic image, megapixels")
+    parser.add_argument("--max-mp", type=float, help="largest synthetic image, megapixels")
+    parser.add_argument("--tensor-frames", type=int, nargs="*", help="a0_images batch sizes (0 = none)")
+    parser.add_argument("--tensor-size", type=int, nargs=2, metavar=("H", "W"))
+    parser.add_argument("--page-widths", type=int, nargs="*")
+    parser.add_argument("--save-modes", nargs="*", choices=sorted(SAVE_MODES))
+    parser.add_argument("--modes", type=int, nargs="*", choices=range(1, 7), default=list(range(1, 7)))
+    parser.add_argument("--backgrounds", nargs="*", choices=list(BACKGROUNDS), default=list(BACKGROUNDS))
+    parser.add_argument("--cols", type=int, default=3, help="a4_cols_rows_per_page")
+    parser.add_argument("--aspect", default="3:2", help="a3_page_aspect_ratio")
+    parser.add_argument("--filename-position", default="bottom", help="a14_filename_position")
+    parser.add_argument("--render-workers", type=int, default=1)
+    parser.add_argument("--tile-workers", type=int, default=1)
+    parser.add_argument("--output-mode", default="batch tensor",
+                        choices=["batch tensor", "stream pages to disk", "stream to PDF (multi-page)",
+                                 "stream to TIFF (multi-page)"])
+    parser.add_argument("--tile-cache-mb", type=int, default=0,
+                        help="a25_tile_cache_mb; 0 (default) measures cold runs without cross-run tile reuse")
+    parser.add_argument("--workdir", default=os.path.join(PACKAGE_DIR, ".bench"))
+    parser.add_argument("--output", default=os.path.join(PACKAGE_DIR, ".bench", "bench_results.json"),
+                        help="results JSON (default: .bench/bench_results.json, ignored by git)")
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown reported as regression")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="also record the tracemalloc peak (slows down the timed runs)")
+    parser.add_argument("--verbose", action="store_true", help="keep the node's own log output")
+    args = parser.parse_args(argv)
+
+    preset = PRESETS[args.preset]
+    for name, value in preset.items():
+        if getattr(args, name) is None:
+            setattr(args, name, value)
+    args.tensor_frames = [frames for frames in args.tensor_frames if frames > 0]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    # 尺寸索引写到基准目录，不影响用户缓存
+    os.environ.setdefault("IMAGE_CONCAT_CACHE_DIR", os.path.join(workdir, "cache"))
+    node_cls = load_node_class()
+
+    results = []
+    for case, input_name, image_count, kwargs in iter_cases(args, workdir):
+        phases = {}
+        plan_metrics, plan_outputs = run_phase(node_cls, dict(kwargs, a16_run_mode="dry run (plan only)"),
+                                               image_count, args.verbose, args.tracemalloc)
+        phases["plan"] = plan_metrics
+        render_metrics, render_outputs = run_phase(node_cls, kwargs, image_count, args.verbose, args.tracemalloc)
+        phases["render"] = render_metrics
+        results.append({"case": case, "input": input_name, "images": int(render_outputs[3]),
+                        "pages": int(render_outputs[1]), "phases": phases})
+        print(f"[✅] {case:<70} pages={render_outputs[1]:<5} plan={plan_metrics['wall_s']:.3f}s "
+              f"render={render_metrics['wall_s']:.3f}s ({render_metrics['images_per_s']} img/s) "
+              f"rss={render_metrics['peak_rss_mb']}MB traced={render_metrics['peak_traced_mb']}MB")
+        top_steps = sorted(render_metrics["profile"].items(), key=lambda item: -item[1]["seconds"])[:4]
+        print("     " + " | ".join(f"{step} {stats['seconds']:.3f}s" for step, stats in top_steps))
+        del plan_outputs, render_outputs
+        for out_dir in ("out_titles", "out_pages"):
+            shutil.rmtree(os.path.join(workdir, out_dir), ignore_errors=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(), "torch": torch.__version__, "pillow": Image.__version__,
+            "numpy": np.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "args": vars(args),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"[✅] 结果已写入 {args.output} | 用例数: {len(results)}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.threshold)
+        print(f"[✅] 基线对比: {regressions} 个阶段慢于基线 {args.threshold:.0%} 以上")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
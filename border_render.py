@@ -0,0 +1,79 @@
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def dash_run_mask(length, dash_pattern):
+    """沿边的像素开关序列（含两端共 length+1 个像素）：dash_pattern 依次为 实/空/实/空… 的像素数，None 为实线"""
+    if dash_pattern is None or len(dash_pattern) < 2:
+        return np.ones(length + 1, dtype=bool)
+    table = np.concatenate([np.full(n, i % 2 == 0, dtype=bool) for i, n in enumerate(dash_pattern)])
+    return table[np.arange(length + 1) % len(table)]
+
+
+def edge_piece(length, dash_pattern, width, horizontal, forward):
+    """一条边的蒙版条：线宽方向的覆盖范围与 ImageDraw.line 一致（正向 -(w-1)//2..w//2，反向 -(w//2)..(w-1)//2）
+
+    返回 (横向偏移, 纵向偏移, L 蒙版)，偏移相对于边的起点所在行/列、边的最小坐标端。
+    """
+    run = dash_run_mask(length, dash_pattern)
+    if not forward:
+        run = run[::-1]
+    cross_start = -((width - 1) // 2) if forward else -(width // 2)
+    strip = np.repeat((run * 255).astype(np.uint8)[None, :], width, axis=0)
+    if horizontal:
+        return 0, cross_start, Image.fromarray(strip)
+    return cross_start, 0, Image.fromarray(np.ascontiguousarray(strip.T))
+
+
+class BorderStamp:
+    """Pre-rasterized border of one (w, h, radius, dash, width) rect, stored as thin mask pieces.
+
+    Each piece is (dx, dy, L mask) relative to the rect's top-left corner: four edge strips and,
+    for rounded rects, four corner arcs. Memory is proportional to the perimeter, not the area.
+    """
+
+    def __init__(self, w, h, radius, dash_pattern, width):
+        self.pieces = []
+        r = min(radius, w // 2, h // 2) if radius > 0 else 0
+        x1, y1, x2, y2 = 0, 0, w, h
+
+        if r > 0:
+            for start, end, dx, dy in [(180, 270, x1, y1), (270, 0, x2 - 2 * r, y1),
+                                       (0, 90, x2 - 2 * r, y2 - 2 * r), (90, 180, x1, y2 - 2 * r)]:
+                corner = Image.new('L', (2 * r + 1, 2 * r + 1), 0)
+                ImageDraw.Draw(corner).arc([0, 0, 2 * r, 2 * r], start, end, fill=255, width=width)
+                self.pieces.append((dx, dy, corner))
+
+        h_len = (x2 - r) - (x1 + r)
+        v_len = (y2 - r) - (y1 + r)
+        for length, horizontal, forward, ox, oy in [(h_len, True, True, x1 + r, y1),
+                                                    (v_len, False, True, x2, y1 + r),
+                                                    (h_len, True, False, x1 + r, y2),
+                                                    (v_len, False, False, x1, y1 + r)]:
+            if length < 0 or (length == 0 and dash_pattern is not None):
+                continue
+            if length == 0:
+                # 长度为 0 的实线与 ImageDraw.line 一样只画起点一个像素
+                self.pieces.append((ox, oy, Image.new('L', (1, 1), 255)))
+                continue
+            dx, dy, mask = edge_piece(length, dash_pattern, width, horizontal, forward)
+            self.pieces.append((ox + dx, oy + dy, mask))
+
+    def paste(self, canvas, x, y, color):
+        """把边框以 color 填充到 canvas 的 (x, y) 处；超出画布的部分由 PIL 裁剪"""
+        for dx, dy, mask in self.pieces:
+            canvas.paste(color, (x + dx, y + dy, x + dx + mask.width, y + dy + mask.height), mask)
+
+
+@lru_cache(maxsize=256)
+def get_border_stamp(w, h, radius, dash_pattern, width):
+    """按 (宽, 高, 圆角, 虚线样式, 线宽) 缓存的边框模板，同尺寸图块共用一份"""
+    return BorderStamp(w, h, radius, dash_pattern, width)
+
+
+def paste_border(canvas, canvas_top, rect, radius, dash_pattern, width, color):
+    """在 canvas 上绘制页面坐标 rect=[x1, y1, x2, y2] 的边框；canvas_top 为 canvas 在页面中的起始行"""
+    x1, y1, x2, y2 = rect
+    stamp = get_border_stamp(x2 - x1, y2 - y1, radius, dash_pattern, width)
+    stamp.paste(canvas, x1, y1 - canvas_top, color)
@@ -0,0 +1,166 @@
+import os
+import re
+import time
+import threading
+from fnmatch import fnmatchcase
+from collections import OrderedDict, namedtuple
+from .run_profile import logger
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp')
+
+SORT_ORDERS = ["natural", "name", "modified (oldest first)", "modified (newest first)", "size (smallest first)",
+               "size (largest first)"]
+
+# 目录 mtime 距扫描开始不足该时长时不作为缓存依据：粗粒度 mtime（NFS/FAT）下同一时间片内的改动无法分辨
+MTIME_RACY_WINDOW_NS = 2 * 10 ** 9
+MAX_CACHED_LISTINGS = 32
+
+# name 为相对 image_dir 的路径，子目录统一用 '/' 分隔
+ScanEntry = namedtuple("ScanEntry", ["name", "size", "mtime_ns"])
+
+
+def split_patterns(patterns):
+    """'*.jpg; raw/*' -> ('*.jpg', 'raw/*')，分号或换行分隔，统一小写（匹配不区分大小写）"""
+    return tuple(p.strip().lower() for p in re.split(r"[;\n]", patterns or "") if p.strip())
+
+
+def match_any(rel_path, patterns):
+    """不含 '/' 的模式只匹配文件名，含 '/' 的模式匹配整个相对路径"""
+    rel_lower = rel_path.lower()
+    base = rel_lower.rsplit("/", 1)[-1]
+    return any(fnmatchcase(rel_lower if "/" in p else base, p) for p in patterns)
+
+
+def natural_key(name):
+    """自然排序键：数字段按数值比较（img2 < img10），其余部分不区分大小写"""
+    parts = re.split(r"(\d+)", name.casefold())
+    return [int(part) if i % 2 else part for i, part in enumerate(parts)], name
+
+
+SORT_KEYS = {
+    "natural": lambda e: natural_key(e.name),
+    "name": lambda e: e.name,
+    "modified (oldest first)": lambda e: (e.mtime_ns, natural_key(e.name)),
+    "modified (newest first)": lambda e: (-e.mtime_ns, natural_key(e.name)),
+    "size (smallest first)": lambda e: (e.size, natural_key(e.name)),
+    "size (largest first)": lambda e: (-e.size, natural_key(e.name)),
+}
+
+
+def walk_image_dir(root, max_depth=0, include=(), exclude=(), extensions=IMAGE_EXTENSIONS):
+    """用 os.scandir 遍历 root（向下最多 max_depth 层子目录），返回 (图片条目列表, {相对目录: mtime_ns})。
+
+    文件大小/mtime 取自目录项，不单独打开文件；exclude 命中的子目录整棵跳过，不跟随目录符号链接。
+    """
+    entries = []
+    dir_mtimes = {}
+    pending = [("", 0)]
+    while pending:
+        rel_dir, depth = pending.pop()
+        dir_path = os.path.join(root, rel_dir) if rel_dir else root
+        try:
+            # 先取目录 mtime 再列目录：列目录期间的改动会让下次校验失败
+            dir_mtimes[rel_dir] = os.stat(dir_path).st_mtime_ns
+            with os.scandir(dir_path) as it:
+                dir_entries = list(it)
+        except OSError as e:
+            if not rel_dir:
+                raise
+            logger.warning(f"[Warning] Scan {dir_path} failed: {e}")
+            dir_mtimes.pop(rel_dir, None)
+            continue
+        for entry in dir_entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if depth < max_depth and not match_any(rel_path, exclude):
+                        pending.append((rel_path, depth + 1))
+                    continue
+                if not entry.name.lower().endswith(extensions) or not entry.is_file():
+                    continue
+                if include and not match_any(rel_path, include):
+                    continue
+                if exclude and match_any(rel_path, exclude):
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append(ScanEntry(rel_path, st.st_size, st.st_mtime_ns))
+    return entries, dir_mtimes
+
+
+class DirectoryListing:
+    """One cached scan result: image entries, the mtime of every scanned directory and sorted views."""
+
+    def __init__(self, entries, dir_mtimes, scanned_ns):
+        self.entries = entries
+        self.dir_mtimes = dir_mtimes
+        self.scanned_ns = scanned_ns
+        self.sorted = {}
+
+    def is_fresh(self, root):
+        """所有扫描过的目录 mtime 都未变化（且不在时间片竞争窗口内）时，列表仍然有效"""
+        for rel_dir, mtime_ns in self.dir_mtimes.items():
+            if mtime_ns >= self.scanned_ns - MTIME_RACY_WINDOW_NS:
+                return False
+            try:
+                if os.stat(os.path.join(root, rel_dir) if rel_dir else root).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def sorted_entries(self, sort_order):
+        entries = self.sorted.get(sort_order)
+        if entries is None:
+            entries = sorted(self.entries, key=SORT_KEYS.get(sort_order, SORT_KEYS["natural"]))
+            self.sorted[sort_order] = entries
+        return entries
+
+
+class DirectoryListingCache:
+    """Process-wide LRU of image folder listings, revalidated from directory mtimes.
+
+    Keys are (absolute folder, depth, include patterns, exclude patterns). A cached listing is
+    reused while no scanned directory's mtime has changed, which costs one ``stat`` per directory
+    instead of a full scan; adding, removing or renaming files changes the directory mtime.
+    Rewriting a file in place does not, so ``refresh=True`` forces a new scan (used by IS_CHANGED).
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_LISTINGS):
+        self.max_entries = max_entries
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def scan(self, image_dir, max_depth=0, include="", exclude="", sort_order="natural", refresh=False):
+        """返回按 sort_order 排好序的 ScanEntry 列表；image_dir 不可读时抛出 OSError"""
+        root = os.path.abspath(image_dir)
+        include = split_patterns(include)
+        exclude = split_patterns(exclude)
+        key = (root, max(0, int(max_depth)), include, exclude)
+        with self.lock:
+            listing = self.items.get(key)
+        if listing is not None and not refresh and listing.is_fresh(root):
+            with self.lock:
+                self.items.move_to_end(key)
+                self.hits += 1
+        else:
+            scanned_ns = time.time_ns()
+            entries, dir_mtimes = walk_image_dir(root, key[1], include, exclude)
+            listing = DirectoryListing(entries, dir_mtimes, scanned_ns)
+            with self.lock:
+                self.misses += 1
+                self.items[key] = listing
+                self.items.move_to_end(key)
+                while len(self.items) > self.max_entries:
+                    self.items.popitem(last=False)
+        return listing.sorted_entries(sort_order)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+directory_listings = DirectoryListingCache()
@@ -0,0 +1,182 @@
+import os
+import glob
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from .run_profile import logger
+
+# 可用环境变量 IMAGE_CONCAT_FONT 指定字体文件（如含中文字形的 .ttf/.ttc）
+FONT_ENV_VAR = "IMAGE_CONCAT_FONT"
+
+# Linux 上按顺序优先选择的字体文件名（含 CJK 字形的优先，文件名里常有中文）
+LINUX_FONT_NAMES = [
+    "NotoSansCJK-Regular.ttc", "NotoSansCJKsc-Regular.otf", "wqy-microhei.ttc", "wqy-zenhei.ttc",
+    "DejaVuSans.ttf", "LiberationSans-Regular.ttf", "NotoSans-Regular.ttf", "FreeSans.ttf",
+]
+LINUX_FONT_DIRS = [
+    "/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.local/share/fonts"),
+    os.path.expanduser("~/.fonts"),
+]
+
+_font_path_lock = threading.Lock()
+_font_path = None
+_font_path_resolved = False
+
+
+def is_usable_font(path):
+    try:
+        ImageFont.truetype(path, 10)
+        return True
+    except Exception:
+        return False
+
+
+def find_linux_font():
+    """依次尝试 fontconfig (fc-match) 与常见字体目录，返回可用字体文件路径或 None"""
+    if shutil.which("fc-match"):
+        try:
+            result = subprocess.run(["fc-match", "-f", "%{file}", "sans-serif:lang=zh-cn"],
+                                    capture_output=True, text=True, timeout=5)
+            path = result.stdout.strip()
+            if path and os.path.isfile(path) and is_usable_font(path):
+                return path
+        except (OSError, subprocess.SubprocessError):
+            pass
+
+    found = {}
+    for font_dir in LINUX_FONT_DIRS:
+        for path in glob.glob(os.path.join(font_dir, "**", "*.*"), recursive=True):
+            found.setdefault(os.path.basename(path), path)
+    for name in LINUX_FONT_NAMES:
+        if name in found and is_usable_font(found[name]):
+            return found[name]
+    return None
+
+
+def get_font_path():
+    """一次性确定标签字体：IMAGE_CONCAT_FONT > 系统默认字体 > None（使用 PIL 内置字体）"""
+    global _font_path, _font_path_resolved
+    with _font_path_lock:
+        if _font_path_resolved:
+            return _font_path
+
+        override = os.environ.get(FONT_ENV_VAR)
+        if override and is_usable_font(override):
+            _font_path = override
+        elif override:
+            logger.warning(f"[Warning] {FONT_ENV_VAR} font can't be loaded: {override}")
+
+        if _font_path is None:
+            if os.name == 'nt':
+                candidates = ["simhei.ttf", "msyh.ttc", "arial.ttf"]
+            elif os.path.isdir("/System/Library/Fonts"):
+                candidates = ["/System/Library/Fonts/PingFang.ttc", "/System/Library/Fonts/Helvetica.ttc"]
+            else:
+                candidates = []
+            _font_path = next((path for path in candidates if is_usable_font(path)), None)
+            if _font_path is None and not candidates:
+                _font_path = find_linux_font()
+
+        _font_path_resolved = True
+        logger.info(f"[✅] 标签字体: {_font_path or 'PIL default font'}")
+        return _font_path
+
+
+@lru_cache(maxsize=64)
+def load_font(font_path, font_size):
+    """按 (字体路径, 字号) 缓存的字体对象"""
+    if font_path is not None:
+        try:
+            return ImageFont.truetype(font_path, font_size)
+        except Exception:
+            pass
+    return ImageFont.load_default(size=font_size)
+
+
+def get_font(font_size):
+    return load_font(get_font_path(), font_size)
+
+
+def blend_rgba_like_draw(dst, sprite):
+    """按 ImageDraw.text 在 RGBA 画布上的规则合成（见 Pillow Paste.c fill_mask_L）：
+
+    颜色通道按覆盖率混合，但目标完全透明 (alpha=0) 处只要有覆盖就直接取墨水色；alpha 通道按覆盖率混合。
+    """
+    coverage = sprite[:, :, 3:4].astype(np.uint32)
+    dst = dst.astype(np.uint32)
+    ink = sprite.astype(np.uint32)
+    ink[:, :, 3] = 255
+    mask = np.repeat(coverage, 4, axis=2)
+    transparent = dst[:, :, 3:4] == 0
+    mask[:, :, :3] = np.where(transparent & (coverage > 0), 255, mask[:, :, :3])
+    tmp = dst * (255 - mask) + ink * mask + 128
+    return (((tmp >> 8) + tmp) >> 8).astype(np.uint8)
+
+
+class LabelSprite:
+    """A pre-rendered filename label: ink color in RGB, glyph coverage in alpha.
+
+    ``offset_x``/``offset_y`` are the ink box offset from the text origin (``textbbox`` at (0, 0)),
+    ``width``/``height`` the ink box size used for label placement.
+    """
+
+    def __init__(self, text, font_size, fill):
+        font = get_font(font_size)
+        bbox = font.getbbox(text)
+        self.offset_x, self.offset_y = bbox[0], bbox[1]
+        self.width = bbox[2] - bbox[0]
+        self.height = bbox[3] - bbox[1]
+        self.image = Image.new('RGBA', (max(1, self.width), max(1, self.height)), (0, 0, 0, 0))
+        ImageDraw.Draw(self.image).text((-self.offset_x, -self.offset_y), text, font=font, fill=fill)
+
+    def nbytes(self):
+        return self.image.width * self.image.height * 4
+
+    def paste_onto(self, canvas, xy):
+        """把标签合成到 canvas 的文字原点 xy 处（与 draw.text 在同一位置绘制的结果一致），超出画布部分裁掉"""
+        left, top = xy[0] + self.offset_x, xy[1] + self.offset_y
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + self.image.width, canvas.width), min(top + self.image.height, canvas.height)
+        if x1 <= x0 or y1 <= y0:
+            return
+        sprite = self.image
+        if (x0, y0, x1, y1) != (left, top, left + sprite.width, top + sprite.height):
+            sprite = sprite.crop((x0 - left, y0 - top, x1 - left, y1 - top))
+        if canvas.mode == 'RGBA':
+            canvas.paste(Image.fromarray(blend_rgba_like_draw(np.asarray(canvas.crop((x0, y0, x1, y1))),
+                                                              np.asarray(sprite))), (x0, y0))
+        else:
+            canvas.paste(sprite.convert(canvas.mode), (x0, y0), mask=sprite.getchannel('A'))
+
+
+class LabelSpriteCache:
+    """Process-wide LRU of ``LabelSprite`` keyed by (text, font size, color), bounded by total bytes."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, text, font_size, fill):
+        key = (text, font_size, fill)
+        with self.lock:
+            sprite = self.items.get(key)
+            if sprite is not None:
+                self.items.move_to_end(key)
+                return sprite
+            # FreeType 字体对象不保证线程安全，渲染也放在锁内（命中缓存时不会走到这里）
+            sprite = LabelSprite(text, font_size, fill)
+            self.items[key] = sprite
+            self.total_bytes += sprite.nbytes()
+            while self.total_bytes > self.max_bytes and len(self.items) > 1:
+                _, evicted = self.items.popitem(last=False)
+                self.total_bytes -= evicted.nbytes()
+            return sprite
+
+
+label_sprites = LabelSpriteCache()
@@ -0,0 +1,90 @@
+import os
+import json
+import hashlib
+from PIL import Image
+from .run_profile import logger
+
+INDEX_VERSION = 1
+
+
+def get_user_cache_dir():
+    """返回本插件的用户缓存目录（可用 IMAGE_CONCAT_CACHE_DIR 覆盖）"""
+    override = os.environ.get("IMAGE_CONCAT_CACHE_DIR")
+    if override:
+        return override
+    if os.name == 'nt':
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "comfyui-image-concat")
+
+
+class ImageDimensionIndex:
+    """Persistent (size, mtime) -> (width, height, mode) index for one image folder.
+
+    Dimensions are probed from the file header only (``Image.open`` is lazy), and the
+    results are kept in a JSON file under the user cache dir so later runs skip probing.
+    """
+
+    def __init__(self, image_dir, cache_dir=None):
+        self.image_dir = os.path.abspath(image_dir)
+        cache_dir = cache_dir or os.path.join(get_user_cache_dir(), "dim_index")
+        dir_key = hashlib.sha1(self.image_dir.encode("utf-8")).hexdigest()[:16]
+        self.index_path = os.path.join(cache_dir, f"{dir_key}.json")
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION and data.get("dir") == self.image_dir:
+                self.entries = data.get("entries", {})
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self, keep_names=None):
+        """Write the index back if anything changed; entries not in ``keep_names`` are dropped."""
+        if keep_names is not None:
+            keep = set(keep_names)
+            stale = [name for name in self.entries if name not in keep]
+            for name in stale:
+                del self.entries[name]
+            self.dirty = self.dirty or bool(stale)
+        if not self.dirty:
+            return
+        data = {"version": INDEX_VERSION, "dir": self.image_dir, "entries": self.entries}
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+        except OSError as e:
+            logger.warning(f"[Warning] Save image index failed: {e}")
+
+    def lookup(self, filename, stat_result=None):
+        """Return (width, height, mode) for ``filename``, or None if it can't be probed."""
+        path = os.path.join(self.image_dir, filename)
+        try:
+            st = stat_result if stat_result is not None else os.stat(path)
+        except OSError:
+            return None
+
+        entry = self.entries.get(filename)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2], entry[3], entry[4]
+
+        try:
+            with Image.open(path) as img:
+                w, h = img.size
+                mode = img.mode
+        except Exception as e:
+            logger.error(f"[Error] Probe img {filename} failed: {e}")
+            return None
+
+        self.entries[filename] = [st.st_size, st.st_mtime_ns, w, h, mode]
+        self.dirty = True
+        return w, h, mode
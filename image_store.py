@@ -0,0 +1,42 @@
+import threading
+from collections import OrderedDict
+
+
+class DecodedImageStore:
+    """Per-run store of decoded source images.
+
+    Every file goes through ``decode_func`` at most once per run; the decoded image stays
+    resident until ``release()`` is called for it (after its tile is pasted/saved) or it
+    falls out of the bounded LRU window. Safe to share between page render threads; decoding
+    itself happens outside the lock.
+    """
+
+    def __init__(self, decode_func, max_items=16):
+        self.decode_func = decode_func
+        self.max_items = max(1, int(max_items))
+        self.items = OrderedDict()
+        self.decode_count = 0
+        self.lock = threading.Lock()
+
+    def get(self, filename, min_size=None):
+        with self.lock:
+            img = self.items.get(filename)
+            if img is not None:
+                self.items.move_to_end(filename)
+                return img
+
+        img = self.decode_func(filename, min_size)
+        with self.lock:
+            self.decode_count += 1
+            self.items[filename] = img
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+        return img
+
+    def release(self, filename):
+        with self.lock:
+            self.items.pop(filename, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
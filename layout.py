@@ -0,0 +1,116 @@
+from collections import namedtuple
+import numpy as np
+
+# One record per placed image. tile_* is the title block (border rect / saved title size),
+# img_* is the resized image and its paste position, label_* is the filename anchor box.
+TILE_DTYPE = np.dtype([
+    ('file_idx', np.int32), ('page_pos', np.int32),
+    ('tile_x', np.int32), ('tile_y', np.int32), ('tile_w', np.int32), ('tile_h', np.int32),
+    ('img_x', np.int32), ('img_y', np.int32), ('img_w', np.int32), ('img_h', np.int32),
+    ('crop', np.int8),
+    ('label_x', np.int32), ('label_w', np.int32), ('label_outer_y', np.int32), ('label_inner_y', np.int32),
+    ('label_h', np.int32), ('font_size', np.int32),
+])
+
+TileRecord = namedtuple('TileRecord', TILE_DTYPE.names)
+
+# 网格模式每页最多的行数（与原先从 100 向下搜索的上限一致）
+MAX_ROWS_PER_PAGE = 100
+
+
+def solve_rows_per_column(height_use, tile_h, padding, has_outer_padding, max_rows=MAX_ROWS_PER_PAGE):
+    """网格模式每页行数：满足 n*h + (n-1)*p (+ (n+1)*p) <= height_use 的最大 n（1 ~ max_rows），直接由除法得出"""
+    # 行高总和为 n*step - slack
+    step = tile_h + 2 * padding if has_outer_padding else tile_h + padding
+    slack = 0 if has_outer_padding else padding
+    if step > 0:
+        n = min(max_rows, (height_use + slack) // step)
+    else:
+        n = max_rows if max_rows * step <= height_use + slack else 1
+    return max(1, n)
+
+
+def solve_fit_length(max_len, src_len, src_other, limit):
+    """不超过 max_len 的最大整数 L，使按源图比例换算的另一边 int(L * src_other / src_len) <= limit。
+
+    先用整数除法求出解，再按与调用方相同的浮点表达式校正舍入误差；无正解时返回 0。
+    """
+    ratio = src_other / src_len
+    if max_len <= 0 or int(max_len * ratio) <= limit:
+        return max_len
+    if limit < 0:
+        return 0
+    length = min(max_len - 1, ((limit + 1) * src_len - 1) // src_other)
+    while length > 0 and int(length * ratio) > limit:
+        length -= 1
+    while length + 1 < max_len and int((length + 1) * ratio) <= limit:
+        length += 1
+    return max(length, 0)
+
+
+def build_group_lookup(groups, sizes, padding):
+    """index -> (group index, inner index, offset) for images split into groups (columns or rows).
+
+    ``offset`` is the prefix sum of ``sizes[i] + padding`` over the images before it in its group,
+    so placing a tile is a single dict lookup instead of searching the groups.
+    """
+    lookup = {}
+    for group_idx, group in enumerate(groups):
+        offset = 0
+        for inner_idx, idx in enumerate(group):
+            lookup[idx] = (group_idx, inner_idx, offset)
+            offset += sizes[idx] + padding
+    return lookup
+
+
+class LayoutPlan:
+    """Page plan of one concat run: pages -> tile records, without any pixel data.
+
+    ``tiles`` is a structured array (``TILE_DTYPE``) of all placed images in page order;
+    ``page_offsets[p]:page_offsets[p + 1]`` is the slice belonging to page ``p``.
+    """
+
+    def __init__(self, image_files, page_width, page_height, margin, size_per_title, page_tiles):
+        self.image_files = image_files
+        self.page_width = int(page_width)
+        self.page_height = int(page_height)
+        self.margin = margin
+        self.size_per_title = size_per_title
+
+        self.page_offsets = np.zeros(len(page_tiles) + 1, dtype=np.int64)
+        np.cumsum([len(tiles) for tiles in page_tiles], out=self.page_offsets[1:])
+        self.tiles = np.array([rec for tiles in page_tiles for rec in tiles], dtype=TILE_DTYPE)
+
+    @property
+    def page_count(self):
+        return len(self.page_offsets) - 1
+
+    def page_tiles(self, page_idx):
+        return self.tiles[self.page_offsets[page_idx]:self.page_offsets[page_idx + 1]]
+
+    def iter_page_tiles(self, page_idx):
+        for row in self.page_tiles(page_idx).tolist():
+            yield TileRecord._make(row)
+
+    def scaled(self, divisor):
+        """1/divisor 分辨率的代理预览规划：每条边的坐标按 round(v / divisor) 映射，宽高取两条边映射后的差，
+
+        因此全分辨率结果缩小 divisor 倍后，块与图片的边界和预览逐像素对齐。
+        """
+        def scale_edge(v):
+            return np.floor(np.asarray(v, dtype=np.float64) / divisor + 0.5).astype(np.int64)
+
+        tiles = self.tiles.copy()
+        for pos, size in (('tile_x', 'tile_w'), ('tile_y', 'tile_h'), ('img_x', 'img_w'), ('img_y', 'img_h'),
+                          ('label_x', 'label_w'), ('label_inner_y', 'label_h')):
+            start = scale_edge(self.tiles[pos])
+            tiles[pos] = start
+            tiles[size] = np.maximum(scale_edge(self.tiles[pos] + self.tiles[size]) - start, 1)
+        tiles['label_outer_y'] = scale_edge(self.tiles['label_outer_y'])
+        tiles['font_size'] = np.maximum(scale_edge(self.tiles['font_size']), 1)
+
+        plan = LayoutPlan(self.image_files, int(scale_edge(self.page_width)), int(scale_edge(self.page_height)),
+                          int(scale_edge(self.margin)), self.size_per_title, [])
+        plan.page_offsets = self.page_offsets.copy()
+        plan.tiles = tiles
+        return plan
@@ -0,0 +1,153 @@
+from collections import namedtuple
+from .page_output import MAX_PREVIEW_PAGES, MEMMAP_THRESHOLD_BYTES
+from .strip_render import max_tiles_per_band
+
+MB = 1024 * 1024
+# 内存不足时依次尝试的条带高度（a23_strip_height 的步长为 64）
+STRIP_CANDIDATES = (4096, 2048, 1024, 512, 256, 128, 64)
+# 批量输出写入张量时 write_page_into 的行带高度、张量渲染的 interpolate 批大小
+CONVERT_BAND_ROWS = 256
+TENSOR_CHUNK_TILES = 64
+
+# 影响峰值内存的运行设置；memmap_output 为 True 时整批输出张量一律放到临时文件 memmap 上
+RenderSettings = namedtuple("RenderSettings", ["render_workers", "page_window", "tile_workers", "strip_height",
+                                               "decoded_sources", "tile_cache_bytes", "memmap_output"])
+
+
+class MemoryGovernor:
+    """Estimates the peak memory of one render from its page plan and fits the run settings into a budget.
+
+    The estimate is an upper bound of what the node itself allocates: page canvases (or strips)
+    in flight, the batch output tensor, resident and in-flight decoded sources, the resized tile
+    cache and queued title saves. Memory already held by the process (models, the ``a0_images``
+    batch) is not included.
+    """
+
+    def __init__(self, plan, channels, source_full_bytes, source_resident_bytes, title_bytes, save_titles,
+                 stream_output, stream_assembles_pages, tensor_render, title_writer_pending):
+        self.plan = plan
+        self.channels = channels
+        self.source_full_bytes = source_full_bytes
+        self.source_resident_bytes = source_resident_bytes
+        self.title_bytes = title_bytes
+        self.save_titles = save_titles
+        self.stream_output = stream_output
+        # 非 PNG 流式输出的条带仍要拼成整页再编码
+        self.stream_assembles_pages = stream_assembles_pages
+        self.tensor_render = tensor_render
+        self.title_writer_pending = title_writer_pending
+        self.tiles_per_band = {}
+
+    def get_tiles_per_band(self, strip_height):
+        if strip_height not in self.tiles_per_band:
+            self.tiles_per_band[strip_height] = max_tiles_per_band(self.plan, strip_height)
+        return self.tiles_per_band[strip_height]
+
+    def estimate(self, settings):
+        """返回 {组成部分: 字节数}"""
+        plan = self.plan
+        page_px = plan.page_width * plan.page_height
+        band_rows = settings.strip_height or plan.page_height
+        pages_in_flight = settings.page_window if settings.render_workers > 1 else 1
+
+        if self.tensor_render:
+            # 整页写在输出张量里，只有按条带分配的 RGBA 叠加层
+            page_bytes = plan.page_width * band_rows * 4
+        elif settings.strip_height > 0 and not (self.stream_output and self.stream_assembles_pages):
+            page_bytes = plan.page_width * band_rows * self.channels
+        else:
+            page_bytes = page_px * self.channels
+        if not self.stream_output:
+            page_bytes += plan.page_width * min(CONVERT_BAND_ROWS, plan.page_height) * self.channels * 4
+
+        output_bytes = plan.page_count * page_px * self.channels * 4
+        if self.stream_output:
+            # 前 MAX_PREVIEW_PAGES 页的 256px 缩略图（uint8 + 最终的 float32 批次）
+            output_bytes = min(plan.page_count, MAX_PREVIEW_PAGES) * 256 * 256 * self.channels * 5
+        elif settings.memmap_output or output_bytes > MEMMAP_THRESHOLD_BYTES:
+            output_bytes = 0
+
+        decoders = settings.render_workers * settings.tile_workers
+        full_tile_bytes = 0
+        if settings.strip_height > 0:
+            # 条带之间源图保持驻留，直到整页用完
+            decoded_sources = max(settings.decoded_sources, self.get_tiles_per_band(settings.strip_height))
+            if self.channels == 4:
+                # 透明页面上带 alpha 的源图整块缩放后按条带裁剪，整块保留到图块最后一个条带（title_bytes 即最大图块字节数）
+                full_tile_bytes = self.get_tiles_per_band(settings.strip_height) * self.title_bytes
+        else:
+            # 整页渲染时源图粘贴后立即释放，驻留量不超过各页图块流水线中的数量
+            decoded_sources = min(settings.decoded_sources, decoders * 2)
+        if self.tensor_render:
+            resident_bytes = 0
+            # interpolate 一批图块：uint8 输入/输出与 float32 结果
+            decoding_bytes = TENSOR_CHUNK_TILES * self.source_resident_bytes * 6
+        else:
+            resident_bytes = decoded_sources * self.source_resident_bytes
+            # 每个并发解码：文件解码出的整图与 convert 后的副本同时存在
+            decoding_bytes = decoders * self.source_full_bytes * 2
+
+        title_bytes = self.title_writer_pending * self.title_bytes if self.save_titles else 0
+        return {
+            "pages": pages_in_flight * page_bytes,
+            "output": output_bytes,
+            "decoded_sources": resident_bytes + full_tile_bytes,
+            "decoding": decoding_bytes,
+            "tile_cache": settings.tile_cache_bytes,
+            "title_saving": title_bytes,
+        }
+
+    def total(self, settings):
+        return sum(self.estimate(settings).values())
+
+    def reductions(self):
+        """按顺序尝试的降级步骤：(由当前设置得到更省内存设置的函数（不适用时返回 None）, 说明)"""
+        steps = [
+            (lambda s: s._replace(render_workers=1, page_window=1) if s.render_workers > 1 else None,
+             "render workers -> 1"),
+            (lambda s: s._replace(tile_workers=1) if s.tile_workers > 1 else None, "tile workers -> 1"),
+            (lambda s: s._replace(memmap_output=True) if not (self.stream_output or s.memmap_output) else None,
+             "batch output -> memmap"),
+            (lambda s: s._replace(decoded_sources=1) if s.decoded_sources > 1 else None, "decoded sources -> 1"),
+        ]
+        for strip_height in STRIP_CANDIDATES:
+            steps.append((lambda s, h=strip_height: s._replace(strip_height=h)
+                          if h < (s.strip_height or self.plan.page_height) else None,
+                          f"strip height -> {strip_height}"))
+        return steps
+
+    def fit(self, settings, budget_bytes):
+        """把 settings 调整到预计峰值不超过 budget_bytes：先缩小图块缓存，再依次降低并发、输出驻留、解码驻留与条带高度。
+
+        返回 (设置, 各部分估计, 调整说明列表)；最低设置仍超出预算时设置为 None。
+        """
+        changes = []
+        cache_bytes = settings.tile_cache_bytes
+        current = settings._replace(tile_cache_bytes=0)
+        if self.total(current) > budget_bytes:
+            best = self.total(current)
+            for step, change in self.reductions():
+                candidate = step(current)
+                if candidate is None:
+                    continue
+                candidate_total = self.total(candidate)
+                # 只保留确实降低估计值的调整（例如非 PNG 流式输出时条带并不省内存）
+                if candidate_total < best:
+                    current, best = candidate, candidate_total
+                    changes.append(change)
+                if best <= budget_bytes:
+                    break
+            if best > budget_bytes:
+                return None, self.estimate(current), changes
+
+        spare = budget_bytes - self.total(current)
+        current = current._replace(tile_cache_bytes=min(cache_bytes, spare // MB * MB))
+        if current.tile_cache_bytes < cache_bytes:
+            changes.insert(0, f"tile cache -> {current.tile_cache_bytes // MB} MB")
+        return current, self.estimate(current), changes
+
+
+def format_estimate(estimate):
+    """{部分: 字节} -> 'pages 120 MB | output 0 MB | ...'（按字节数从大到小）"""
+    return " | ".join(f"{name} {nbytes / MB:.0f} MB"
+                      for name, nbytes in sorted(estimate.items(), key=lambda item: -item[1]))
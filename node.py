@@ -1,9 +1,28 @@
 import os
 import math
+import time
 import numpy as np
 import torch
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from datetime import datetime
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from .border_render import paste_border
+from .dir_scan import SORT_ORDERS, directory_listings
+from .font_cache import get_font as get_label_font, label_sprites
+from .image_index import ImageDimensionIndex
+from .image_store import DecodedImageStore
+from .layout import LayoutPlan, build_group_lookup, solve_fit_length, solve_rows_per_column
+from .memory_budget import MB, MemoryGovernor, RenderSettings, format_estimate
+from .run_profile import RunProfile, logger, set_log_level
+from .page_output import (DOCUMENT_COMPRESSIONS, MEMMAP_THRESHOLD_BYTES, AsyncImageWriter, BatchPageSink,
+                          DiskPageSink, DocumentPageSink, save_image)
+from .strip_render import iter_bands, max_tiles_per_band, resolve_strip_height
+from .source_fingerprint import (dir_fingerprint, file_fingerprint, sampled_tensor_fingerprint,
+                                 tensor_fingerprint)
+from .tile_cache import PREVIEW_PROXY_SIDE, resized_tiles
+from .tensor_render import (center_square_box, composite_overlay, fill_page_background, frame_to_pil,
+                            paste_frames_into_page)
 
 # Global node registration dictionary
 NODE_CLASS_MAPPINGS = {}
@@ -176,18 +195,199 @@ class ImageConcatNode:
                 "a0_images": ("IMAGE",
                                     {"tooltip": "select image(s) from other node.\n"
                                      " If 'a0_images' are connected via input, `a1_image_dir` will be IGNORE."}),
+                "a16_run_mode": ("COMBO", {
+                    "default": "render",
+                    "forceInput": False,
+                    "options": ["render", "dry run (plan only)", "preview 1/4 (fast)", "preview 1/8 (fast)"],
+                    "label": "a16_Run Mode",
+                    "tooltip": "'dry run' only plans the layout: returns page count and title size (plus a wireframe "
+                               "preview of page 1) without decoding or rendering any image. 'preview' renders the same "
+                               "layout at 1/4 or 1/8 resolution with draft decoding and bilinear resizing; nothing is "
+                               "saved to disk."
+                }),
+                "a17_render_workers": ("INT", {
+                    "default": 1,
+                    "min": 0,
+                    "max": 64,
+                    "step": 1,
+                    "label": "a17_Render Workers",
+                    "tooltip": "Number of pages rendered in parallel (threads). 1 = one page at a time, "
+                               "0 = use all CPU cores."
+                }),
+                "a18_tile_workers": ("INT", {
+                    "default": 1,
+                    "min": 0,
+                    "max": 64,
+                    "step": 1,
+                    "label": "a18_Tile Workers",
+                    "tooltip": "Threads that decode and resize the tiles of one page concurrently (pasting stays "
+                               "in order). Useful for pages with many tiles. 0 = use all CPU cores."
+                }),
+                "a19_decode_mode": ("COMBO", {
+                    "default": "downscale on decode (fast)",
+                    "forceInput": False,
+                    "options": ["downscale on decode (fast)", "full resolution"],
+                    "label": "a19_Decode Mode",
+                    "tooltip": "'downscale on decode' decodes big sources at the smallest size that is still at least "
+                               "the tile size (JPEG draft / integer reduce) before the final LANCZOS resize."
+                }),
+                "a20_output_mode": ("COMBO", {
+                    "default": "batch tensor",
+                    "forceInput": False,
+                    "options": ["batch tensor", "stream pages to disk", "stream to PDF (multi-page)",
+                                "stream to TIFF (multi-page)"],
+                    "label": "a20_Output Mode",
+                    "tooltip": "'stream pages to disk' writes each page to 'a21_page_save_dir' as soon as it is rendered "
+                               "and frees it; b1 then only holds small thumbnails (first 64 pages) and b7 lists the page files. "
+                               "The PDF/TIFF modes append each page to one multi-page document instead (see a34/a35)."
+                }),
+                "a21_page_save_dir": ("STRING", {
+                    "default": "./output/concat_pages",
+                    "placeholder": "page save directory path",
+                    "tooltip": "Directory for streamed pages (a timestamped sub-folder is created) or for the "
+                               "timestamped multi-page PDF/TIFF."
+                }),
+                "a22_page_format": ("COMBO", {
+                    "default": "PNG",
+                    "forceInput": False,
+                    "options": ["PNG", "PNG (fast)", "JPEG (quality 95)", "WebP (lossless)", "WebP (quality 90)"],
+                    "label": "a22_Page Format",
+                    "tooltip": "File format of streamed pages. JPEG has no alpha channel."
+                }),
+                "a23_strip_height": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 16384,
+                    "step": 64,
+                    "label": "a23_Strip Height",
+                    "tooltip": "Render each page in horizontal strips of this many rows to bound memory on poster-size "
+                               "canvases. 0 = auto (1024-row strips only for pages above 64 megapixels)."
+                }),
+                "a24_title_save_format": ("COMBO", {
+                    "default": "PNG",
+                    "forceInput": False,
+                    "options": ["PNG", "PNG (fast)", "JPEG (quality 95)", "WebP (lossless)", "WebP (quality 90)"],
+                    "label": "a24_Title Save Format",
+                    "tooltip": "File format of titles/images saved by 'a97_title_save_mode'. They are encoded by "
+                               "background writer threads. JPEG has no alpha channel."
+                }),
+                "a25_tile_cache_mb": ("INT", {
+                    "default": 512,
+                    "min": 0,
+                    "max": 65536,
+                    "step": 64,
+                    "label": "a25_Tile Cache (MB)",
+                    "tooltip": "Memory budget of the process-wide cache of resized tiles (LRU). Reruns that keep the "
+                               "tile sizes (e.g. only margins, borders, filenames or background changed) skip decoding "
+                               "and resizing. 0 = disabled."
+                }),
+                "a26_log_level": ("COMBO", {
+                    "default": "normal",
+                    "forceInput": False,
+                    "options": ["normal", "verbose", "quiet"],
+                    "label": "a26_Log Level",
+                    "tooltip": "Console output: 'normal' prints a run summary, 'verbose' adds per-page and per-group "
+                               "layout details, 'quiet' only prints warnings and errors. Timings are always in "
+                               "'b8_run_profile'."
+                }),
+                "a27_scan_depth": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 32,
+                    "step": 1,
+                    "label": "a27_Scan Depth",
+                    "tooltip": "How many levels of sub-folders of 'a1_image_dir' are scanned for images. "
+                               "0 = only the folder itself."
+                }),
+                "a28_include_patterns": ("STRING", {
+                    "default": "",
+                    "placeholder": "e.g. *.jpg; shots/*",
+                    "tooltip": "Only use images matching one of these glob patterns (separated by ';'). Patterns "
+                               "without '/' match the file name, others the path relative to 'a1_image_dir'. "
+                               "Empty = all images."
+                }),
+                "a29_exclude_patterns": ("STRING", {
+                    "default": "",
+                    "placeholder": "e.g. *_mask.png; thumbs",
+                    "tooltip": "Skip images (and sub-folders) matching one of these glob patterns (separated by ';')."
+                }),
+                "a30_sort_order": ("COMBO", {
+                    "default": "natural",
+                    "forceInput": False,
+                    "options": SORT_ORDERS,
+                    "label": "a30_Sort Order",
+                    "tooltip": "Order of the images on the pages. 'natural' sorts numbers by value (img2 before "
+                               "img10); ties in time/size orders fall back to natural order."
+                }),
+                "a31_page_window": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 256,
+                    "step": 1,
+                    "label": "a31_Page Window",
+                    "tooltip": "With parallel rendering, the most pages rendered ahead of the output (finished pages "
+                               "wait in memory until handed on in order). 0 = auto (2 x render workers)."
+                }),
+                "a32_decoded_sources": ("INT", {
+                    "default": 16,
+                    "min": 1,
+                    "max": 4096,
+                    "step": 1,
+                    "label": "a32_Decoded Sources",
+                    "tooltip": "Most decoded source images kept in memory at once (LRU); strip rendering raises it "
+                               "to the tiles of one strip."
+                }),
+                "a33_max_memory_mb": ("INT", {
+                    "default": 0,
+                    "min": 0,
+                    "max": 1048576,
+                    "step": 256,
+                    "label": "a33_Max Memory (MB)",
+                    "tooltip": "Memory budget of one render. The peak is estimated from the page plan before rendering "
+                               "and the tile cache, workers, output backing, decoded sources and strip height are "
+                               "lowered to fit; if even the lowest settings don't fit, the run stops with an error. "
+                               "0 = no limit."
+                }),
+                "a34_document_dpi": ("INT", {
+                    "default": 300,
+                    "min": 36,
+                    "max": 2400,
+                    "step": 1,
+                    "label": "a34_Document DPI",
+                    "tooltip": "Resolution stored in the multi-page PDF/TIFF. It sets the printed size "
+                               "(page width in inches = a2_page_width / DPI); pixels are not resampled."
+                }),
+                "a35_document_compression": ("COMBO", {
+                    "default": "lossless (Deflate)",
+                    "forceInput": False,
+                    "options": list(DOCUMENT_COMPRESSIONS),
+                    "label": "a35_Document Compression",
+                    "tooltip": "Compression of every page of the multi-page PDF/TIFF. JPEG is much smaller for photo "
+                               "sheets; transparency is kept as a separate lossless mask (PDF) or alpha channel (TIFF)."
+                }),
             },
         }
 
-    RETURN_TYPES = ("IMAGE", "INT", "STRING", "INT", "STRING", "STRING")
+    RETURN_TYPES = ("IMAGE", "INT", "STRING", "INT", "STRING", "STRING", "STRING", "STRING")
     RETURN_NAMES = (
         "b1_concat_images", "b2_page_count", "b3_size_per_title", "b4_valid_image_count", "b5_title_save_path",
-        "b6_help_info")
+        "b6_help_info", "b7_page_paths", "b8_run_profile")
     FUNCTION = "generate_concat"
     CATEGORY = "Image Processing/concat"
     DESCRIPTION = "A powerful image concatenation tool for ComfyUI, with True Alpha Channel Support " \
                   "and Multiple Image-title Fill Modes. It can also be used as a image-resize tool."
 
+    @classmethod
+    def IS_CHANGED(cls, a1_image_dir="", a0_images=None, a27_scan_depth=0, a28_include_patterns="",
+                   a29_exclude_patterns="", **kwargs):
+        """供 ComfyUI 执行缓存判断源图是否变化：输入批次取抽样哈希，文件夹取一次 scandir 的元数据指纹。
+
+        其余参数的变化由 ComfyUI 自行比较；指纹不变时重复排队不会重新渲染。
+        """
+        if a0_images is not None:
+            return sampled_tensor_fingerprint(a0_images)
+        return dir_fingerprint(a1_image_dir, a27_scan_depth, a28_include_patterns, a29_exclude_patterns)
+
     def get_node_tips(self):
         tips = """
     ===========================================================================
@@ -244,6 +444,61 @@ class ImageConcatNode:
                        | source file number: 按序号命名 (00001.jpg...)                     
                        | source file name: 使用原文件名 (默认) 
                        | page + number: 页码+序号 (p1_1.png...)，序号从1开始
+    ▷ a16_run_mode     | 运行模式 (可选) | Run mode (Optional)
+                       | render: 正常渲染 (默认) | Normal rendering (Default)
+                       | dry run (plan only): 只规划布局，不解码/不渲染，快速得到页数与块尺寸
+                       |   Plan only: returns b2/b3 without decoding or rendering, b1 = wireframe of page 1
+                       | preview 1/4, 1/8 (fast): 同一布局按 1/4 或 1/8 分辨率快速渲染 (草稿解码 + 双线性缩放)，不保存任何文件
+                       |   Same layout at 1/4 or 1/8 resolution, draft decode + bilinear; nothing is written to disk
+    ▷ a17_render_workers | 并行渲染页数 (可选) | Pages rendered in parallel (Optional)
+                       | 1: 逐页渲染 (默认) | One page at a time (Default)
+                       | 0: 使用全部 CPU 核心 | Use all CPU cores | 输出页序不变 | Page order is kept
+    ▷ a18_tile_workers | 单页内并发解码/缩放线程数 (可选) | Threads decoding/resizing tiles of one page (Optional)
+                       | 1: 逐张处理 (默认) | One tile at a time (Default) | 0: 使用全部 CPU 核心 | Use all CPU cores
+                       | 粘贴顺序不变，适合单页大量图块 (如 a4=8 共 64 块) | Paste order is kept; helps big single pages
+    ▷ a19_decode_mode  | 源图解码方式 (可选) | Source decode mode (Optional)
+                       | downscale on decode (fast): 大图按不小于图块的尺寸缩小解码 (JPEG draft / reduce)，默认
+                       |   Decode big sources at the smallest size >= tile size, then LANCZOS (Default)
+                       | full resolution: 全分辨率解码后再缩放 | Decode at full resolution, then resize
+    ▷ a20_output_mode  | 页面输出方式 (可选) | Page output mode (Optional)
+                       | batch tensor: 所有页作为批量张量输出到 b1 (默认) | All pages as batch tensor in b1 (Default)
+                       | stream pages to disk: 每页渲染完立即写入磁盘并释放，b1 仅为缩略图，b7 为文件路径
+                       |   Each page is written to disk and freed right away; b1 = thumbnails, b7 = file paths
+                       | stream to PDF / TIFF (multi-page): 每页渲染完立即追加到同一个多页文档，b7 为文档路径
+                       |   Each page is appended to one multi-page document right away; b7 = document path
+    ▷ a21_page_save_dir | 流式输出的页面保存路径 | Save path of streamed pages | Default=./output/concat_pages
+    ▷ a22_page_format  | 流式输出的页面格式 | File format of streamed pages | PNG / PNG (fast) / JPEG / WebP
+    ▷ a23_strip_height | 条带渲染的行高 (可选) | Rows per render strip (Optional) | Default=0 (auto)
+                       | 超大页面按水平条带逐段渲染并写入输出，内存只与条带高度有关；0 = 页面超过 6400 万像素时自动启用
+                       |   Giant pages are rendered band by band, memory bounded by strip height; 0 = auto above 64 MP
+                       | 流式输出为 PNG 时条带直接写入编码器 | With PNG streaming, strips go straight into the encoder
+    ▷ a24_title_save_format | 独立块保存格式 (可选) | File format of saved titles (Optional) | Default=PNG
+                       | PNG / PNG (fast, compress_level 1) / JPEG (quality 95) / WebP (lossless) / WebP (quality 90)
+                       | 由后台线程编码写盘，返回前等待全部写完；非 PNG 格式时文件扩展名随格式改变
+                       |   Encoded by background writer threads, all flushed before returning; non-PNG formats
+                       |   replace the file extension
+    ▷ a25_tile_cache_mb | 缩放图块缓存大小 MB (可选) | Resized tile cache budget in MB (Optional) | Default=512
+                       | 进程级 LRU 缓存，键为 (源图指纹, 目标宽高, 裁剪, 解码方式, 保留透明度, 重采样方式)；
+                       |   只改边距/边框/文件名/背景时跳过解码与缩放 | Process-wide LRU keyed by (source fingerprint,
+                       |   size, crop, decode mode, alpha, resample filter); reruns that keep tile sizes skip decoding
+                       |   and resizing | 0 = 关闭 | 0 = disabled
+    ▷ a26_log_level    | 控制台日志级别 (可选) | Console log level (Optional) | Default=normal
+                       | normal: 运行摘要 | Run summary | verbose: 另含每页/每组布局细节 | Adds per-page/group details
+                       | quiet: 仅警告与错误 | Warnings and errors only
+    ▷ a27_scan_depth   | 子文件夹扫描层数 (可选) | Sub-folder scan depth (Optional) | Default=0
+    ▷ a28_include_patterns | 仅包含匹配的图片，';'分隔 (可选) | Include glob patterns, ';'-separated (Optional)
+    ▷ a29_exclude_patterns | 排除匹配的图片/子文件夹 (可选) | Exclude glob patterns (Optional)
+    ▷ a30_sort_order   | 图片排序方式 (可选) | Image sort order (Optional) | Default=natural
+    ▷ a31_page_window  | 并行渲染时领先输出的最大页数 (可选) | Pages rendered ahead of the output (Optional) | 0=auto
+    ▷ a32_decoded_sources | 同时驻留的已解码源图数 (可选) | Decoded sources kept in memory (Optional) | Default=16
+    ▷ a33_max_memory_mb | 单次渲染内存预算 MB (可选) | Memory budget of one render in MB (Optional) | 0=无限制 | No limit
+                       | 渲染前按页面规划估算峰值，自动降低缓存/并发/条带高度等设置，仍超出则报错停止
+                       |   Peak is estimated from the plan; settings are lowered to fit, otherwise the run fails
+    ▷ a34_document_dpi | 多页 PDF/TIFF 的分辨率 (可选) | Resolution of multi-page PDF/TIFF (Optional) | Default=300
+                       | 决定打印尺寸 (PDF 页面大小 = 像素 × 72 / DPI 磅)，不改变像素 | Sets print size only, not pixels
+    ▷ a35_document_compression | 多页 PDF/TIFF 每页的压缩方式 (可选) | Per-page compression of PDF/TIFF (Optional)
+                       | lossless (Deflate): 无损 (默认) | Lossless (Default) | JPEG (quality 95 / 85): 有损，体积更小
+                       |   Lossy, smaller files | 透明背景以 PDF 软蒙版 / TIFF alpha 通道保留 | Alpha is kept
 
     【 II. Output Params B1~B6 Detailed Meaning | 输出参数 B1 ~ B6 详细含义 】
     ---------------------------------------------------------------------------
@@ -254,6 +509,11 @@ class ImageConcatNode:
     ▷ b4_valid_image_count | 读取到的有效图片总数 | Total valid images read (Integer) | For verification
     ▷ b5_title_save_path | 独立块的最终保存路径 | Final save path of individual titles (String) | With timestamp
     ▷ b6_help_info     | 本帮助手册 | This help manual | Real-time parameter reference
+    ▷ b7_page_paths    | 流式输出时各页文件路径(每行一个)或多页文档路径 | Streamed page paths (one per line) or document path
+    ▷ b8_run_profile   | 本次运行各阶段耗时/字节数 (JSON) | Per-phase time/bytes of this run (JSON)
+                       | 列目录/探测尺寸/规划/解码/缩放/合成/边框文字/单图保存/张量转换(或页面编码)
+                       |   listing/probing/planning/decoding/resizing/compositing/borders_text/title_saving/
+                       |   tensor_conversion (or page_encoding); 多线程阶段为各线程耗时之和 | summed over threads
 
     【 III. Core Features & Optimization Log | 核心特性与更新日志 】 
     ---------------------------------------------------------------------------
@@ -307,7 +567,7 @@ class ImageConcatNode:
             height_num = float(height_part)
             return width_num / height_num
         except (ValueError, IndexError) as e:
-            print(f"[Warning] Invalid ratio format: {ratio_str}, using default 1.5 (3:2)")
+            logger.warning(f"[Warning] Invalid ratio format: {ratio_str}, using default 1.5 (3:2)")
             return 1.5
 
     def get_filename_color_by_name(self, color_name):
@@ -348,55 +608,14 @@ class ImageConcatNode:
             dash_pattern = None
         return dash_pattern
 
-    def draw_dashed_line_manual(self, draw, start, end, dash_pattern, width=2, color='black'):
-        if dash_pattern is None or len(dash_pattern) < 2:
-            draw.line([start, end], fill=color, width=width)
-            return
+    def draw_dashed_rectangle_manual(self, canvas, rect, dash_pattern, width=2, color='black', canvas_top=0):
+        """在 canvas 上绘制（虚线）矩形边框：按尺寸/样式缓存的边框模板直接贴到画布，canvas_top 为画布起始行"""
+        paste_border(canvas, canvas_top, rect, 0, dash_pattern, width, color)
 
-        x1, y1 = start
-        x2, y2 = end
-        dx = x2 - x1
-        dy = y2 - y1
-        length = math.hypot(dx, dy)
-        if length == 0:
-            return
-
-        ux = dx / length
-        uy = dy / length
-        dash_on, dash_off = dash_pattern[:2] if len(dash_pattern) >= 2 else (1, 1)
-        current_pos = 0
-        draw_on = True
-
-        while current_pos < length:
-            if draw_on:
-                segment_length = min(dash_on, length - current_pos)
-                seg_end_x = x1 + ux * (current_pos + segment_length)
-                seg_end_y = y1 + uy * (current_pos + segment_length)
-                draw.line([(x1 + ux * current_pos, y1 + uy * current_pos), (seg_end_x, seg_end_y)], fill=color,
-                          width=width)
-                current_pos += segment_length
-            else:
-                current_pos += dash_off
-                draw_on = not draw_on
-
-    def draw_dashed_rectangle_manual(self, draw, rect, dash_pattern, width=2, color='black'):
-        x1, y1, x2, y2 = rect
-        self.draw_dashed_line_manual(draw, (x1, y1), (x2, y1), dash_pattern, width, color)
-        self.draw_dashed_line_manual(draw, (x2, y1), (x2, y2), dash_pattern, width, color)
-        self.draw_dashed_line_manual(draw, (x2, y2), (x1, y2), dash_pattern, width, color)
-        self.draw_dashed_line_manual(draw, (x1, y2), (x1, y1), dash_pattern, width, color)
-
-    def draw_dashed_rounded_rectangle_manual(self, draw, rect, radius, dash_pattern, width=2, color='black'):
-        x1, y1, x2, y2 = rect
-        r = min(radius, (x2 - x1) // 2, (y2 - y1) // 2)
-        draw.arc([x1, y1, x1 + 2 * r, y1 + 2 * r], 180, 270, fill=color, width=width)
-        draw.arc([x2 - 2 * r, y1, x2, y1 + 2 * r], 270, 0, fill=color, width=width)
-        draw.arc([x2 - 2 * r, y2 - 2 * r, x2, y2], 0, 90, fill=color, width=width)
-        draw.arc([x1, y2 - 2 * r, x1 + 2 * r, y2], 90, 180, fill=color, width=width)
-        self.draw_dashed_line_manual(draw, (x1 + r, y1), (x2 - r, y1), dash_pattern, width, color)
-        self.draw_dashed_line_manual(draw, (x2, y1 + r), (x2, y2 - r), dash_pattern, width, color)
-        self.draw_dashed_line_manual(draw, (x2 - r, y2), (x1 + r, y2), dash_pattern, width, color)
-        self.draw_dashed_line_manual(draw, (x1, y2 - r), (x1, y1 + r), dash_pattern, width, color)
+    def draw_dashed_rounded_rectangle_manual(self, canvas, rect, radius, dash_pattern, width=2, color='black',
+                                             canvas_top=0):
+        """在 canvas 上绘制（虚线）圆角矩形边框，同 draw_dashed_rectangle_manual"""
+        paste_border(canvas, canvas_top, rect, radius, dash_pattern, width, color)
 
     def crop_center_square(self, img):
         width, height = img.size
@@ -407,6 +626,19 @@ class ImageConcatNode:
         bottom = (height + square_size) / 2
         return img.crop((left, top, right, bottom))
 
+    def get_image_save_params(self, format_name):
+        """根据格式名称返回 (PIL 格式, 扩展名, save 参数)"""
+        if format_name == "PNG (fast)":
+            return "PNG", ".png", {"compress_level": 1}
+        elif format_name == "JPEG (quality 95)":
+            return "JPEG", ".jpg", {"quality": 95}
+        elif format_name == "WebP (lossless)":
+            return "WEBP", ".webp", {"lossless": True, "exact": True}
+        elif format_name == "WebP (quality 90)":
+            return "WEBP", ".webp", {"quality": 90}
+        else:
+            return "PNG", ".png", {"compress_level": 6}
+
     def get_background_config(self, background_style):
         if background_style == "Light (white)":
             return (255, 255, 255), 'RGB'
@@ -424,22 +656,106 @@ class ImageConcatNode:
             return 'black'
 
     def get_font(self, font_size):
-        try:
-            if os.name == 'nt':
-                font = ImageFont.truetype("simhei.ttf", font_size)
-            else:
-                font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", font_size)
-        except:
-            font = ImageFont.load_default(size=font_size)
-        return font
+        """标签字体：字体文件只查找一次，字体对象按 (字体文件, 字号) 进程级缓存"""
+        return get_label_font(font_size)
 
     def load_image_any_source(self, filename):
-        """智能加载图像：优先从缓存（输入图像）加载，否则从磁盘加载"""
+        """智能加载图像：输入图像按需把对应帧转为 PIL，否则从磁盘加载"""
         if self.use_input_images:
-            return self.image_cache.get(filename)
+            return frame_to_pil(self.input_frames[self.input_index[filename]])
         else:
             return Image.open(os.path.join(self.image_dir_full, filename))
 
+    def get_decode_mode(self, img):
+        """透明背景下保留源图自带的透明度（RGBA），其余情况统一转为 RGB"""
+        if self.keep_alpha and (img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info):
+            return 'RGBA'
+        return 'RGB'
+
+    def decode_image_any_source(self, filename, min_size=None):
+        """解码一张源图并转为 RGB/RGBA（文件句柄随即关闭），由 image_store 保证每次运行只解码一次。
+
+        给出 min_size 时按“不小于 min_size 的最小尺寸”解码：JPEG 用 draft 在 DCT 域按 1/2~1/8 缩小解码，
+        其余格式解码后用整数倍 reduce 缩小，最后再由调用方做高质量 LANCZOS 缩放。
+        """
+        start = time.perf_counter()
+        img = self.load_image_any_source(filename)
+        if self.use_input_images:
+            img_rgb = img.convert(self.get_decode_mode(img))
+        else:
+            with img:
+                if min_size is not None:
+                    img.draft(img.mode, min_size)
+                img_rgb = img.convert(self.get_decode_mode(img))
+            if min_size is not None:
+                factor = min(img_rgb.width // min_size[0], img_rgb.height // min_size[1])
+                if factor >= 2:
+                    img_rgb = img_rgb.reduce(factor)
+        self.profile.add("decoding", time.perf_counter() - start, img_rgb.width * img_rgb.height * len(img_rgb.mode))
+        return img_rgb
+
+    @staticmethod
+    def get_tile_scale(img_size, tile):
+        """源图（裁剪后）缩放到图块的比例"""
+        orig_w, orig_h = img_size
+        if tile.crop:
+            return max(tile.img_w, tile.img_h) / min(orig_w, orig_h)
+        return max(tile.img_w / orig_w, tile.img_h / orig_h)
+
+    def get_decode_min_size(self, filename, tile):
+        """源图至少需要解码到的尺寸，保证（裁剪后）缩放输入不小于目标图块；无需缩小时返回 None"""
+        img_size = self.get_image_size(filename)
+        if img_size is None or min(img_size) <= 0:
+            return None
+        orig_w, orig_h = img_size
+        scale = self.get_tile_scale(img_size, tile)
+        if scale >= 0.5:
+            return None
+        return max(1, math.ceil(orig_w * scale)), max(1, math.ceil(orig_h * scale))
+
+    def build_memory_governor(self, plan, background_style, save_mode, stream_output, stream_assembles_pages,
+                              tensor_render, title_writer_pending):
+        """统计规划中源图的最大解码字节数（整图 / 按 a19 缩小解码后驻留）与最大单图尺寸，构造内存预算估算器"""
+        _, img_mode = self.get_background_config(background_style)
+        decode_channels = 4 if self.keep_alpha else 3
+        # 输入帧解码时先有一份 float32 的 *255 中间数组
+        decode_bytes_per_px = decode_channels * 4 if self.use_input_images else decode_channels
+        source_full_bytes = source_resident_bytes = title_px = 0
+        for page_idx in range(plan.page_count):
+            for tile in plan.iter_page_tiles(page_idx):
+                title_px = max(title_px, tile.tile_w * tile.tile_h, tile.img_w * tile.img_h)
+                filename = plan.image_files[tile.file_idx]
+                img_size = self.get_image_size(filename)
+                if img_size is None:
+                    continue
+                full_px = img_size[0] * img_size[1]
+                resident_px = full_px
+                min_size = self.get_decode_min_size(filename, tile) if self.fast_decode else None
+                if min_size is not None and not self.use_input_images:
+                    # draft / reduce 之后两边都小于 min_size 的 2 倍
+                    resident_px = min(full_px, 4 * min_size[0] * min_size[1])
+                source_full_bytes = max(source_full_bytes, full_px * decode_bytes_per_px)
+                source_resident_bytes = max(source_resident_bytes, resident_px * decode_channels)
+        return MemoryGovernor(plan, len(img_mode), source_full_bytes, source_resident_bytes,
+                              title_px * len(img_mode), save_mode != "none", stream_output, stream_assembles_pages,
+                              tensor_render, title_writer_pending)
+
+    def get_image_size(self, filename):
+        """只读取图像宽高：输入图像取张量形状，文件夹图像走尺寸索引（仅解析文件头，不解码像素）"""
+        if self.use_input_images:
+            if filename not in self.input_index:
+                return None
+            return int(self.input_frames.shape[2]), int(self.input_frames.shape[1])
+        size = self.image_sizes.get(filename)
+        if size is None:
+            with self.profile.phase("probing"):
+                info = self.dim_index.lookup(filename)
+            if info is None:
+                return None
+            # 同一次运行内规划、解码尺寸与内存估算都会用到，每个文件只查一次
+            size = self.image_sizes[filename] = info[:2]
+        return size
+
     def save_single_title(self, img_resized, title_border, title_border_style,
                           save_dir, filename, add_filename, filename_color, save_mode, save_filename_mode,
                           page_num, idx, global_idx, w_title, h_title, border_width=2,
@@ -462,22 +778,25 @@ class ImageConcatNode:
             save_name = f"p{page_num}_{idx + 1}.png"
         else:
             save_name = filename
+        if self.title_save_params[0] != "PNG":
+            save_name = os.path.splitext(save_name)[0] + self.title_save_params[1]
 
         save_path = os.path.join(save_dir, save_name)
+        if os.path.dirname(save_name):
+            # 递归扫描时源文件名带子目录，保存时保持同样的目录结构
+            os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
         if save_mode == "image":
             canvas_w = img_resized.width
             canvas_h = img_resized.height
             title_canvas = Image.new(img_mode, (canvas_w, canvas_h), color=bg_color)
-            title_canvas.paste(img_resized, (0, 0))
+            self.paste_tile_image(title_canvas, img_resized, (0, 0))
 
             if effective_add_filename != "none" and filename:
-                draw = ImageDraw.Draw(title_canvas)
                 font_size = int(min(canvas_w, canvas_h) * 0.05)
-                font = self.get_font(max(font_size, 10))
-                text_bbox = draw.textbbox((0, 0), draw_name, font=font)
-                text_w = text_bbox[2] - text_bbox[0]
-                text_h = text_bbox[3] - text_bbox[1]
+                label = label_sprites.get(draw_name, max(font_size, 10), filename_color)
+                text_w = label.width
+                text_h = label.height
 
                 text_x = (canvas_w - text_w) // 2
                 gap = 8
@@ -491,45 +810,37 @@ class ImageConcatNode:
                 else:
                     text_y = 0
 
-                draw.text((text_x, text_y), draw_name, fill=filename_color, font=font)
+                label.paste_onto(title_canvas, (text_x, text_y))
 
             if title_border != "None":
-                draw = ImageDraw.Draw(title_canvas)
                 dash_pattern = self.get_dash_pattern(title_border_style)
                 border_rect = [0, 0, canvas_w, canvas_h]
 
                 if "Rounded" in title_border:
                     radius = 10 if "10" in title_border else 20
                     self.draw_dashed_rounded_rectangle_manual(
-                        draw, border_rect, radius, dash_pattern,
+                        title_canvas, border_rect, radius, dash_pattern,
                         border_width, color=border_color
                     )
                 else:
                     self.draw_dashed_rectangle_manual(
-                        draw, border_rect, dash_pattern,
+                        title_canvas, border_rect, dash_pattern,
                         border_width, color=border_color
                     )
-            title_canvas.save(save_path, 'PNG', quality=100, pnginfo=None, optimize=False)
+            self.write_title(title_canvas, save_path)
             return
 
         title_canvas = Image.new(img_mode, (int(w_title), int(h_title)), color=bg_color)
         img_x = (int(w_title) - img_resized.width) // 2
         img_y = (int(h_title) - img_resized.height) // 2
 
-        if img_resized.mode == 'RGB' and img_mode == 'RGBA':
-            img_resized = img_resized.convert('RGBA')
-            img_resized.putalpha(Image.new('L', img_resized.size, 255))
-
-        mask = img_resized.split()[-1] if img_mode == 'RGBA' else None
-        title_canvas.paste(img_resized, (img_x, img_y), mask=mask)
+        self.paste_tile_image(title_canvas, img_resized, (img_x, img_y))
 
         if effective_add_filename != "none" and filename:
-            draw = ImageDraw.Draw(title_canvas)
             font_size = int(min(w_title, h_title) * 0.05)
-            font = self.get_font(font_size)
-            text_bbox = draw.textbbox((0, 0), draw_name, font=font)
-            text_w = text_bbox[2] - text_bbox[0]
-            text_h = text_bbox[3] - text_bbox[1]
+            label = label_sprites.get(draw_name, font_size, filename_color)
+            text_w = label.width
+            text_h = label.height
 
             text_x = (int(w_title) - text_w) // 2
             gap = 8
@@ -543,37 +854,49 @@ class ImageConcatNode:
             else:
                 text_y = 0
 
-            draw.text((text_x, text_y), draw_name, fill=filename_color, font=font)
+            label.paste_onto(title_canvas, (text_x, text_y))
 
         if title_border != "None":
-            draw = ImageDraw.Draw(title_canvas)
             dash_pattern = self.get_dash_pattern(title_border_style)
             border_rect = [0, 0, int(w_title), int(h_title)]
 
             if "Rounded" in title_border:
                 radius = 10 if "10" in title_border else 20
                 self.draw_dashed_rounded_rectangle_manual(
-                    draw, border_rect, radius, dash_pattern,
+                    title_canvas, border_rect, radius, dash_pattern,
                     border_width, color=border_color
                 )
             else:
                 self.draw_dashed_rectangle_manual(
-                    draw, border_rect, dash_pattern,
+                    title_canvas, border_rect, dash_pattern,
                     border_width, color=border_color
                 )
-        title_canvas.save(save_path, 'PNG', quality=100, pnginfo=None, optimize=False)
+        self.write_title(title_canvas, save_path)
+
+    def paste_tile_image(self, canvas, img_resized, xy):
+        """把缩放后的图块合成到画布：不透明图块直接粘贴（RGB 粘贴到 RGBA 画布时 alpha 即为 255，无需蒙版），
+
+        只有保留了源图透明度且确有半透明像素的图块才按 alpha 合成。
+        """
+        with self.profile.phase("compositing"):
+            if img_resized.mode == 'RGBA' and canvas.mode == 'RGBA' and img_resized.getextrema()[3][0] < 255:
+                canvas.alpha_composite(img_resized, xy)
+            else:
+                canvas.paste(img_resized, xy)
+
+    def write_title(self, title_canvas, save_path):
+        """单图保存：交给后台写入线程池编码写盘（未启用线程池时同步保存）"""
+        if self.title_writer is not None:
+            self.title_writer.submit(title_canvas, save_path)
+        else:
+            save_image(title_canvas, save_path, self.title_save_params)
 
     def calc_vertical_title_groups_a4_1(self, image_files, width_page_use, height_page_use, padding, a7_mode, a8_mode):
         if not image_files:
             return []
 
-        # --- 修改：使用新加载器 ---
-        try:
-            img = self.load_image_any_source(image_files[0])
-            first_w, first_h = img.size
-        except:
-            first_w, first_h = 100, 100
-        # ------------------------
+        first_size = self.get_image_size(image_files[0])
+        first_w, first_h = first_size if first_size is not None else (100, 100)
 
         if first_w <= 0 or first_h <= 0:
             first_w, first_h = 100, 100
@@ -589,23 +912,14 @@ class ImageConcatNode:
             global_meta = {'type': 'square', 'size': int(title_size), 'layout': 'vertical'}
 
         elif a8_mode == "5.equal title width up_down":
-            base_w = min(width_page_use, first_w)
+            # 首图按基准宽换算的高度不超过可用高度的最大基准宽
             h_limit = height_page_use - (2 * padding if has_outer_padding else 0)
-            while base_w > 0:
-                calc_h = int(base_w * (first_h / first_w)) if first_w > 0 else 100
-                if calc_h <= h_limit:
-                    break
-                base_w -= 10
+            base_w = solve_fit_length(min(width_page_use, first_w), first_w, first_h, h_limit)
             global_meta = {'type': 'fixed_width', 'width': int(base_w), 'layout': 'vertical'}
 
         elif a8_mode == "6.equal title height left_right":
-            base_h = min(height_page_use, first_h)
             w_limit = width_page_use - (2 * padding if has_outer_padding else 0)
-            while base_h > 0:
-                calc_w = int(base_h * (first_w / first_h)) if first_h > 0 else 100
-                if calc_w <= w_limit:
-                    break
-                base_h -= 10
+            base_h = solve_fit_length(min(height_page_use, first_h), first_h, first_w, w_limit)
             global_meta = {'type': 'fixed_height', 'height': int(base_h), 'layout': 'horizontal'}
 
         pages = []
@@ -629,13 +943,8 @@ class ImageConcatNode:
 
             while idx < len(image_files):
                 img_file = image_files[idx]
-                # --- 修改：使用新加载器 ---
-                try:
-                    img = self.load_image_any_source(img_file)
-                    cur_w, cur_h = img.size
-                except:
-                    cur_w, cur_h = 100, 100
-                # ------------------------
+                cur_size = self.get_image_size(img_file)
+                cur_w, cur_h = cur_size if cur_size is not None else (100, 100)
 
                 if cur_w <= 0 or cur_h <= 0:
                     cur_w, cur_h = 100, 100
@@ -691,10 +1000,10 @@ class ImageConcatNode:
         if init_base_h > limit_height:
             unified_base_w = int(limit_height * img_ratio)
             unified_base_w = min(unified_base_w, limit_width)
-            print(
-                f"[✅n=1反推生效] 首图高度超限 {init_base_h} > {limit_height} → 本页统一基准宽锁定: {unified_base_w}px")
+            logger.debug("[✅n=1反推生效] 首图高度超限 %s > %s → 本页统一基准宽锁定: %spx", init_base_h, limit_height,
+                         unified_base_w)
         else:
-            print(f"[✅n=1合规生效] 首图尺寸合规 → 本页统一基准宽锁定: {unified_base_w}px")
+            logger.debug("[✅n=1合规生效] 首图尺寸合规 → 本页统一基准宽锁定: %spx", unified_base_w)
 
         return unified_base_w
 
@@ -703,14 +1012,8 @@ class ImageConcatNode:
         h_diff_title_size = []
         img_wh_list = []
         for img_file in image_files:
-            # --- 修改：使用新加载器 ---
-            try:
-                img = self.load_image_any_source(img_file).convert('RGB')
-                img_wh_list.append((img.width, img.height))
-            except Exception as e:
-                print(f"[Error] Read img {img_file} failed: {e}")
-                img_wh_list.append((w_title_size_int, w_title_size_int))
-            # ------------------------
+            img_size = self.get_image_size(img_file)
+            img_wh_list.append(img_size if img_size is not None else (w_title_size_int, w_title_size_int))
 
         title_groups = []
         h_title_group_size = []
@@ -757,8 +1060,11 @@ class ImageConcatNode:
             group_h = sum(h_diff_title_size[i] for i in current_group) + (n - 1) * padding
             h_title_group_size.append(group_h)
 
-        print(f"[✅等宽模式] 生成 {len(title_groups)} 个纵向块组 | 组高度(精准公式): {h_title_group_size}")
-        return h_diff_title_size, h_title_group_size, title_groups, current_page_lock_w if n_per_row == 1 else w_title_size_int
+        # 组高度列表只在 verbose 时格式化
+        logger.debug("[✅等宽模式] 生成 %d 个纵向块组 | 组高度(精准公式): %s", len(title_groups), h_title_group_size)
+        group_lookup = build_group_lookup(title_groups, h_diff_title_size, padding)
+        return (h_diff_title_size, h_title_group_size, title_groups,
+                current_page_lock_w if n_per_row == 1 else w_title_size_int, group_lookup)
 
     def calc_h_each_row(self, height_page_use, padding, title_first_position, n_per_queue):
         h_each_row_guess = 0
@@ -767,7 +1073,7 @@ class ImageConcatNode:
         else:
             h_each_row_guess = int((height_page_use - (n_per_queue + 1) * padding) / n_per_queue)
         h_each_row = max(h_each_row_guess, 20)
-        print(f"[✅等高模式行高计算完成] a7={title_first_position} | 最终行高 h_each_row = {h_each_row} px")
+        logger.debug("[✅等高模式行高计算完成] a7=%s | 最终行高 h_each_row = %s px", title_first_position, h_each_row)
         return h_each_row
 
     def calc_horizontal_row_groups(self, image_files, width_page_use, height_page_use, padding, title_first_position,
@@ -775,14 +1081,8 @@ class ImageConcatNode:
         w_diff_title_size = []
         img_wh_list = []
         for img_file in image_files:
-            # --- 修改：使用新加载器 ---
-            try:
-                img = self.load_image_any_source(img_file).convert('RGB')
-                img_wh_list.append((img.width, img.height))
-            except Exception as e:
-                print(f"[Error] Read img {img_file} failed: {e}")
-                img_wh_list.append((h_title_size_int, h_title_size_int))
-            # ------------------------
+            img_size = self.get_image_size(img_file)
+            img_wh_list.append(img_size if img_size is not None else (h_title_size_int, h_title_size_int))
 
         h_each_row = self.calc_h_each_row(height_page_use, padding, title_first_position, n_per_row)
 
@@ -835,20 +1135,18 @@ class ImageConcatNode:
                 page_h = len(page_rows) * h_each_row + (len(page_rows) + 1) * padding
             page_total_occupy_h.append(page_h)
 
-        print(
-            f"[✅等高模式] 生成 {len(row_groups)} 个横向行组 | 分页后总页数: {len(page_row_mapping)} | 行宽度列表: {w_row_group_size}")
-        return w_diff_title_size, w_row_group_size, row_groups, page_row_mapping, page_total_occupy_h, h_each_row
-
-    def create_single_concat_page(self, image_files_page, width_page, height_page, n_per_row, n_per_col_int,
-                                  margin, padding, title_first_position,
-                                  w_title_size, h_title_size, draw_mode, title_border, title_border_style,
-                                  page_border, page_border_style, page_num,
-                                  save_mode, titles_save_dir, save_filename_mode, global_start_idx,
-                                  background_style, vertical_offset_mode,
-                                  image_count_in_dir, current_page_group_count=0, page_total_occupy_h=0,
-                                  add_filename="none", page_meta=None, filename_color="black"):
+        logger.debug("[✅等高模式] 生成 %d 个横向行组 | 分页后总页数: %d | 行宽度列表: %s", len(row_groups),
+                     len(page_row_mapping), w_row_group_size)
+        row_lookup = build_group_lookup(row_groups, w_diff_title_size, padding)
+        return (w_diff_title_size, w_row_group_size, row_groups, page_row_mapping, page_total_occupy_h, h_each_row,
+                row_lookup)
+
+    def plan_single_page(self, image_files_page, global_start_idx, width_page, height_page, n_per_row,
+                         n_per_col_int, margin, padding, title_first_position, w_title_size, h_title_size,
+                         draw_mode, page_num, vertical_offset_mode, image_count_in_dir,
+                         current_page_group_count=0, page_meta=None):
+        """计算单页内每个图块的位置与尺寸（只用图像宽高，不解码像素），返回 TILE_DTYPE 记录元组列表"""
         width_page_int = int(round(width_page))
-        height_page_int = int(round(height_page))
         w_title_size_int = int(round(w_title_size))
         h_title_size_int = int(round(h_title_size))
 
@@ -876,19 +1174,12 @@ class ImageConcatNode:
                              "3.zoom by long side (recommended)", "4.crop square by short side"]:
                 w_title_size_int = h_title_size_int = int(w_title_size)
 
-        bg_color, img_mode = self.get_background_config(background_style)
-        border_color = self.get_border_color(background_style)
-
-        concat = Image.new(img_mode, (width_page_int, height_page_int), color=bg_color)
-        draw = ImageDraw.Draw(concat)
-
-        dash_title = self.get_dash_pattern(title_border_style)
-        dash_page = self.get_dash_pattern(page_border_style)
-
         height_page_use = height_page - 2 * margin
         width_page_use = width_page - 2 * margin
 
-        filename_draw_info = []
+        # 读取失败的图片不占位，也不推进游标（与逐张解码时的行为一致）
+        img_sizes = [self.get_image_size(img_file) for img_file in image_files_page]
+        tiles = []
 
         if is_a4_equals_1:
             is_horizontal_layout = (page_meta.get('layout') == 'horizontal')
@@ -896,15 +1187,9 @@ class ImageConcatNode:
             if is_horizontal_layout:
                 # Mode 6: Horizontal
                 dims = []
-                for img_file in image_files_page:
-                    # --- 修改：使用新加载器 ---
-                    try:
-                        img = self.load_image_any_source(img_file)
-                        orig_w, orig_h = img.size
-                        if orig_w <= 0 or orig_h <= 0: orig_w, orig_h = 100, 100
-                    except:
-                        orig_w, orig_h = 100, 100
-                    # ------------------------
+                for img_size in img_sizes:
+                    orig_w, orig_h = img_size if img_size is not None else (100, 100)
+                    if orig_w <= 0 or orig_h <= 0: orig_w, orig_h = 100, 100
                     ratio = orig_w / orig_h if orig_h > 0 else 1
                     dw = int(h_title_size_int * ratio)
                     dims.append(dw)
@@ -923,91 +1208,30 @@ class ImageConcatNode:
                 cursor_x = margin + x_offset
                 cursor_y = margin + y_offset
 
-                for idx, img_file in enumerate(image_files_page):
-                    dw = dims[idx]
-                    current_global_idx = global_start_idx + idx
-                    # --- 修改：使用新加载器 ---
-                    try:
-                        img = self.load_image_any_source(img_file).convert('RGB')
-                        orig_w, orig_h = img.size
-                        if orig_w <= 0 or orig_h <= 0: orig_w, orig_h = 100, 100
-
-                        dh = h_title_size_int
-                        ratio = orig_w / orig_h if orig_h > 0 else 1
-                        dw_calc = int(dh * ratio)
-
-                        img_resized = img.resize((dw_calc, dh), Image.Resampling.LANCZOS)
-
-                        title_x = cursor_x
-                        title_y = cursor_y
-                        if has_outer_padding:
-                            title_x += padding
-
-                        img_draw_x = title_x + (dw_calc - img_resized.width) // 2
-                        img_draw_y = title_y
-
-                        # Save Logic
-                        if save_mode != "none":
-                            self.save_single_title(img_resized, title_border, title_border_style,
-                                                   titles_save_dir, img_file, add_filename, filename_color,
-                                                   "title" if save_mode == "save single title" else "image",
-                                                   save_filename_mode, page_num, idx, current_global_idx,
-                                                   dw_calc, dh, background_style=background_style)
-
-                        if img_resized.mode == 'RGB' and img_mode == 'RGBA':
-                            img_resized = img_resized.convert('RGBA')
-                            img_resized.putalpha(Image.new('L', img_resized.size, 255))
-                        mask = img_resized.split()[-1] if img_mode == 'RGBA' else None
-                        concat.paste(img_resized, (int(img_draw_x), int(img_draw_y)), mask=mask)
-
-                        if title_border != "None":
-                            rect = [int(title_x), int(title_y), int(title_x + dw_calc), int(title_y + dh)]
-                            if "Rounded" in title_border:
-                                self.draw_dashed_rounded_rectangle_manual(draw, rect, 10, dash_title, 2, border_color)
-                            else:
-                                self.draw_dashed_rectangle_manual(draw, rect, dash_title, 2, border_color)
-
-                        # Filename Queue
-                        if add_filename != "none":
-                            text_color = filename_color
-
-                            font_size = int(min(dw_calc, dh) * 0.05)
-                            font = self.get_font(max(font_size, 10))
-                            text_bbox = draw.textbbox((0, 0), img_file, font=font)
-                            text_w = text_bbox[2] - text_bbox[0]
-                            text_h = text_bbox[3] - text_bbox[1]
-                            text_x = title_x + (dw_calc - text_w) // 2
-                            gap = 8
-                            if add_filename == "above":
-                                text_y = title_y - text_h - gap
-                            elif add_filename == "top":
-                                text_y = img_draw_y + gap
-                            elif add_filename == "middle":
-                                text_y = img_draw_y + (dh - text_h) // 2
-                            elif add_filename == "bottom":
-                                text_y = img_draw_y + dh - text_h - gap
-                            elif add_filename == "below":
-                                text_y = title_y + dh + gap
-                            filename_draw_info.append({'xy': (text_x, text_y),
-                                                       'rect': [text_x - 5, text_y - 2, text_x + text_w + 5,
-                                                                text_y + text_h + 2], 'text': img_file, 'font': font,
-                                                       'fill': text_color, 'bg': None})
-
-                        cursor_x += dw_calc + padding
-                    except Exception as e:
-                        print(f"[Error] a4=1 mode6 draw {idx}: {e}")
+                for idx in range(len(image_files_page)):
+                    if img_sizes[idx] is None:
+                        continue
+                    dw_calc = dims[idx]
+                    dh = h_title_size_int
+
+                    title_x = cursor_x
+                    title_y = cursor_y
+                    if has_outer_padding:
+                        title_x += padding
+
+                    font_size = max(int(min(dw_calc, dh) * 0.05), 10)
+                    tiles.append((global_start_idx + idx, idx,
+                                  title_x, title_y, dw_calc, dh,
+                                  title_x, title_y, dw_calc, dh, 0,
+                                  title_x, dw_calc, title_y, title_y, dh, font_size))
+
+                    cursor_x += dw_calc + padding
             else:
                 # Mode 1-5: Vertical
                 dims = []
-                for img_file in image_files_page:
-                    # --- 修改：使用新加载器 ---
-                    try:
-                        img = self.load_image_any_source(img_file)
-                        orig_w, orig_h = img.size
-                        if orig_w <= 0 or orig_h <= 0: orig_w, orig_h = 100, 100
-                    except:
-                        orig_w, orig_h = 100, 100
-                    # ------------------------
+                for img_size in img_sizes:
+                    orig_w, orig_h = img_size if img_size is not None else (100, 100)
+                    if orig_w <= 0 or orig_h <= 0: orig_w, orig_h = 100, 100
 
                     if page_meta['type'] == 'square':
                         dh = w_title_size_int
@@ -1033,10 +1257,9 @@ class ImageConcatNode:
                 x_offset = int((width_page_use - content_w) / 2)
                 cursor_x_base = margin + x_offset
 
-                for idx, img_file in enumerate(image_files_page):
+                for idx in range(len(image_files_page)):
                     dh = dims[idx]
                     dw = w_title_size_int
-                    current_global_idx = global_start_idx + idx
 
                     title_x = cursor_x_base
                     title_y = cursor_y
@@ -1046,109 +1269,60 @@ class ImageConcatNode:
                     elif idx > 0:
                         title_y += padding
 
-                    # --- 修改：使用新加载器 ---
-                    try:
-                        img = self.load_image_any_source(img_file).convert('RGB')
-                        orig_w, orig_h = img.size
-                        if orig_w <= 0 or orig_h <= 0: orig_w, orig_h = 100, 100
-
-                        if page_meta['type'] == 'square':
-                            if draw_mode == "2.Stretches image to fill":
-                                img_resized = img.resize((dw, dh), Image.Resampling.LANCZOS)
-                            elif draw_mode == "1.smaller value filler":
-                                long_side = max(orig_w, orig_h)
-                                target_side = min(long_side, dw)
-                                scale = target_side / long_side
-                                new_w = int(orig_w * scale);
-                                new_h = int(orig_h * scale)
-                                img_resized = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-                            elif draw_mode == "3.zoom by long side (recommended)":
-                                long_side = max(orig_w, orig_h)
-                                scale = dw / long_side
-                                new_w = int(orig_w * scale);
-                                new_h = int(orig_h * scale)
-                                img_resized = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-                            elif draw_mode == "4.crop square by short side":
-                                img_sq = self.crop_center_square(img)
-                                img_resized = img_sq.resize((dw, dh), Image.Resampling.LANCZOS)
+                    if img_sizes[idx] is None:
+                        continue
+                    orig_w, orig_h = img_sizes[idx]
+                    if orig_w <= 0 or orig_h <= 0: orig_w, orig_h = 100, 100
+
+                    crop = 0
+                    if page_meta['type'] == 'square':
+                        if draw_mode == "2.Stretches image to fill":
+                            new_w, new_h = dw, dh
+                        elif draw_mode == "1.smaller value filler":
+                            long_side = max(orig_w, orig_h)
+                            target_side = min(long_side, dw)
+                            scale = target_side / long_side
+                            new_w = int(orig_w * scale);
+                            new_h = int(orig_h * scale)
+                        elif draw_mode == "3.zoom by long side (recommended)":
+                            long_side = max(orig_w, orig_h)
+                            scale = dw / long_side
+                            new_w = int(orig_w * scale);
+                            new_h = int(orig_h * scale)
+                        elif draw_mode == "4.crop square by short side":
+                            crop = 1
+                            new_w, new_h = dw, dh
                         else:
-                            img_resized = img.resize((dw, dh), Image.Resampling.LANCZOS)
-
-                        img_draw_x = title_x
-                        img_draw_y = title_y
-                        if page_meta['type'] == 'square':
-                            img_draw_x += (dw - img_resized.width) // 2
-                            img_draw_y += (dh - img_resized.height) // 2
-                        elif page_meta['type'] == 'fixed_width':
-                            img_draw_y += (dh - img_resized.height) // 2
-
-                        # Save Logic
-                        if save_mode != "none":
-                            self.save_single_title(img_resized, title_border, title_border_style,
-                                                   titles_save_dir, img_file, add_filename, filename_color,
-                                                   "title" if save_mode == "save single title" else "image",
-                                                   save_filename_mode, page_num, idx, current_global_idx,
-                                                   dw, dh, background_style=background_style)
-
-                        if img_resized.mode == 'RGB' and img_mode == 'RGBA':
-                            img_resized = img_resized.convert('RGBA')
-                            img_resized.putalpha(Image.new('L', img_resized.size, 255))
-                        mask = img_resized.split()[-1] if img_mode == 'RGBA' else None
-                        concat.paste(img_resized, (int(img_draw_x), int(img_draw_y)), mask=mask)
-
-                        if title_border != "None":
-                            if page_meta['type'] == 'square':
-                                rect = [int(title_x), int(title_y), int(title_x + dw), int(title_y + dh)]
-                            else:
-                                rect = [int(title_x), int(title_y), int(title_x + img_resized.width),
-                                        int(title_y + img_resized.height)]
-                            if "Rounded" in title_border:
-                                self.draw_dashed_rounded_rectangle_manual(draw, rect, 10, dash_title, 2, border_color)
-                            else:
-                                self.draw_dashed_rectangle_manual(draw, rect, dash_title, 2, border_color)
-
-                        # Filename Queue
-                        if add_filename != "none":
-                            text_color = filename_color
-
-                            ref_h = dh if page_meta['type'] == 'square' else img_resized.height
-                            ref_w = dw if page_meta['type'] == 'square' else img_resized.width
-                            font_size = int(min(ref_w, ref_h) * 0.05)
-                            font = self.get_font(max(font_size, 10))
-                            text_bbox = draw.textbbox((0, 0), img_file, font=font)
-                            text_w = text_bbox[2] - text_bbox[0]
-                            text_h = text_bbox[3] - text_bbox[1]
-                            text_x = title_x + (dw - text_w) // 2
-                            gap = 8
-                            if add_filename == "above":
-                                text_y = title_y - text_h - gap
-                            elif add_filename == "top":
-                                text_y = img_draw_y + gap
-                            elif add_filename == "middle":
-                                text_y = img_draw_y + (ref_h - text_h) // 2
-                            elif add_filename == "bottom":
-                                text_y = img_draw_y + ref_h - text_h - gap
-                            elif add_filename == "below":
-                                text_y = title_y + ref_h + gap
-                            filename_draw_info.append({'xy': (text_x, text_y),
-                                                       'rect': [text_x - 5, text_y - 2, text_x + text_w + 5,
-                                                                text_y + text_h + 2], 'text': img_file, 'font': font,
-                                                       'fill': text_color, 'bg': None})
-
-                        cursor_y = title_y + dh + padding
-                    except Exception as e:
-                        print(f"[Error] a4=1 draw {idx}: {e}")
+                            continue
+                    else:
+                        new_w, new_h = dw, dh
+
+                    img_draw_x = title_x
+                    img_draw_y = title_y
+                    if page_meta['type'] == 'square':
+                        img_draw_x += (dw - new_w) // 2
+                        img_draw_y += (dh - new_h) // 2
+                    elif page_meta['type'] == 'fixed_width':
+                        img_draw_y += (dh - new_h) // 2
+
+                    font_size = max(int(min(dw, dh) * 0.05), 10)
+                    tiles.append((global_start_idx + idx, idx,
+                                  title_x, title_y, dw, dh,
+                                  img_draw_x, img_draw_y, new_w, new_h, crop,
+                                  title_x, dw, title_y, img_draw_y, dh, font_size))
+
+                    cursor_y = title_y + dh + padding
         else:
             # ================= a4>1 (Multi-Column) Logic =================
             equal_width_mode = draw_mode == "5.equal title width up_down"
             equal_height_mode = draw_mode == "6.equal title height left_right"
-            h_diff_title_size = []
             h_title_group_size = []
             title_groups = []
+            group_lookup = {}
             page_lock_width = w_title_size_int
-            w_diff_title_size = []
             w_row_group_size = []
             row_groups = []
+            row_lookup = {}
             page_lock_height = h_title_size_int
             page_total_occupy_h_local = []
 
@@ -1165,7 +1339,6 @@ class ImageConcatNode:
 
             # Horizontal Centering Calc
             x_offset = 0
-            mod_int = image_count_in_dir % n_per_row
             if image_count_in_dir < n_per_row:
                 x_offset = int(
                     0.5 * (width_page_int - (image_count_in_dir - 1) * padding - image_count_in_dir * w_title_size_int))
@@ -1180,7 +1353,7 @@ class ImageConcatNode:
                 x_offset_last_row = center_offset_x
 
             if equal_width_mode:
-                h_diff_title_size, h_title_group_size, title_groups, page_lock_width = self.calc_vertical_title_groups(
+                _, h_title_group_size, title_groups, page_lock_width, group_lookup = self.calc_vertical_title_groups(
                     image_files_page, height_page_use, padding, title_first_position, w_title_size_int, n_per_row
                 )
                 if n_per_row == 1:
@@ -1191,7 +1364,7 @@ class ImageConcatNode:
                     center_offset_x = int((width_page_use - total_group_occupy_width) / 2)
 
             elif equal_height_mode:
-                w_diff_title_size, w_row_group_size, row_groups, _, page_total_occupy_h_local, page_lock_height = self.calc_horizontal_row_groups(
+                _, w_row_group_size, row_groups, _, page_total_occupy_h_local, page_lock_height, row_lookup = self.calc_horizontal_row_groups(
                     image_files_page, width_page_use, height_page_use, padding, title_first_position, h_title_size_int,
                     n_per_row
                 )
@@ -1204,307 +1377,125 @@ class ImageConcatNode:
                     total_h_current = page_total_occupy_h_local[0]
                     mode6_center_y = int((height_page_use - total_h_current) / 2)
 
-            # Drawing Loop
-            for idx, img_file in enumerate(image_files_page):
-                current_global_idx = global_start_idx + idx
-                # --- 修改：使用新加载器 ---
-                try:
-                    img = self.load_image_any_source(img_file).convert('RGB')
-                    img_org_w, img_org_h = img.size
-                    # ...
-                    # 保持原有逻辑
-                    canvas_x = 0
-                    canvas_y = 0
-                    resize_w = w_title_size_int
-                    resize_h = h_title_size_int
-                    img_x = 0
-                    img_y = 0
-                    canvas_x_int = 0
-                    canvas_y_int = 0
-
-                    if equal_width_mode and len(title_groups) > 0:
-                        group_idx = -1
-                        inner_idx = -1
-                        for g_idx, group in enumerate(title_groups):
-                            if idx in group:
-                                group_idx = g_idx
-                                inner_idx = group.index(idx)
-                                break
-                        if group_idx >= 0:
-                            add_offset = padding if title_first_position != "start_from margin" else 0
-                            canvas_x = margin + group_idx * (w_title_size_int + padding) + center_offset_x + add_offset
-                            group = title_groups[group_idx]
-                            inner_y = sum(
-                                h_diff_title_size[group[i]] + padding for i in range(inner_idx)) if inner_idx > 0 else 0
-                            if vertical_offset_mode:
-                                title_group_center_y = int(
-                                    margin + (height_page_use - h_title_group_size[group_idx]) / 2)
-                                canvas_y = title_group_center_y + inner_y + add_offset
-                            else:
-                                canvas_y = margin + inner_y + y_offset + add_offset
-
-                            current_h_title = h_diff_title_size[idx]
-                            resize_w = page_lock_width if n_per_row == 1 else w_title_size_int
-                            resize_h = current_h_title
-                            img_ratio = img_org_w / img_org_h
-                            resize_h = int(resize_w / img_ratio) if img_ratio != 0 else resize_w
-                            img_resized = img.resize((resize_w, resize_h), Image.Resampling.LANCZOS)
-                            img_x = int(canvas_x)
-                            img_y = int(canvas_y)
-                            canvas_x_int = img_x
-                            canvas_y_int = img_y
-
-                    elif equal_height_mode and len(row_groups) > 0:
-                        row_idx = -1
-                        inner_idx = -1
-                        for r_idx, row in enumerate(row_groups):
-                            if idx in row:
-                                row_idx = r_idx
-                                inner_idx = row.index(idx)
-                                break
-                        if row_idx >= 0:
-                            add_offset = padding if title_first_position != "start_from margin" else 0
-
-                            canvas_y = margin + mode6_center_y + row_idx * (page_lock_height + padding) + add_offset
-                            inner_x = sum(
-                                w_diff_title_size[row[i]] + padding for i in range(inner_idx)) if inner_idx > 0 else 0
-                            row_center_x = int((width_page_use - w_row_group_size[row_idx]) / 2)
-                            canvas_x = margin - add_offset + row_center_x + inner_x + center_offset_x + padding
-
-                            current_w_title = w_diff_title_size[idx]
-                            resize_w = current_w_title
-                            resize_h = page_lock_height
-                            img_ratio = img_org_w / img_org_h
-                            resize_w = int(resize_h * img_ratio) if img_ratio != 0 else resize_h
-                            img_resized = img.resize((resize_w, resize_h), Image.Resampling.LANCZOS)
-                            img_x = int(canvas_x)
-                            img_y = int(canvas_y)
-                            canvas_x_int = img_x
-                            canvas_y_int = img_y
-
+            # Placement Loop
+            for idx in range(len(image_files_page)):
+                if img_sizes[idx] is None:
+                    continue
+                img_org_w, img_org_h = img_sizes[idx]
+                canvas_x = 0
+                canvas_y = 0
+                resize_w = w_title_size_int
+                resize_h = h_title_size_int
+                crop = 0
+
+                if equal_width_mode and len(title_groups) > 0:
+                    if idx not in group_lookup:
+                        continue
+                    # 组号与组内偏移（前缀和）由查找表直接给出
+                    group_idx, _, inner_y = group_lookup[idx]
+                    add_offset = padding if title_first_position != "start_from margin" else 0
+                    canvas_x = margin + group_idx * (w_title_size_int + padding) + center_offset_x + add_offset
+                    if vertical_offset_mode:
+                        title_group_center_y = int(
+                            margin + (height_page_use - h_title_group_size[group_idx]) / 2)
+                        canvas_y = title_group_center_y + inner_y + add_offset
                     else:
-                        col = idx % n_per_row
-                        row = idx // n_per_row
-                        idx_total = idx + (page_num - 1) * n_per_row * n_per_col_int
-                        if title_first_position == "start_from margin":
-                            canvas_x = margin + col * (w_title_size_int + padding)
-                            canvas_y = margin + row * (w_title_size_int + padding) + y_offset
-                        elif title_first_position in ["start_from margin + padding",
-                                                      "start_from margin + padding(vertical centering)"]:
-                            canvas_x = margin + padding + col * (w_title_size_int + padding)
-                            canvas_y = margin + padding + row * (w_title_size_int + padding) + y_offset
-
-                        remaining_images = image_count_in_dir - idx_total
-                        is_last_row = remaining_images > 0 and remaining_images <= n_per_row
-                        is_incomplete_row = remaining_images > 0 and remaining_images < n_per_row
-
-                        if col == 0 and is_last_row and is_incomplete_row:
-                            total_row_width = remaining_images * w_title_size_int + (remaining_images - 1) * padding
-                            unused_width = width_page_use - total_row_width
-                            x_offset_last_row = unused_width // 2
-
-                        canvas_x_int = int(canvas_x) + x_offset + x_offset_last_row
-                        canvas_y_int = int(canvas_y)
-                        resize_w = w_title_size_int
-                        resize_h = w_title_size_int
-
-                        if draw_mode == "2.Stretches image to fill":
-                            img_resized = img.resize((resize_w, resize_h), Image.Resampling.LANCZOS)
-                            img_x, img_y = canvas_x_int, canvas_y_int
-                        elif draw_mode == "1.smaller value filler":
-                            ls = max(img.width, img.height)
-                            sb = min(ls, resize_w)
-                            s = sb / ls
-                            nw = int(img.width * s);
-                            nh = int(img.height * s)
-                            img_resized = img.resize((nw, nh), Image.Resampling.LANCZOS)
-                            img_x = canvas_x_int + (resize_w - nw) // 2
-                            img_y = canvas_y_int + (resize_h - nh) // 2
-                        elif draw_mode == "3.zoom by long side (recommended)":
-                            ls = max(img.width, img.height)
-                            s = resize_w / ls
-                            nw = int(img.width * s);
-                            nh = int(img.height * s)
-                            img_resized = img.resize((nw, nh), Image.Resampling.LANCZOS)
-                            img_x = canvas_x_int + (resize_w - nw) // 2
-                            img_y = canvas_y_int + (resize_h - nh) // 2
-                        elif draw_mode == "4.crop square by short side":
-                            img_sq = self.crop_center_square(img)
-                            img_resized = img_sq.resize((resize_w, resize_h), Image.Resampling.LANCZOS)
-                            img_x, img_y = canvas_x_int, canvas_y_int
-                        else:
-                            img_resized = img.resize((resize_w, resize_h), Image.Resampling.LANCZOS)
-                            img_x, img_y = canvas_x_int, canvas_y_int
-
-                    # Paste
-                    if save_mode != "none":
-                        self.save_single_title(img_resized, title_border, title_border_style,
-                                               titles_save_dir, img_file, add_filename, filename_color,
-                                               "title" if save_mode == "save single title" else "image",
-                                               save_filename_mode, page_num, idx, current_global_idx,
-                                               resize_w, resize_h, background_style=background_style)
-
-                    if img_resized.mode == 'RGB' and img_mode == 'RGBA':
-                        img_resized = img_resized.convert('RGBA')
-                        alpha_layer = Image.new('L', img_resized.size, 255)
-                        img_resized.putalpha(alpha_layer)
-
-                    mask = img_resized.split()[-1] if img_mode == 'RGBA' else None
-                    img_x = max(0, min(img_x, width_page_int - img_resized.width))
-                    concat.paste(img_resized, (img_x, img_y), mask=mask)
-
-                    # Border
-                    if title_border != "None":
-                        ref_w = resize_w if not (equal_width_mode or equal_height_mode) else (
-                            resize_w if equal_width_mode else w_diff_title_size[idx])
-                        ref_h = resize_h if not (equal_width_mode or equal_height_mode) else (
-                            resize_h if equal_width_mode else resize_h)
-
-                        bx = canvas_x_int
-                        by = canvas_y_int
-                        if equal_height_mode:
-                            bx = img_x
-
-                        rect = [bx, by, bx + ref_w, by + ref_h]
-                        if "Rounded" in title_border:
-                            self.draw_dashed_rounded_rectangle_manual(draw, rect, 10, dash_title, 2, border_color)
-                        else:
-                            self.draw_dashed_rectangle_manual(draw, rect, dash_title, 2, border_color)
-
-                    # Filename Queue
-                    if add_filename != "none":
-                        text_color = filename_color
-
-                        ref_w = resize_w
-                        if equal_height_mode:
-                            ref_w = img_resized.width
-
-                        ref_h = resize_h
-
-                        font_size = int(min(ref_w, ref_h) * 0.05)
-                        font = self.get_font(max(font_size, 10))
-                        text_bbox = draw.textbbox((0, 0), img_file, font=font)
-                        text_w = text_bbox[2] - text_bbox[0]
-                        text_h = text_bbox[3] - text_bbox[1]
-
-                        text_x = canvas_x_int + (ref_w - text_w) // 2
-
-                        gap = 8
-
-                        if add_filename == "above":
-                            text_y = canvas_y_int - text_h - gap
-                        elif add_filename == "top":
-                            text_y = canvas_y_int + gap
-                        elif add_filename == "middle":
-                            text_y = canvas_y_int + (resize_h - text_h) // 2
-                        elif add_filename == "bottom":
-                            text_y = canvas_y_int + resize_h - text_h - gap
-                        elif add_filename == "below":
-                            text_y = canvas_y_int + resize_h + gap
-                        filename_draw_info.append({'xy': (text_x, text_y),
-                                                   'rect': [text_x - 5, text_y - 2, text_x + text_w + 5,
-                                                            text_y + text_h + 2], 'text': img_file, 'font': font,
-                                                   'fill': text_color, 'bg': None})
-
-                except Exception as e:
-                    print(f"[Error] draw {idx}: {e}")
-
-        if page_border != "None":
-            full_rect = [margin, margin, width_page_int - margin, height_page_int - margin]
-            if "Rounded" in page_border:
-                self.draw_dashed_rounded_rectangle_manual(draw, full_rect, 10, dash_page, 2, border_color)
-            else:
-                self.draw_dashed_rectangle_manual(draw, full_rect, dash_page, 2, border_color)
-
-        # Draw Filename
-        for info in filename_draw_info:
-            if info['bg'] is not None:
-                draw.rectangle(info['rect'], fill=info['bg'])
-            draw.text(info['xy'], info['text'], font=info['font'], fill=info['fill'])
+                        canvas_y = margin + inner_y + y_offset + add_offset
+
+                    resize_w = page_lock_width if n_per_row == 1 else w_title_size_int
+                    img_ratio = img_org_w / img_org_h
+                    resize_h = int(resize_w / img_ratio) if img_ratio != 0 else resize_w
+                    new_w, new_h = resize_w, resize_h
+                    img_x = int(canvas_x)
+                    img_y = int(canvas_y)
+                    canvas_x_int = img_x
+                    canvas_y_int = img_y
+
+                elif equal_height_mode and len(row_groups) > 0:
+                    if idx not in row_lookup:
+                        continue
+                    row_idx, _, inner_x = row_lookup[idx]
+                    add_offset = padding if title_first_position != "start_from margin" else 0
+
+                    canvas_y = margin + mode6_center_y + row_idx * (page_lock_height + padding) + add_offset
+                    row_center_x = int((width_page_use - w_row_group_size[row_idx]) / 2)
+                    canvas_x = margin - add_offset + row_center_x + inner_x + center_offset_x + padding
+
+                    resize_h = page_lock_height
+                    img_ratio = img_org_w / img_org_h
+                    resize_w = int(resize_h * img_ratio) if img_ratio != 0 else resize_h
+                    new_w, new_h = resize_w, resize_h
+                    img_x = int(canvas_x)
+                    img_y = int(canvas_y)
+                    canvas_x_int = img_x
+                    canvas_y_int = img_y
 
-        if img_mode == 'RGBA':
-            concat_np = np.array(concat).astype(np.float32) / 255.0
-        else:
-            concat_np = np.array(concat).astype(np.float32) / 255.0
-            if len(concat_np.shape) == 2:
-                concat_np = np.repeat(np.expand_dims(concat_np, -1), 3, -1)
-        return concat_np
-
-    def generate_concat(self, a1_image_dir, a2_page_width, a3_page_aspect_ratio, a4_cols_rows_per_page, a5_page_margin,
-                        a6_title_padding,
-                        a8_title_first_position, a7_title_draw_mode, a10_title_border, a11_title_border_style,
-                        a12_page_border, a13_page_border_style, a97_title_save_mode, a98_title_save_dir,
-                        a99_title_save_filename,
-                        a9_background_style, a14_filename_position, a15_filename_color, a0_images=None):
-
-        self.image_dir_full = a1_image_dir
-        self.width_page_use_global = a2_page_width - 2 * a5_page_margin
-
-        filename_color_rgb = self.get_filename_color_by_name(a15_filename_color)
-
-        titles_final_path = ""
-        if a97_title_save_mode != "none":
-            mode_suffix = ""
-            if a97_title_save_mode == "save single title":
-                mode_suffix = "(1)"
-            elif a97_title_save_mode == "save single image":
-                mode_suffix = "(2)"
-
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            titles_final_path = os.path.join(a98_title_save_dir, f"concat_titles{mode_suffix}_{timestamp}").replace(
-                "\\", "/")
-            os.makedirs(titles_final_path, exist_ok=True)
-        else:
-            titles_final_path = "can't display `b5_title_save_path` due to `a97_title_save_mode` is 'none'"
-
-        # --- 新增：处理输入图像逻辑 ---
-        self.use_input_images = False
-        image_cache = {}
-
-        if a0_images is not None:
-            print(f"[✅ Detected input images batch. Batch size: {len(a0_images)}")
-            self.use_input_images = True
-            self.image_cache = {}
-
-            # 转换 Tensor -> PIL 列表
-            pil_images = []
-            for i in range(len(a0_images)):
-                # 提取单张图 -> 转换 -> 转 uint8 -> 转 PIL
-                img_tensor = a0_images[i]
-                i_np = img_tensor.cpu().numpy() * 255.0
-                i_np = i_np.clip(0, 255).astype(np.uint8)
-                pil_images.append(Image.fromarray(i_np))
-
-            # 生成虚拟文件名并存入缓存
-            image_files = [f"input_img_{i + 1:05d}.png" for i in range(len(pil_images))]
-            for name, pil_img in zip(image_files, pil_images):
-                self.image_cache[name] = pil_img
-
-            image_count_in_dir = len(image_files)
-            # 覆盖文件夹路径，防止后续逻辑报错（虽然输入模式下不检查路径）
-            self.image_dir_full = "Input_Stream"
-
-        elif os.path.exists(a1_image_dir):
-            # 原有逻辑：从文件夹读取
-            image_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp')
-            image_files = [f for f in os.listdir(a1_image_dir) if f.lower().endswith(image_extensions)]
-            image_count_in_dir = len(image_files)
-        else:
-            print(f"[Error] 图片文件夹不存在: {a1_image_dir} 且无输入图像")
-            error_img = np.zeros((1, 100, 100, 3), dtype=np.float32)
-            error_img[:, :, :, 0] = 1.0
-            return (torch.from_numpy(error_img), 0, "0×0", 0, titles_final_path, self.get_node_tips())
-
-        if image_count_in_dir == 0:
-            print("[Error] 无有效图片")
-            error_img = np.zeros((1, 100, 100, 3), dtype=np.float32)
-            error_img[:, :, :, 0] = 1.0
-            error_img[:, :, :, 1] = 1.0
-            return (torch.from_numpy(error_img), 0, "0×0", 0, titles_final_path, self.get_node_tips())
+                else:
+                    col = idx % n_per_row
+                    row = idx // n_per_row
+                    idx_total = idx + (page_num - 1) * n_per_row * n_per_col_int
+                    if title_first_position == "start_from margin":
+                        canvas_x = margin + col * (w_title_size_int + padding)
+                        canvas_y = margin + row * (w_title_size_int + padding) + y_offset
+                    elif title_first_position in ["start_from margin + padding",
+                                                  "start_from margin + padding(vertical centering)"]:
+                        canvas_x = margin + padding + col * (w_title_size_int + padding)
+                        canvas_y = margin + padding + row * (w_title_size_int + padding) + y_offset
+
+                    remaining_images = image_count_in_dir - idx_total
+                    is_last_row = remaining_images > 0 and remaining_images <= n_per_row
+                    is_incomplete_row = remaining_images > 0 and remaining_images < n_per_row
+
+                    if col == 0 and is_last_row and is_incomplete_row:
+                        total_row_width = remaining_images * w_title_size_int + (remaining_images - 1) * padding
+                        unused_width = width_page_use - total_row_width
+                        x_offset_last_row = unused_width // 2
+
+                    canvas_x_int = int(canvas_x) + x_offset + x_offset_last_row
+                    canvas_y_int = int(canvas_y)
+                    resize_w = w_title_size_int
+                    resize_h = w_title_size_int
+                    img_x, img_y = canvas_x_int, canvas_y_int
+                    new_w, new_h = resize_w, resize_h
+
+                    if draw_mode == "1.smaller value filler":
+                        ls = max(img_org_w, img_org_h)
+                        sb = min(ls, resize_w)
+                        s = sb / ls
+                        new_w = int(img_org_w * s);
+                        new_h = int(img_org_h * s)
+                        img_x = canvas_x_int + (resize_w - new_w) // 2
+                        img_y = canvas_y_int + (resize_h - new_h) // 2
+                    elif draw_mode == "3.zoom by long side (recommended)":
+                        ls = max(img_org_w, img_org_h)
+                        s = resize_w / ls
+                        new_w = int(img_org_w * s);
+                        new_h = int(img_org_h * s)
+                        img_x = canvas_x_int + (resize_w - new_w) // 2
+                        img_y = canvas_y_int + (resize_h - new_h) // 2
+                    elif draw_mode == "4.crop square by short side":
+                        crop = 1
+
+                img_x = max(0, min(img_x, width_page_int - new_w))
+
+                # 边框：等高模式按（夹紧后的）图像位置绘制，其余按块位置绘制
+                border_x = img_x if equal_height_mode else canvas_x_int
+                font_size = max(int(min(resize_w, resize_h) * 0.05), 10)
+                tiles.append((global_start_idx + idx, idx,
+                              border_x, canvas_y_int, resize_w, resize_h,
+                              img_x, img_y, new_w, new_h, crop,
+                              canvas_x_int, resize_w, canvas_y_int, canvas_y_int, resize_h, font_size))
+
+        return tiles
+
+    def plan_concat_layout(self, image_files, a2_page_width, a3_page_aspect_ratio, a4_cols_rows_per_page,
+                           a5_page_margin, a6_title_padding, a8_title_first_position, a7_title_draw_mode):
+        """布局规划阶段：由图片宽高与 a2~a8 参数算出分页和每个图块的位置，返回 LayoutPlan（不渲染）"""
+        image_count_in_dir = len(image_files)
 
         title_ratio = round(self.convert_ratio_to_float(a3_page_aspect_ratio), 2)
         height_page = int(a2_page_width / title_ratio)
-        print(f"[✅] 画布尺寸: {a2_page_width} × {height_page} | 宽高比: {a3_page_aspect_ratio}")
+        logger.info(f"[✅] 画布尺寸: {a2_page_width} × {height_page} | 宽高比: {a3_page_aspect_ratio}")
 
         width_page_use = a2_page_width - 2 * a5_page_margin
         height_page_use = height_page - 2 * a5_page_margin
@@ -1512,12 +1503,10 @@ class ImageConcatNode:
         is_a4_equals_1 = (a4_cols_rows_per_page == 1)
         is_start_from_margin = (a8_title_first_position == "start_from margin")
         has_outer_padding = (not is_start_from_margin)
-        is_vert_center = (a8_title_first_position == "start_from margin + padding(vertical centering)")
 
         equal_width_mode = a7_title_draw_mode == "5.equal title width up_down"
         equal_height_mode = a7_title_draw_mode == "6.equal title height left_right"
         page_group_count = {}
-        page_total_occupy_height = []
         page_image_mapping = {}
         page_data_list = []
         w_title_size = 100
@@ -1530,10 +1519,10 @@ class ImageConcatNode:
                 image_files, width_page_use, height_page_use,
                 a6_title_padding, a8_title_first_position, a7_title_draw_mode
             )
+            file_pos = {name: i for i, name in enumerate(image_files)}
             for i in range(len(page_data_list)):
                 page_group_count[i] = 1
-                page_total_occupy_height.append(height_page_use)
-                page_image_mapping[i] = page_data_list[i]['files']
+                page_image_mapping[i] = [file_pos[name] for name in page_data_list[i]['files']]
 
             m = page_data_list[0]['meta'] if page_data_list else {}
             if m.get('type') == 'square':
@@ -1578,7 +1567,7 @@ class ImageConcatNode:
             h_title_size = h_title_size_int
 
             if equal_width_mode:
-                _, _, all_title_groups, _ = self.calc_vertical_title_groups(image_files, height_page_use,
+                _, _, all_title_groups, _, _ = self.calc_vertical_title_groups(image_files, height_page_use,
                                                                             a6_title_padding,
                                                                             a8_title_first_position, w_title_size_int,
                                                                             a4_cols_rows_per_page)
@@ -1593,16 +1582,14 @@ class ImageConcatNode:
                     for g in page_groups: page_images.extend(g)
                     page_image_mapping[page_idx] = page_images
                     page_group_count[page_idx] = len(page_groups)
-                    page_total_occupy_height.append(height_page_use)
                 wh_per_title = f"equal title width = {w_title_size_int}"
             elif equal_height_mode:
-                w_diff_title_size, w_row_group_size, row_groups, page_row_mapping, page_total_occupy_height_calc, _ = self.calc_horizontal_row_groups(
+                _, _, _, page_row_mapping, _, _, _ = self.calc_horizontal_row_groups(
                     image_files, width_page_use, height_page_use, a6_title_padding, a8_title_first_position,
                     h_title_size_int,
                     a4_cols_rows_per_page
                 )
                 total_pages = len(page_row_mapping)
-                page_total_occupy_height = page_total_occupy_height_calc
                 for page_idx in range(total_pages):
                     page_rows = page_row_mapping[page_idx]
                     page_images = []
@@ -1611,81 +1598,741 @@ class ImageConcatNode:
                     page_group_count[page_idx] = len(page_rows)
                 wh_per_title = f"equal title height = {h_title_size_int}"
             else:
-                n_per_col = 1
-                for n in range(100, 0, -1):
-                    h_sum = n * h_title_size_int + (n - 1) * a6_title_padding
-                    if has_outer_padding:
-                        h_sum += (n + 1) * a6_title_padding
-                    if h_sum <= height_page_use:
-                        n_per_col = n
-                        break
-                if n_per_col == 0: n_per_col = 1
+                n_per_col = solve_rows_per_column(height_page_use, h_title_size_int, a6_title_padding,
+                                                  has_outer_padding)
                 n_per_col_actual = n_per_col
 
                 titles_per_page = a4_cols_rows_per_page * n_per_col
-                image_pages = [image_files[i:i + titles_per_page] for i in range(0, len(image_files), titles_per_page)]
-                total_pages = len(image_pages)
+                total_pages = (len(image_files) + titles_per_page - 1) // titles_per_page
                 for page_idx in range(total_pages):
-                    page_image_mapping[page_idx] = image_pages[page_idx]
+                    start = page_idx * titles_per_page
+                    page_image_mapping[page_idx] = list(range(start, min(start + titles_per_page, len(image_files))))
                     page_group_count[page_idx] = 1
-                    page_total_occupy_height.append(height_page_use)
 
                 wh_per_title = f"title width = {w_title_size_int}\nequal title height = {h_title_size_int}"
 
-        print(
+        logger.info(
             f"[✅分页信息] 模式: {a7_title_draw_mode} | 通用队列数: {a4_cols_rows_per_page} | 总页数: {len(page_image_mapping)} | 块尺寸: {wh_per_title}")
 
-        all_concats = []
         vertical_offset_mode = a8_title_first_position == "start_from margin + padding(vertical centering)"
 
+        n_per_col_arg = 1
+        if not equal_height_mode and not equal_width_mode:
+            n_per_col_arg = n_per_col_actual
+        elif equal_height_mode:
+            n_per_col_arg = 9999
+
+        page_tiles = []
+        global_start_idx = 0
         for page_idx in range(len(page_image_mapping)):
-            current_page_num = page_idx + 1
+            page_image_files = [image_files[idx] for idx in page_image_mapping[page_idx]]
+            page_tiles.append(self.plan_single_page(
+                page_image_files, global_start_idx, a2_page_width, height_page, a4_cols_rows_per_page,
+                n_per_col_arg,
+                a5_page_margin, a6_title_padding, a8_title_first_position,
+                w_title_size, h_title_size, a7_title_draw_mode, page_idx + 1,
+                vertical_offset_mode, image_count_in_dir,
+                current_page_group_count=page_group_count.get(page_idx, 1),
+                page_meta=page_data_list[page_idx]['meta'] if is_a4_equals_1 and page_idx < len(
+                    page_data_list) else None
+            ))
+            global_start_idx += len(page_image_mapping[page_idx])
+
+        return LayoutPlan(image_files, int(round(a2_page_width)), int(round(height_page)), a5_page_margin,
+                          wh_per_title, page_tiles)
+
+    def get_source_fingerprint(self, filename):
+        """源图指纹（每次运行每张图只计算一次）：文件取 (路径, 大小, mtime)，输入帧取像素哈希；失败返回 None"""
+        fingerprint = self.source_fingerprints.get(filename)
+        if fingerprint is None:
+            try:
+                if self.use_input_images:
+                    fingerprint = tensor_fingerprint(self.input_frames[self.input_index[filename]])
+                else:
+                    fingerprint = file_fingerprint(os.path.join(self.image_dir_full, filename))
+            except (OSError, KeyError):
+                return None
+            self.source_fingerprints[filename] = fingerprint
+        return fingerprint
+
+    def get_tile_cache_key(self, img_file, tile):
+        """缩放图块缓存的键：(源图指纹, 目标宽高, 裁剪, 解码方式, 保留透明度, 重采样方式)；缓存关闭或无法取指纹时返回 None"""
+        if resized_tiles.max_bytes <= 0:
+            return None
+        fingerprint = self.get_source_fingerprint(img_file)
+        if fingerprint is None:
+            return None
+        return (fingerprint, int(tile.img_w), int(tile.img_h), bool(tile.crop), self.fast_decode, self.keep_alpha,
+                self.resample)
+
+    def resize_tile_image(self, plan, tile):
+        """解码并缩放单个图块的源图（可在后台线程中执行）；结果进入进程级缓存，调用方不得修改返回的图像"""
+        img_file = plan.image_files[tile.file_idx]
+        cache_key = self.get_tile_cache_key(img_file, tile)
+        if cache_key is not None:
+            img_resized = resized_tiles.get(cache_key)
+            if img_resized is not None:
+                return img_resized
+
+        img = self.get_preview_proxy(img_file, tile) if self.use_preview_proxy else None
+        if img is None:
+            min_size = self.get_decode_min_size(img_file, tile) if self.fast_decode else None
+            img = self.image_store.get(img_file, min_size)
+        start = time.perf_counter()
+        if tile.crop:
+            img = self.crop_center_square(img)
+        img_resized = img.resize((tile.img_w, tile.img_h), self.resample, reducing_gap=self.reducing_gap)
+        self.profile.add("resizing", time.perf_counter() - start,
+                         img_resized.width * img_resized.height * len(img_resized.mode))
+        if cache_key is not None:
+            resized_tiles.put(cache_key, img_resized)
+        return img_resized
+
+    def get_preview_proxy(self, img_file, tile):
+        """代理预览的源图缩略图（长边不超过 PREVIEW_PROXY_SIDE），与布局无关，存入进程级缓存供后续预览复用。
+
+        缩略图小于图块所需尺寸或无法取得源图尺寸时返回 None，由调用方按正常方式解码。
+        """
+        img_size = self.get_image_size(img_file)
+        if img_size is None or min(img_size) <= 0:
+            return None
+        proxy_scale = min(1.0, PREVIEW_PROXY_SIDE / max(img_size))
+        if proxy_scale < self.get_tile_scale(img_size, tile):
+            return None
+        fingerprint = self.get_source_fingerprint(img_file) if resized_tiles.max_bytes > 0 else None
+        cache_key = (fingerprint, "proxy", PREVIEW_PROXY_SIDE, self.keep_alpha) if fingerprint is not None else None
+        if cache_key is not None:
+            proxy = resized_tiles.get(cache_key)
+            if proxy is not None:
+                return proxy
+        proxy_size = (max(1, round(img_size[0] * proxy_scale)), max(1, round(img_size[1] * proxy_scale)))
+        img = self.image_store.get(img_file, proxy_size)
+        with self.profile.phase("resizing"):
+            proxy = img.resize(proxy_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+        if cache_key is not None:
+            resized_tiles.put(cache_key, proxy)
+        return proxy
+
+    def iter_resized_tiles(self, plan, page_idx, tile_workers=1):
+        """按页内顺序产出 (tile, future)；tile_workers>1 时解码+缩放在线程池中并发执行，在途任务数有上限"""
+        if tile_workers <= 1:
+            for tile in plan.iter_page_tiles(page_idx):
+                future = Future()
+                try:
+                    future.set_result(self.resize_tile_image(plan, tile))
+                except Exception as e:
+                    future.set_exception(e)
+                yield tile, future
+            return
+
+        max_in_flight = tile_workers * 2
+        with ThreadPoolExecutor(max_workers=tile_workers) as executor:
+            pending = deque()
+            for tile in plan.iter_page_tiles(page_idx):
+                pending.append((tile, executor.submit(self.resize_tile_image, plan, tile)))
+                if len(pending) >= max_in_flight:
+                    yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+
+    def create_single_concat_page(self, plan, page_idx, title_border, title_border_style,
+                                  page_border, page_border_style,
+                                  save_mode, titles_save_dir, save_filename_mode,
+                                  background_style, add_filename="none", filename_color="black", tile_workers=1):
+        """按 LayoutPlan 渲染单页：解码、缩放、粘贴、边框与文件名，返回 PIL 页面"""
+        width_page_int = plan.page_width
+        height_page_int = plan.page_height
+        page_num = page_idx + 1
+
+        bg_color, img_mode = self.get_background_config(background_style)
+        border_color = self.get_border_color(background_style)
+
+        concat = Image.new(img_mode, (width_page_int, height_page_int), color=bg_color)
+
+        dash_title = self.get_dash_pattern(title_border_style)
+        dash_page = self.get_dash_pattern(page_border_style)
+
+        filename_draw_info = []
+
+        for tile, resize_job in self.iter_resized_tiles(plan, page_idx, tile_workers):
+            img_file = plan.image_files[tile.file_idx]
+            try:
+                img_resized = resize_job.result()
+
+                # Save Logic
+                if save_mode != "none":
+                    with self.profile.phase("title_saving"):
+                        self.save_single_title(img_resized, title_border, title_border_style,
+                                               titles_save_dir, img_file, add_filename, filename_color,
+                                               "title" if save_mode == "save single title" else "image",
+                                               save_filename_mode, page_num, tile.page_pos, tile.file_idx,
+                                               tile.tile_w, tile.tile_h, background_style=background_style)
+
+                self.paste_tile_image(concat, img_resized, (tile.img_x, tile.img_y))
+                self.image_store.release(img_file)
+
+                self.draw_tile_border(concat, 0, tile, title_border, dash_title, border_color)
+                self.queue_tile_filename(tile, img_file, add_filename, filename_color, filename_draw_info)
+
+            except Exception as e:
+                logger.error(f"[Error] draw {tile.page_pos}: {e}")
+
+        self.draw_page_border_and_filenames(concat, 0, plan, page_border, dash_page, border_color,
+                                            filename_draw_info)
+
+        return concat
+
+    def resize_tile_band(self, plan, tile, top, bottom, full_tiles):
+        """只缩放图块落在页面 [top, bottom) 行内的部分（resize 的 box 参数指定源图区域），无需整块缩放。
+
+        带透明度的源图例外：整块缩放一次存入 full_tiles（按 page_pos），各条带从中裁剪。
+        """
+        img_file = plan.image_files[tile.file_idx]
+        min_size = self.get_decode_min_size(img_file, tile) if self.fast_decode else None
+        img = self.image_store.get(img_file, min_size)
+        row_start = max(top, tile.img_y) - tile.img_y
+        row_end = min(bottom, tile.img_y + tile.img_h) - tile.img_y
+        if img.mode == 'RGBA':
+            # RGBA 按预乘 alpha 缩放，条带切片的 ±1 舍入差在低 alpha 处还原后会放大到几十级，必须与整块缩放一致
+            full_tile = full_tiles.get(tile.page_pos)
+            if full_tile is None:
+                full_tile = full_tiles[tile.page_pos] = self.resize_tile_image(plan, tile)
+            return full_tile.crop((0, row_start, tile.img_w, row_end))
+        if tile.crop:
+            # 先裁出正方形中本条带所需的行（含 LANCZOS 支撑范围），保证边缘像素与整块裁剪后缩放一致
+            left, upper, right, lower = center_square_box(img.width, img.height)
+            scale_y = (lower - upper) / tile.img_h
+            support = math.ceil(3 * max(scale_y, 1.0)) + 1
+            crop_top = max(upper, math.floor(upper + row_start * scale_y) - support)
+            crop_bottom = min(lower, math.ceil(upper + row_end * scale_y) + support)
+            img = img.crop((left, crop_top, right, crop_bottom))
+            box = (0, upper + row_start * scale_y - crop_top, img.width, upper + row_end * scale_y - crop_top)
+        else:
+            scale_y = img.height / tile.img_h
+            box = (0, row_start * scale_y, img.width, row_end * scale_y)
+        with self.profile.phase("resizing", tile.img_w * (row_end - row_start) * len(img.mode)):
+            return img.resize((tile.img_w, row_end - row_start), self.resample, box=box)
+
+    def create_single_concat_page_strips(self, plan, page_idx, page_sink, strip_height,
+                                         title_border, title_border_style, page_border, page_border_style,
+                                         save_mode, titles_save_dir, save_filename_mode,
+                                         background_style, add_filename="none", filename_color="black",
+                                         tile_workers=1):
+        """超大页面按水平条带渲染：每个条带只缩放/粘贴与之相交的图块部分，绘制边框与文件名后交给 page_sink，
+
+        整页画布从不分配，内存只与条带高度（及条带内图块的源图、透明源图的整块缩放结果）有关。
+        """
+        width_page_int = plan.page_width
+        height_page_int = plan.page_height
+        page_num = page_idx + 1
+
+        bg_color, img_mode = self.get_background_config(background_style)
+        border_color = self.get_border_color(background_style)
+        dash_title = self.get_dash_pattern(title_border_style)
+        dash_page = self.get_dash_pattern(page_border_style)
+
+        tiles = list(plan.iter_page_tiles(page_idx))
+        saved = set()
+        full_tiles = {}
+        filename_draw_info = None
+        page_sink.begin_page(page_idx, width_page_int, height_page_int, img_mode)
+        executor = ThreadPoolExecutor(max_workers=tile_workers) if tile_workers > 1 else None
+        try:
+            for top, bottom in iter_bands(height_page_int, strip_height):
+                band = Image.new(img_mode, (width_page_int, bottom - top), color=bg_color)
+
+                band_tiles = [tile for tile in tiles
+                              if (tile.img_y < bottom and tile.img_y + tile.img_h > top)
+                              or (tile.tile_y - 2 < bottom and tile.tile_y + tile.tile_h + 2 > top)]
+                image_tiles = [tile for tile in band_tiles if tile.img_y < bottom and tile.img_y + tile.img_h > top]
+                if executor is not None:
+                    jobs = {tile.page_pos: executor.submit(self.resize_tile_band, plan, tile, top, bottom, full_tiles)
+                            for tile in image_tiles}
+                else:
+                    jobs = {tile.page_pos: None for tile in image_tiles}
+
+                for tile in band_tiles:
+                    img_file = plan.image_files[tile.file_idx]
+                    try:
+                        if tile.page_pos in jobs:
+                            job = jobs[tile.page_pos]
+                            piece = job.result() if job is not None else self.resize_tile_band(plan, tile, top,
+                                                                                                bottom, full_tiles)
+                            # Save Logic：单图保存需要完整图块，在图块首次出现时整块缩放一次
+                            if save_mode != "none" and tile.page_pos not in saved:
+                                saved.add(tile.page_pos)
+                                full_tile = self.resize_tile_image(plan, tile)
+                                with self.profile.phase("title_saving"):
+                                    self.save_single_title(full_tile, title_border, title_border_style,
+                                                           titles_save_dir, img_file, add_filename, filename_color,
+                                                           "title" if save_mode == "save single title" else "image",
+                                                           save_filename_mode, page_num, tile.page_pos,
+                                                           tile.file_idx, tile.tile_w, tile.tile_h,
+                                                           background_style=background_style)
+
+                            self.paste_tile_image(band, piece, (tile.img_x, max(tile.img_y, top) - top))
+                            if tile.img_y + tile.img_h <= bottom:
+                                self.image_store.release(img_file)
+                                full_tiles.pop(tile.page_pos, None)
+
+                        self.draw_tile_border(band, top, tile, title_border, dash_title, border_color)
+                    except Exception as e:
+                        logger.error(f"[Error] draw {tile.page_pos}: {e}")
+
+                if filename_draw_info is None:
+                    filename_draw_info = []
+                    for tile in tiles:
+                        self.queue_tile_filename(tile, plan.image_files[tile.file_idx], add_filename,
+                                                 filename_color, filename_draw_info)
+                band_filenames = [info for info in filename_draw_info
+                                  if info['ink'][1] < bottom and info['ink'][3] > top]
+                self.draw_page_border_and_filenames(band, top, plan, page_border, dash_page, border_color,
+                                                    band_filenames)
+
+                with self.profile.phase(self.output_phase, band.width * band.height * len(band.mode)):
+                    page_sink.add_band(page_idx, top, band)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        with self.profile.phase(self.output_phase):
+            page_sink.end_page(page_idx)
+
+    def create_single_concat_page_tensor(self, plan, page_idx, page_out, title_border, title_border_style,
+                                         page_border, page_border_style, background_style,
+                                         add_filename="none", filename_color="black", strip_height=0):
+        """输入为 IMAGE 批次时的张量渲染：同尺寸图块批量 interpolate 后切片写入 page_out，边框/文件名走透明叠加层
+
+        strip_height>0 时叠加层按条带分段绘制与合成，不再分配整页 RGBA 叠加层。
+        """
+        bg_color, img_mode = self.get_background_config(background_style)
+        border_color = self.get_border_color(background_style)
+        fill_page_background(page_out, bg_color)
+
+        groups = {}
+        for tile in plan.iter_page_tiles(page_idx):
+            key = (tile.img_w, tile.img_h, tile.crop)
+            groups.setdefault(key, []).append(tile)
+        for tiles in groups.values():
+            frame_indices = [self.input_index[plan.image_files[tile.file_idx]] for tile in tiles]
+            try:
+                # 张量路径中缩放与写入页面合在一次批处理里，计入 resizing
+                with self.profile.phase("resizing", len(tiles) * int(tiles[0].img_w) * int(tiles[0].img_h) * 3 * 4):
+                    paste_frames_into_page(page_out, self.input_frames, frame_indices, tiles)
+            except Exception as e:
+                logger.error(f"[Error] draw {tiles[0].page_pos}: {e}")
 
-            global_start_idx = 0
-            for i in range(page_idx):
-                global_start_idx += len(page_image_mapping[i])
+        if title_border == "None" and page_border == "None" and add_filename == "none":
+            return
+        dash_title = self.get_dash_pattern(title_border_style)
+        dash_page = self.get_dash_pattern(page_border_style)
+        filename_draw_info = []
+        for tile in plan.iter_page_tiles(page_idx):
+            self.queue_tile_filename(tile, plan.image_files[tile.file_idx], add_filename, filename_color,
+                                     filename_draw_info)
+        for top, bottom in iter_bands(plan.page_height, strip_height):
+            overlay = Image.new('RGBA', (plan.page_width, bottom - top), (0, 0, 0, 0))
+            for tile in plan.iter_page_tiles(page_idx):
+                if tile.tile_y - 2 < bottom and tile.tile_y + tile.tile_h + 2 > top:
+                    self.draw_tile_border(overlay, top, tile, title_border, dash_title, border_color)
+            band_filenames = [info for info in filename_draw_info if info['ink'][1] < bottom and info['ink'][3] > top]
+            self.draw_page_border_and_filenames(overlay, top, plan, page_border, dash_page, border_color,
+                                                band_filenames)
+            with self.profile.phase("compositing"):
+                composite_overlay(page_out[top:bottom], overlay)
+
+    def draw_tile_border(self, canvas, canvas_top, tile, title_border, dash_title, border_color):
+        """绘制单个图块的边框（canvas_top 为 canvas 在页面中的起始行）"""
+        if title_border == "None":
+            return
+        rect = [tile.tile_x, tile.tile_y, tile.tile_x + tile.tile_w, tile.tile_y + tile.tile_h]
+        with self.profile.phase("borders_text"):
+            if "Rounded" in title_border:
+                self.draw_dashed_rounded_rectangle_manual(canvas, rect, 10, dash_title, 2, border_color, canvas_top)
+            else:
+                self.draw_dashed_rectangle_manual(canvas, rect, dash_title, 2, border_color, canvas_top)
 
-            current_group_cnt = page_group_count.get(page_idx, 1)
-            current_page_h = page_total_occupy_height[page_idx] if page_idx < len(
-                page_total_occupy_height) else height_page_use
+    def queue_tile_filename(self, tile, img_file, add_filename, filename_color, filename_draw_info):
+        """计算单个图块的文件名位置并加入待绘制队列（文件名最后统一绘制，避免被后续图块覆盖）
 
-            if isinstance(page_image_mapping[page_idx][0], int):
-                page_image_files = [image_files[idx] for idx in page_image_mapping[page_idx]]
+        文字按 (文本, 字号, 颜色) 预渲染为标签贴图并缓存，位置计算与绘制都不再重复排版。
+        """
+        if add_filename == "none":
+            return
+        with self.profile.phase("borders_text"):
+            label = label_sprites.get(img_file, tile.font_size, filename_color)
+        text_w = label.width
+        text_h = label.height
+        text_x = tile.label_x + (tile.label_w - text_w) // 2
+        gap = 8
+        if add_filename == "above":
+            text_y = tile.label_outer_y - text_h - gap
+        elif add_filename == "top":
+            text_y = tile.label_inner_y + gap
+        elif add_filename == "middle":
+            text_y = tile.label_inner_y + (tile.label_h - text_h) // 2
+        elif add_filename == "bottom":
+            text_y = tile.label_inner_y + tile.label_h - text_h - gap
+        elif add_filename == "below":
+            text_y = tile.label_outer_y + tile.label_h + gap
+        ink_x, ink_y = text_x + label.offset_x, text_y + label.offset_y
+        filename_draw_info.append({'xy': (text_x, text_y),
+                                   'rect': [text_x - 5, text_y - 2, text_x + text_w + 5,
+                                            text_y + text_h + 2], 'text': img_file, 'label': label,
+                                   'ink': [ink_x, ink_y, ink_x + label.image.width, ink_y + label.image.height],
+                                   'fill': filename_color, 'bg': None})
+
+    def draw_page_border_and_filenames(self, canvas, canvas_top, plan, page_border, dash_page, border_color,
+                                       filename_draw_info):
+        """绘制页面边框，再把队列中的文件名标签贴到 canvas（canvas_top 为 canvas 在页面中的起始行）"""
+        margin = plan.margin
+        start = time.perf_counter()
+        if page_border != "None":
+            full_rect = [margin, margin, plan.page_width - margin, plan.page_height - margin]
+            if "Rounded" in page_border:
+                self.draw_dashed_rounded_rectangle_manual(canvas, full_rect, 10, dash_page, 2, border_color,
+                                                          canvas_top)
             else:
-                page_image_files = page_image_mapping[page_idx]
+                self.draw_dashed_rectangle_manual(canvas, full_rect, dash_page, 2, border_color, canvas_top)
 
-            print(
-                f"\n{'=' * 50} 绘制第 {current_page_num}/{len(page_image_mapping)} 页 (块组数: {current_group_cnt}) {'=' * 50}")
+        # Draw Filename
+        for info in filename_draw_info:
+            if info['bg'] is not None:
+                x0, y0, x1, y1 = info['rect']
+                canvas.paste(info['bg'], (x0, y0 - canvas_top, x1 + 1, y1 + 1 - canvas_top))
+            info['label'].paste_onto(canvas, (info['xy'][0], info['xy'][1] - canvas_top))
+        self.profile.add("borders_text", time.perf_counter() - start)
+
+    def render_plan_wireframe(self, plan, page_idx, background_style, max_side=512):
+        """Dry run 预览：按比例缩小绘制某页的块框线（不解码任何图片）"""
+        scale = min(1.0, max_side / max(plan.page_width, plan.page_height))
+        preview_w = max(1, int(plan.page_width * scale))
+        preview_h = max(1, int(plan.page_height * scale))
+        bg_color, img_mode = self.get_background_config(background_style)
+        if img_mode == 'RGBA':
+            bg_color = (255, 255, 255)
+        line_color = self.get_border_color(background_style)
+        preview = Image.new('RGB', (preview_w, preview_h), color=bg_color)
+        draw = ImageDraw.Draw(preview)
+        m = plan.margin * scale
+        draw.rectangle([m, m, preview_w - 1 - m, preview_h - 1 - m], outline=line_color)
+        for tile in plan.iter_page_tiles(page_idx):
+            draw.rectangle([tile.tile_x * scale, tile.tile_y * scale,
+                            (tile.tile_x + tile.tile_w) * scale, (tile.tile_y + tile.tile_h) * scale],
+                           outline=line_color)
+            draw.rectangle([tile.img_x * scale, tile.img_y * scale,
+                            (tile.img_x + tile.img_w) * scale, (tile.img_y + tile.img_h) * scale],
+                           fill=(128, 128, 128))
+        preview_np = np.array(preview).astype(np.float32) / 255.0
+        return torch.from_numpy(preview_np)[None,]
 
-            n_per_col_arg = 1
-            if not equal_height_mode and not equal_width_mode:
-                n_per_col_arg = n_per_col_actual
-            elif equal_height_mode:
-                n_per_col_arg = 9999
+    def generate_concat(self, a1_image_dir, a2_page_width, a3_page_aspect_ratio, a4_cols_rows_per_page, a5_page_margin,
+                        a6_title_padding,
+                        a8_title_first_position, a7_title_draw_mode, a10_title_border, a11_title_border_style,
+                        a12_page_border, a13_page_border_style, a97_title_save_mode, a98_title_save_dir,
+                        a99_title_save_filename,
+                        a9_background_style, a14_filename_position, a15_filename_color, a0_images=None,
+                        a16_run_mode="render", a17_render_workers=1, a18_tile_workers=1,
+                        a19_decode_mode="downscale on decode (fast)", a20_output_mode="batch tensor",
+                        a21_page_save_dir="./output/concat_pages", a22_page_format="PNG", a23_strip_height=0,
+                        a24_title_save_format="PNG", a25_tile_cache_mb=512, a26_log_level="normal",
+                        a27_scan_depth=0, a28_include_patterns="", a29_exclude_patterns="", a30_sort_order="natural",
+                        a31_page_window=0, a32_decoded_sources=16, a33_max_memory_mb=0, a34_document_dpi=300,
+                        a35_document_compression="lossless (Deflate)"):
+
+        set_log_level(a26_log_level)
+        # 本次运行的分阶段耗时统计
+        self.profile = RunProfile()
+        # 独立块保存：格式参数与后台写入线程池（保存模式不为 none 时在渲染前创建）
+        self.title_save_params = self.get_image_save_params(a24_title_save_format)
+        self.title_writer = None
+        self.image_dir_full = a1_image_dir
+        self.width_page_use_global = a2_page_width - 2 * a5_page_margin
+        is_dry_run = (a16_run_mode == "dry run (plan only)")
+        # 代理预览：同一布局按 1/N 分辨率渲染，只输出批量张量，不保存单图
+        preview_divisor = {"preview 1/4 (fast)": 4, "preview 1/8 (fast)": 8}.get(a16_run_mode, 1)
+        # 多页文档输出同样逐页流式写出，只是写入同一个文件
+        document_format = {"stream to PDF (multi-page)": "PDF",
+                           "stream to TIFF (multi-page)": "TIFF"}.get(a20_output_mode)
+        is_stream_output = (a20_output_mode == "stream pages to disk" or document_format is not None) \
+            and preview_divisor == 1
+        if document_format is not None:
+            # 非 PNG 流式输出与 TIFF/JPEG 文档的条带都要先拼成整页再编码
+            stream_assembles_pages = not DocumentPageSink.streams_bands(document_format, a35_document_compression)
+        else:
+            stream_assembles_pages = self.get_image_save_params(a22_page_format)[0] != "PNG"
+        if is_stream_output:
+            page_paths_info = "no page written"
+        else:
+            page_paths_info = "can't display `b7_page_paths` due to `a20_output_mode` is 'batch tensor'"
 
-            concat_page_np = self.create_single_concat_page(
-                page_image_files, a2_page_width, height_page, a4_cols_rows_per_page,
-                n_per_col_arg,
-                a5_page_margin, a6_title_padding, a8_title_first_position,
-                w_title_size, h_title_size, a7_title_draw_mode, a10_title_border, a11_title_border_style,
-                a12_page_border, a13_page_border_style, current_page_num,
-                a97_title_save_mode, titles_final_path, a99_title_save_filename, global_start_idx,
+        filename_color_rgb = self.get_filename_color_by_name(a15_filename_color)
+
+        titles_final_path = ""
+        if is_dry_run or preview_divisor > 1:
+            titles_final_path = f"can't display `b5_title_save_path` due to `a16_run_mode` is '{a16_run_mode}'"
+            a97_title_save_mode = "none"
+        elif a97_title_save_mode != "none":
+            mode_suffix = ""
+            if a97_title_save_mode == "save single title":
+                mode_suffix = "(1)"
+            elif a97_title_save_mode == "save single image":
+                mode_suffix = "(2)"
+
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            titles_final_path = os.path.join(a98_title_save_dir, f"concat_titles{mode_suffix}_{timestamp}").replace(
+                "\\", "/")
+            os.makedirs(titles_final_path, exist_ok=True)
+        else:
+            titles_final_path = "can't display `b5_title_save_path` due to `a97_title_save_mode` is 'none'"
+
+        # --- 新增：处理输入图像逻辑 ---
+        self.use_input_images = False
+        self.image_sizes = {}
+        # 输入为 IMAGE 批次且为网格模式(1~4)、不保存单图、输出整批张量时，直接在张量上缩放/拼接，不经过 PIL
+        use_tensor_render = (a0_images is not None and not is_stream_output and a97_title_save_mode == "none"
+                             and a7_title_draw_mode in ["1.smaller value filler", "2.Stretches image to fill",
+                                                        "3.zoom by long side (recommended)",
+                                                        "4.crop square by short side"])
+
+        if a0_images is not None:
+            logger.info(f"[✅ Detected input images batch. Batch size: {len(a0_images)}")
+            self.use_input_images = True
+            self.input_frames = a0_images
+
+            # 生成虚拟文件名；各帧在解码时才转为 PIL（由 image_store 限制同时驻留的数量）
+            image_files = [f"input_img_{i + 1:05d}.png" for i in range(len(a0_images))]
+            self.input_index = {name: i for i, name in enumerate(image_files)}
+
+            image_count_in_dir = len(image_files)
+            # 覆盖文件夹路径，防止后续逻辑报错（虽然输入模式下不检查路径）
+            self.image_dir_full = "Input_Stream"
+
+        elif os.path.exists(a1_image_dir):
+            # 原有逻辑：从文件夹读取
+            listing_hits = directory_listings.hits
+            with self.profile.phase("listing"):
+                image_files = [entry.name for entry in directory_listings.scan(
+                    a1_image_dir, a27_scan_depth, a28_include_patterns, a29_exclude_patterns, a30_sort_order)]
+            self.profile.count("listing_cache_hits", directory_listings.hits - listing_hits)
+            image_count_in_dir = len(image_files)
+            self.dim_index = ImageDimensionIndex(a1_image_dir)
+        else:
+            logger.error(f"[Error] 图片文件夹不存在: {a1_image_dir} 且无输入图像")
+            error_img = np.zeros((1, 100, 100, 3), dtype=np.float32)
+            error_img[:, :, :, 0] = 1.0
+            return (torch.from_numpy(error_img), 0, "0×0", 0, titles_final_path, self.get_node_tips(),
+                    page_paths_info, self.profile.to_json())
+
+        if image_count_in_dir == 0:
+            logger.error("[Error] 无有效图片")
+            error_img = np.zeros((1, 100, 100, 3), dtype=np.float32)
+            error_img[:, :, :, 0] = 1.0
+            error_img[:, :, :, 1] = 1.0
+            return (torch.from_numpy(error_img), 0, "0×0", 0, titles_final_path, self.get_node_tips(),
+                    page_paths_info, self.profile.to_json())
+
+        self.profile.count("images", image_count_in_dir)
+        with self.profile.phase("planning"):
+            plan = self.plan_concat_layout(image_files, a2_page_width, a3_page_aspect_ratio, a4_cols_rows_per_page,
+                                           a5_page_margin, a6_title_padding, a8_title_first_position,
+                                           a7_title_draw_mode)
+        self.profile.count("pages", plan.page_count)
+        self.profile.count("tiles", len(plan.tiles))
+
+        if not self.use_input_images:
+            self.dim_index.save(keep_names=image_files)
+
+        if is_dry_run:
+            logger.info(f"[✅Dry run] 仅规划布局，未渲染 | 总页数: {plan.page_count} | 图块数: {len(plan.tiles)}")
+            return (self.render_plan_wireframe(plan, 0, a9_background_style), plan.page_count, plan.size_per_title,
+                    image_count_in_dir, titles_final_path, self.get_node_tips(), page_paths_info,
+                    self.profile.to_json(run_mode="dry run"))
+
+        # 图块缩放的重采样方式：正常渲染为 LANCZOS，代理预览为 BILINEAR + reducing_gap
+        if preview_divisor > 1:
+            plan = plan.scaled(preview_divisor)
+            self.fast_decode = True
+            self.resample, self.reducing_gap = Image.Resampling.BILINEAR, 2.0
+            # 文件夹源图先缩成与布局无关的缩略图并缓存，之后调整布局再预览时不用重新解码
+            self.use_preview_proxy = not self.use_input_images
+            logger.info(f"[✅] 代理预览: 1/{preview_divisor} 分辨率 | 页面尺寸: {plan.page_width}×{plan.page_height}")
+        else:
+            self.fast_decode = (a19_decode_mode == "downscale on decode (fast)")
+            self.resample, self.reducing_gap = Image.Resampling.LANCZOS, None
+            self.use_preview_proxy = False
+        self.keep_alpha = (self.get_background_config(a9_background_style)[1] == 'RGBA')
+        self.source_fingerprints = {}
+
+        render_workers = a17_render_workers if a17_render_workers > 0 else (os.cpu_count() or 1)
+        render_workers = min(render_workers, plan.page_count)
+        # 滑动窗口：已提交但尚未交给 page_sink 的页数不超过 page_window，已渲染页面的驻留量与总页数无关
+        page_window = a31_page_window if a31_page_window > 0 else render_workers * 2
+        tile_workers = a18_tile_workers if a18_tile_workers > 0 else (os.cpu_count() or 1)
+        writer_workers = min(4, os.cpu_count() or 1)
+        settings = RenderSettings(render_workers, page_window, tile_workers,
+                                  resolve_strip_height(plan.page_width, plan.page_height, a23_strip_height),
+                                  a32_decoded_sources, a25_tile_cache_mb * MB, False)
+        if a33_max_memory_mb > 0:
+            governor = self.build_memory_governor(plan, a9_background_style, a97_title_save_mode,
+                                                  is_stream_output, stream_assembles_pages, use_tensor_render,
+                                                  writer_workers * 4)
+            estimate_before = governor.total(settings)
+            settings, estimate, changes = governor.fit(settings, a33_max_memory_mb * MB)
+            self.profile.count("estimated_peak_mb", round(sum(estimate.values()) / MB))
+            if settings is None:
+                logger.error(f"[Error] 预计峰值内存超出 a33_max_memory_mb={a33_max_memory_mb} MB，已降到最低设置仍需 "
+                             f"{sum(estimate.values()) / MB:.0f} MB: {format_estimate(estimate)}。请减小 a2_page_width / "
+                             f"页面宽高比" + ("" if is_stream_output else "，或改用 stream pages to disk"))
+                error_img = np.zeros((1, 100, 100, 3), dtype=np.float32)
+                error_img[:, :, :, 0] = 1.0
+                error_img[:, :, :, 2] = 1.0
+                return (torch.from_numpy(error_img), 0, "0×0", 0, titles_final_path, self.get_node_tips(),
+                        page_paths_info, self.profile.to_json(run_mode="over memory budget"))
+            logger.info(f"[✅] 内存预算: 预计峰值 {sum(estimate.values()) / MB:.0f}/{a33_max_memory_mb} MB "
+                        f"(调整前 {estimate_before / MB:.0f} MB) | {format_estimate(estimate)}")
+            if changes:
+                logger.info(f"[✅] 为满足内存预算调整: {', '.join(changes)}")
+        render_workers, page_window, tile_workers, strip_height, decoded_sources, tile_cache_bytes, \
+            memmap_output = settings
+        if is_stream_output and document_format is not None and strip_height > 0 and render_workers > 1:
+            # 条带由渲染线程直接写入文档，多页并行时会交错
+            render_workers = page_window = 1
+            logger.info("[✅] 条带渲染写入多页文档: 渲染线程数降为 1")
+
+        resized_tiles.set_budget(tile_cache_bytes)
+        cache_hits, cache_misses = resized_tiles.hits, resized_tiles.misses
+        if strip_height > 0:
+            # 条带内相交的图块源图需同时驻留，避免在条带之间被 LRU 淘汰后重复解码
+            self.image_store = DecodedImageStore(self.decode_image_any_source,
+                                                 max_items=max(decoded_sources,
+                                                               max_tiles_per_band(plan, strip_height)))
+            logger.info(f"[✅] 条带渲染: 每条 {strip_height} 行 | 页面尺寸: {plan.page_width}×{plan.page_height}")
+        else:
+            self.image_store = DecodedImageStore(self.decode_image_any_source, max_items=decoded_sources)
+
+        if use_tensor_render:
+            logger.info("[✅] 张量渲染: 同尺寸图块批量 interpolate 后直接写入输出张量")
+
+        # 页面交给输出端的耗时：整批张量时为 float 转换，流式输出时为编码写盘
+        self.output_phase = "page_encoding" if is_stream_output else "tensor_conversion"
+        if is_stream_output and document_format is not None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            document_path = os.path.join(a21_page_save_dir, f"concat_pages_{timestamp}.{document_format.lower()}")
+            page_sink = DocumentPageSink(document_path, document_format, a35_document_compression, a34_document_dpi)
+            logger.info(f"[✅] 多页文档输出: 每页渲染后追加到 {page_sink.path} | {a35_document_compression} | "
+                        f"{a34_document_dpi} DPI")
+        elif is_stream_output:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            pages_final_path = os.path.join(a21_page_save_dir, f"concat_pages_{timestamp}").replace("\\", "/")
+            page_sink = DiskPageSink(pages_final_path, self.get_image_save_params(a22_page_format))
+            logger.info(f"[✅] 流式输出: 每页渲染后写入 {pages_final_path}")
+        else:
+            _, img_mode = self.get_background_config(a9_background_style)
+            page_sink = BatchPageSink(plan.page_count, plan.page_height, plan.page_width, len(img_mode),
+                                      memmap_threshold=0 if memmap_output else MEMMAP_THRESHOLD_BYTES)
+            if page_sink.memmap_backed:
+                logger.info("[✅] 输出张量超过内存阈值，改用临时文件 memmap 存储")
+
+        if a97_title_save_mode != "none":
+            # 单图编码写盘放到后台线程，待写队列有上限，渲染线程不再等待 zlib
+            self.title_writer = AsyncImageWriter(self.title_save_params, max_workers=writer_workers,
+                                                 max_pending=writer_workers * 4)
+
+        def render_page(page_idx):
+            logger.debug("\n%s 绘制第 %d/%d 页 (图块数: %d) %s", '=' * 50, page_idx + 1, plan.page_count,
+                         len(plan.page_tiles(page_idx)), '=' * 50)
+            if use_tensor_render:
+                # 直接写入 page_sink.out[page_idx]，无需再交给 add_page
+                self.create_single_concat_page_tensor(
+                    plan, page_idx, page_sink.out[page_idx], a10_title_border, a11_title_border_style,
+                    a12_page_border, a13_page_border_style, a9_background_style,
+                    add_filename=a14_filename_position, filename_color=filename_color_rgb,
+                    strip_height=strip_height)
+                return None
+            if strip_height > 0:
+                # 条带直接写入 page_sink，无需再交给 add_page
+                self.create_single_concat_page_strips(
+                    plan, page_idx, page_sink, strip_height, a10_title_border, a11_title_border_style,
+                    a12_page_border, a13_page_border_style,
+                    a97_title_save_mode, titles_final_path, a99_title_save_filename,
+                    a9_background_style,
+                    add_filename=a14_filename_position,
+                    filename_color=filename_color_rgb,
+                    tile_workers=tile_workers
+                )
+                return None
+            return self.create_single_concat_page(
+                plan, page_idx, a10_title_border, a11_title_border_style,
+                a12_page_border, a13_page_border_style,
+                a97_title_save_mode, titles_final_path, a99_title_save_filename,
                 a9_background_style,
-                vertical_offset_mode, image_count_in_dir,
-                current_page_group_count=current_group_cnt,
-                page_total_occupy_h=current_page_h,
                 add_filename=a14_filename_position,
                 filename_color=filename_color_rgb,
-                page_meta=page_data_list[page_idx]['meta'] if is_a4_equals_1 and page_idx < len(
-                    page_data_list) else None
+                tile_workers=tile_workers
             )
-            all_concats.append(concat_page_np)
 
-        concat_np = np.stack(all_concats, axis=0) if all_concats else np.zeros((1, 100, 100, 3), dtype=np.float32)
-        concat_tensor = torch.from_numpy(concat_np)
+        def emit_page(page_idx, page_img):
+            if page_img is not None:
+                with self.profile.phase(self.output_phase, page_img.width * page_img.height * len(page_img.mode)):
+                    page_sink.add_page(page_idx, page_img)
 
-        return (concat_tensor, len(page_image_mapping), wh_per_title, image_count_in_dir, titles_final_path,
-                self.get_node_tips())
+        # 各页在布局规划后相互独立；Pillow 的解码/缩放/编码会释放 GIL，因此用线程并行，按页序交给 page_sink
+        try:
+            if render_workers > 1:
+                logger.info(f"[✅] 并行渲染: {render_workers} 个线程 | 页面窗口: {page_window} | "
+                            f"总页数: {plan.page_count}")
+                with ThreadPoolExecutor(max_workers=render_workers) as executor:
+                    pending = deque()
+                    try:
+                        for page_idx in range(plan.page_count):
+                            pending.append((page_idx, executor.submit(render_page, page_idx)))
+                            if len(pending) >= page_window:
+                                done_idx, future = pending.popleft()
+                                emit_page(done_idx, future.result())
+                        while pending:
+                            done_idx, future = pending.popleft()
+                            emit_page(done_idx, future.result())
+                    finally:
+                        for _, future in pending:
+                            future.cancel()
+            else:
+                for page_idx in range(plan.page_count):
+                    emit_page(page_idx, render_page(page_idx))
+        except BaseException:
+            if isinstance(page_sink, DocumentPageSink):
+                # 中断时仍写完文档尾部，已追加的页面可以打开
+                page_sink.close()
+            raise
+        finally:
+            # b5_title_save_path 返回前等待所有单图写完
+            if self.title_writer is not None:
+                with self.profile.phase("title_saving"):
+                    failed = self.title_writer.close()
+                self.profile.count("titles_written", self.title_writer.written)
+                self.profile.count("titles_failed", failed)
+                logger.info(f"[✅] 单图保存: 写入 {self.title_writer.written} 个文件，失败 {failed} 个 | {titles_final_path}")
+                self.title_writer = None
+
+        self.profile.count("decodes", self.image_store.decode_count)
+        self.profile.count("tile_cache_hits", resized_tiles.hits - cache_hits)
+        self.profile.count("tile_cache_misses", resized_tiles.misses - cache_misses)
+        logger.info(f"[✅] 源图解码次数: {self.image_store.decode_count} | 有效图片数: {image_count_in_dir}")
+        if resized_tiles.max_bytes > 0:
+            logger.info(f"[✅] 图块缓存: 命中 {resized_tiles.hits - cache_hits} | 未命中 {resized_tiles.misses - cache_misses} | "
+                        f"占用 {resized_tiles.total_bytes / MB:.1f}/{resized_tiles.max_bytes / MB:.0f} MB")
+        self.image_store.clear()
+
+        with self.profile.phase(self.output_phase):
+            concat_tensor = page_sink.finish()
+        if is_stream_output:
+            page_paths_info = "\n".join(page_sink.paths)
+
+        run_profile = self.profile.to_dict()
+        logger.info("[✅] 总耗时 %.2fs | %s", run_profile["total_seconds"], " | ".join(
+            f"{phase} {stats['seconds']:.2f}s" for phase, stats in
+            sorted(run_profile["phases"].items(), key=lambda item: -item[1]["seconds"])))
+        return (concat_tensor, plan.page_count, plan.size_per_title, image_count_in_dir, titles_final_path,
+                self.get_node_tips(), page_paths_info, self.profile.to_json(run_mode=a16_run_mode))
 
 
 NODE_CLASS_MAPPINGS["ImageConcatNode"] = ImageConcatNode
@@ -0,0 +1,543 @@
+import io
+import os
+import zlib
+import struct
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import torch
+from PIL import Image, TiffImagePlugin
+from .run_profile import logger
+
+# 整批输出张量超过该字节数时改用临时文件 memmap 作为存储，由系统页缓存换入换出
+MEMMAP_THRESHOLD_BYTES = 2 * 1024 ** 3
+# 流式输出时 b1 最多保留的缩略图页数，页数再多内存也不随之增长
+MAX_PREVIEW_PAGES = 64
+# 多页文档的压缩方式 -> (PDF 图像滤镜, TIFF compression, JPEG 质量)
+DOCUMENT_COMPRESSIONS = {
+    "lossless (Deflate)": ("FlateDecode", "tiff_deflate", None),
+    "JPEG (quality 95)": ("DCTDecode", "jpeg", 95),
+    "JPEG (quality 85)": ("DCTDecode", "jpeg", 85),
+}
+
+
+def page_to_float_array(page_img):
+    """PIL 页面（或其 uint8 数组）-> float32 HWC 数组（0~1），灰度页扩展为 3 通道"""
+    page_np = np.array(page_img).astype(np.float32) / 255.0
+    if len(page_np.shape) == 2:
+        page_np = np.repeat(np.expand_dims(page_np, -1), 3, -1)
+    return page_np
+
+
+def write_page_into(page_img, out_np, band_rows=256):
+    """把 PIL 页面按行带转换为 float32 并直接写入预分配的 out_np[H, W, C]，临时内存只有一个行带"""
+    for top in range(0, page_img.height, band_rows):
+        bottom = min(top + band_rows, page_img.height)
+        band = np.asarray(page_img.crop((0, top, page_img.width, bottom)))
+        if band.ndim == 2:
+            band = band[:, :, None]
+        np.divide(band, np.float32(255.0), out=out_np[top:bottom])
+
+
+def reserve_unique_path(path):
+    """以独占方式创建空文件 path，已存在时依次尝试 name_2.ext、name_3.ext …；返回实际创建的路径。
+
+    同一秒内启动的两次运行时间戳相同，不加区分会截断覆盖对方的文件。
+    """
+    stem, ext = os.path.splitext(path)
+    counter = 1
+    while True:
+        candidate = path if counter == 1 else f"{stem}_{counter}{ext}"
+        try:
+            with open(candidate, 'xb'):
+                return candidate
+        except FileExistsError:
+            counter += 1
+
+
+def save_image(img, path, save_params):
+    """按 (PIL 格式, 扩展名, save 参数) 编码保存；JPEG 不支持 alpha，先转为 RGB"""
+    pil_format, _, save_kwargs = save_params
+    if pil_format == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+    img.save(path, pil_format, **save_kwargs)
+
+
+class AsyncImageWriter:
+    """Background encoder/writer pool with a bounded number of pending images.
+
+    ``submit`` blocks once ``max_pending`` images are queued, so a fast renderer can't pile up
+    unbounded canvases in memory. ``flush`` waits for everything submitted so far and reports
+    failed writes; ``close`` flushes and shuts the pool down.
+    """
+
+    def __init__(self, save_params, max_workers=2, max_pending=8):
+        self.save_params = save_params
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="concat_writer")
+        self.slots = threading.BoundedSemaphore(max(1, max_pending))
+        self.futures = []
+        self.lock = threading.Lock()
+        self.written = 0
+
+    def submit(self, img, path):
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(save_image, img, path, self.save_params)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        with self.lock:
+            self.futures.append((path, future))
+
+    def flush(self):
+        """等待所有已提交的写入完成，返回失败数"""
+        with self.lock:
+            futures, self.futures = self.futures, []
+        failed = 0
+        for path, future in futures:
+            try:
+                future.result()
+                self.written += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"[Error] Save {path} failed: {e}")
+        return failed
+
+    def close(self):
+        failed = self.flush()
+        self.executor.shutdown()
+        return failed
+
+
+class RowDeflater:
+    """Deflates row bands with the PNG "Up" filter (one filter byte per row) through one zlib stream.
+
+    The output is valid PNG IDAT data and PDF FlateDecode data with ``/Predictor 15``.
+    """
+
+    def __init__(self, row_bytes, compress_level=6):
+        self.prev_row = np.zeros((row_bytes,), dtype=np.uint8)
+        self.compressor = zlib.compressobj(compress_level)
+
+    def compress(self, rows):
+        """rows: uint8 数组 [行数, 每行字节]；返回本行带压缩后的数据（同步刷新）"""
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 2
+        np.subtract(rows[0], self.prev_row, out=filtered[0, 1:])
+        np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+        self.prev_row = rows[-1].copy()
+        return self.compressor.compress(filtered) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self):
+        return self.compressor.flush()
+
+
+class StreamingPngWriter:
+    """Writes a PNG row band by row band, so the full page never has to exist in memory.
+
+    Rows use the "Up" filter and go through one streaming zlib compressor; every band is
+    flushed as its own IDAT chunk.
+    """
+
+    COLOR_TYPES = {'L': 0, 'RGB': 2, 'RGBA': 6}
+
+    def __init__(self, path, width, height, mode, compress_level=6):
+        self.path = path
+        self.deflater = RowDeflater(width * len(mode), compress_level)
+        self.f = open(path, 'wb')
+        self.f.write(b'\x89PNG\r\n\x1a\n')
+        self.write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, self.COLOR_TYPES[mode], 0, 0, 0))
+
+    def write_chunk(self, chunk_type, data):
+        self.f.write(struct.pack('>I', len(data)))
+        self.f.write(chunk_type)
+        self.f.write(data)
+        self.f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
+
+    def write_band(self, band_img):
+        data = self.deflater.compress(np.asarray(band_img).reshape(band_img.height, -1))
+        if data:
+            self.write_chunk(b'IDAT', data)
+
+    def close(self):
+        self.write_chunk(b'IDAT', self.deflater.flush())
+        self.write_chunk(b'IEND', b'')
+        self.f.close()
+
+
+class StreamingPdfWriter:
+    """Appends image pages to a PDF one at a time; only object offsets and page ids stay in memory.
+
+    Every page is one image XObject drawn over the whole page (pixels * 72 / dpi points).
+    ``FlateDecode`` pages are deflated band by band with the PNG predictor (``begin_page`` /
+    ``write_band`` / ``end_page``), so a page rendered in strips never exists in full;
+    ``DCTDecode`` pages are JPEG-encoded whole. Alpha goes into a deflated soft mask that is
+    buffered compressed until the page ends. ``close`` writes the page tree and xref table.
+    """
+
+    COLOR_SPACES = {'L': "/DeviceGray", 'RGB': "/DeviceRGB", 'RGBA': "/DeviceRGB"}
+
+    def __init__(self, path, dpi=300, image_filter="FlateDecode", jpeg_quality=95, compress_level=6):
+        self.path = path
+        self.dpi = dpi
+        self.image_filter = image_filter
+        self.jpeg_quality = jpeg_quality
+        self.compress_level = compress_level
+        self.offsets = [None, None, None]  # 0 空闲对象，1 Catalog，2 Pages
+        self.page_ids = []
+        self.current = None
+        self.f = open(path, 'wb')
+        self.f.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    @property
+    def streams_bands(self):
+        return self.image_filter == "FlateDecode"
+
+    def new_id(self):
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def begin_object(self, obj_id):
+        self.offsets[obj_id] = self.f.tell()
+        self.f.write(f"{obj_id} 0 obj\n".encode('ascii'))
+
+    def write_object(self, obj_id, body):
+        self.begin_object(obj_id)
+        self.f.write(body.encode('ascii') + b'\nendobj\n')
+
+    def write_stream(self, obj_id, dictionary, data):
+        self.begin_object(obj_id)
+        self.f.write(f"<< {dictionary} /Length {len(data)} >>\nstream\n".encode('ascii'))
+        self.f.write(data)
+        self.f.write(b'\nendstream\nendobj\n')
+
+    def image_dictionary(self, width, height, colors, color_space, smask_id):
+        dictionary = f"/Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace {color_space} " \
+                     f"/BitsPerComponent 8 /Filter /{self.image_filter}"
+        if self.image_filter == "FlateDecode":
+            dictionary += f" /DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent 8 /Columns {width} >>"
+        if smask_id is not None:
+            dictionary += f" /SMask {smask_id} 0 R"
+        return dictionary
+
+    def mask_dictionary(self, width, height):
+        return f"/Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray " \
+               f"/BitsPerComponent 8 /Filter /FlateDecode " \
+               f"/DecodeParms << /Predictor 15 /Colors 1 /BitsPerComponent 8 /Columns {width} >>"
+
+    def write_page_object(self, image_id, width, height):
+        """写入内容流与 Page 对象，图像铺满整页"""
+        page_w = width * 72.0 / self.dpi
+        page_h = height * 72.0 / self.dpi
+        content_id, page_id = self.new_id(), self.new_id()
+        self.write_stream(content_id, "", f"q {page_w:.4f} 0 0 {page_h:.4f} 0 0 cm /Im0 Do Q".encode('ascii'))
+        self.write_object(page_id, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w:.4f} {page_h:.4f}] "
+                                   f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>")
+        self.page_ids.append(page_id)
+
+    def begin_page(self, width, height, mode):
+        image_id, length_id = self.new_id(), self.new_id()
+        has_alpha = mode == 'RGBA'
+        smask_id = self.new_id() if has_alpha else None
+        colors = 1 if mode == 'L' else 3
+        self.begin_object(image_id)
+        # 压缩后的长度在写完之前未知，用间接对象记录
+        self.f.write(f"<< {self.image_dictionary(width, height, colors, self.COLOR_SPACES[mode], smask_id)} "
+                     f"/Length {length_id} 0 R >>\nstream\n".encode('ascii'))
+        self.current = {
+            "size": (width, height), "image_id": image_id, "length_id": length_id, "smask_id": smask_id,
+            "start": self.f.tell(), "deflater": RowDeflater(width * colors, self.compress_level),
+            "mask_deflater": RowDeflater(width, self.compress_level) if has_alpha else None, "mask_data": [],
+        }
+
+    def write_band(self, band_img):
+        page = self.current
+        pixels = np.asarray(band_img)
+        if page["mask_deflater"] is not None:
+            page["mask_data"].append(page["mask_deflater"].compress(pixels[:, :, 3]))
+            pixels = pixels[:, :, :3]
+        self.f.write(page["deflater"].compress(pixels.reshape(band_img.height, -1)))
+
+    def end_page(self):
+        page, self.current = self.current, None
+        self.f.write(page["deflater"].flush())
+        length = self.f.tell() - page["start"]
+        self.f.write(b'\nendstream\nendobj\n')
+        self.write_object(page["length_id"], str(length))
+        width, height = page["size"]
+        if page["smask_id"] is not None:
+            page["mask_data"].append(page["mask_deflater"].flush())
+            self.write_stream(page["smask_id"], self.mask_dictionary(width, height), b''.join(page["mask_data"]))
+        self.write_page_object(page["image_id"], width, height)
+
+    def add_page(self, page_img, band_rows=256):
+        if self.streams_bands:
+            # 整页也按行带压缩，临时数组只有一个行带大小
+            self.begin_page(page_img.width, page_img.height, page_img.mode)
+            for top in range(0, page_img.height, band_rows):
+                self.write_band(page_img.crop((0, top, page_img.width, min(top + band_rows, page_img.height))))
+            self.end_page()
+            return
+        width, height = page_img.size
+        smask_id = None
+        if page_img.mode == 'RGBA':
+            smask_id = self.new_id()
+            mask_deflater = RowDeflater(width, self.compress_level)
+            mask_data = mask_deflater.compress(np.asarray(page_img.getchannel('A'))) + mask_deflater.flush()
+            self.write_stream(smask_id, self.mask_dictionary(width, height), mask_data)
+        color_img = page_img if page_img.mode in ('L', 'RGB') else page_img.convert('RGB')
+        buffer = io.BytesIO()
+        color_img.save(buffer, "JPEG", quality=self.jpeg_quality)
+        image_id = self.new_id()
+        self.write_stream(image_id, self.image_dictionary(width, height, len(color_img.mode),
+                                                          self.COLOR_SPACES[color_img.mode], smask_id),
+                          buffer.getvalue())
+        self.write_page_object(image_id, width, height)
+
+    def close(self):
+        if self.f.closed:
+            return
+        if self.current is not None:
+            # 未写完的页面（渲染中断）不加入页面树
+            self.f.write(b'\nendstream\nendobj\n')
+            self.current = None
+        kids = " ".join(f"{page_id} 0 R" for page_id in self.page_ids)
+        self.write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>")
+        self.write_object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self.f.tell()
+        lines = [f"xref\n0 {len(self.offsets)}\n", "0000000000 65535 f \n"]
+        # 中断时已分配但未写入的对象记为空闲
+        lines += [f"{offset:010d} 00000 n \n" if offset is not None else "0000000000 65535 f \n"
+                  for offset in self.offsets[1:]]
+        lines.append(f"trailer\n<< /Size {len(self.offsets)} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self.f.write("".join(lines).encode('ascii'))
+        self.f.close()
+
+
+class StreamingTiffWriter:
+    """Appends pages to a multi-page TIFF one at a time with Pillow's ``AppendingTiffWriter``.
+
+    Every page is encoded as its own IFD with its own compression and resolution tags; pages
+    rendered in strips are assembled first (libtiff can't take row bands from Pillow).
+    """
+
+    streams_bands = False
+
+    def __init__(self, path, dpi=300, compression="tiff_deflate", jpeg_quality=95):
+        self.path = path
+        self.save_kwargs = {"compression": compression, "dpi": (dpi, dpi)}
+        if compression == "jpeg":
+            self.save_kwargs["quality"] = jpeg_quality
+        self.tiff = TiffImagePlugin.AppendingTiffWriter(path, new=True)
+
+    def add_page(self, page_img):
+        page_img.save(self.tiff, "TIFF", **self.save_kwargs)
+        self.tiff.newFrame()
+
+    def close(self):
+        if not self.tiff.f.closed:
+            self.tiff.close()
+
+
+class BatchPageSink:
+    """Writes rendered pages straight into one preallocated ``b1_concat_images`` tensor.
+
+    Page count and canvas size come from the layout plan, so the (N, H, W, C) float32 tensor
+    is allocated once and each page (or row band, see ``add_band``) is converted into its
+    slice; no stacking or page copies. Outputs above ``memmap_threshold`` bytes are backed by
+    an anonymous temp file via ``np.memmap`` instead of RAM.
+    """
+
+    def __init__(self, page_count, page_height, page_width, channels, memmap_threshold=MEMMAP_THRESHOLD_BYTES):
+        self.paths = []
+        self.memmap_backed = False
+        if page_count > 0:
+            shape = (page_count, page_height, page_width, channels)
+            if np.prod(shape, dtype=np.int64) * 4 > memmap_threshold:
+                with tempfile.TemporaryFile(prefix="concat_pages_") as f:
+                    self.out_np = np.memmap(f, dtype=np.float32, mode='w+', shape=shape)
+                self.out = torch.from_numpy(self.out_np)
+                self.memmap_backed = True
+            else:
+                self.out = torch.empty(shape, dtype=torch.float32)
+                self.out_np = self.out.numpy()
+        else:
+            self.out = torch.zeros((1, 100, 100, 3), dtype=torch.float32)
+            self.out_np = self.out.numpy()
+
+    def add_page(self, page_idx, page_img):
+        write_page_into(page_img, self.out_np[page_idx])
+
+    def begin_page(self, page_idx, width, height, mode):
+        pass
+
+    def add_band(self, page_idx, top, band_img):
+        write_page_into(band_img, self.out_np[page_idx, top:top + band_img.height])
+
+    def end_page(self, page_idx):
+        pass
+
+    def finish(self):
+        return self.out
+
+
+class DiskPageSink:
+    """Encodes every page to ``save_dir`` as soon as it is rendered.
+
+    Only a small uint8 thumbnail of each of the first ``max_previews`` pages stays in memory;
+    ``finish()`` returns them as the preview batch and ``paths`` lists the written files in page order. Pages rendered in row
+    bands (``begin_page``/``add_band``/``end_page``) are streamed straight into the PNG
+    encoder; other formats can't be written incrementally, so their bands are assembled first.
+    """
+
+    def __init__(self, save_dir, save_params, preview_side=256, max_previews=MAX_PREVIEW_PAGES):
+        self.save_dir = save_dir
+        self.pil_format, self.ext, self.save_kwargs = save_params
+        self.preview_side = preview_side
+        self.max_previews = max_previews
+        self.results = {}
+        self.open_pages = {}
+        self.paths = []
+        os.makedirs(save_dir, exist_ok=True)
+
+    def get_page_path(self, page_idx):
+        return os.path.join(self.save_dir, f"page_{page_idx + 1:04d}{self.ext}").replace("\\", "/")
+
+    def get_preview_scale(self, width, height):
+        return min(1.0, self.preview_side / max(width, height))
+
+    def write_page(self, page_idx, page_img):
+        """编码写出整页，返回其文件路径"""
+        save_path = self.get_page_path(page_idx)
+        save_image(page_img, save_path, (self.pil_format, self.ext, self.save_kwargs))
+        return save_path
+
+    def open_band_writer(self, page_idx, width, height, mode):
+        """能按条带写入的编码器（PNG）；返回 None 时条带先拼成整页"""
+        if self.pil_format == "PNG":
+            return StreamingPngWriter(self.get_page_path(page_idx), width, height, mode,
+                                      self.save_kwargs.get("compress_level", 6))
+        return None
+
+    def close_band_writer(self, page_idx, writer):
+        writer.close()
+        return writer.path
+
+    def add_page(self, page_idx, page_img):
+        save_path = self.write_page(page_idx, page_img)
+
+        preview = None
+        if page_idx < self.max_previews:
+            scale = self.get_preview_scale(page_img.width, page_img.height)
+            preview_size = (max(1, int(page_img.width * scale)), max(1, int(page_img.height * scale)))
+            preview = np.array(page_img.resize(preview_size, Image.Resampling.BILINEAR, reducing_gap=2.0))
+        self.results[page_idx] = (save_path, preview)
+
+    def begin_page(self, page_idx, width, height, mode):
+        writer = self.open_band_writer(page_idx, width, height, mode)
+        if writer is None:
+            writer = Image.new(mode, (width, height))
+        scale = self.get_preview_scale(width, height)
+        preview = None
+        if page_idx < self.max_previews:
+            preview = Image.new(mode, (max(1, int(width * scale)), max(1, int(height * scale))))
+        self.open_pages[page_idx] = (writer, preview, scale)
+
+    def add_band(self, page_idx, top, band_img):
+        writer, preview, scale = self.open_pages[page_idx]
+        if isinstance(writer, Image.Image):
+            writer.paste(band_img, (0, top))
+        else:
+            writer.write_band(band_img)
+
+        if preview is None:
+            return
+        # 缩略图按条带对应的行范围分段缩放
+        preview_top = int(top * scale)
+        preview_bottom = min(preview.height, int((top + band_img.height) * scale))
+        if preview_bottom > preview_top:
+            preview.paste(band_img.resize((preview.width, preview_bottom - preview_top), Image.Resampling.BILINEAR,
+                                          reducing_gap=2.0), (0, preview_top))
+
+    def end_page(self, page_idx):
+        writer, preview, scale = self.open_pages.pop(page_idx)
+        if isinstance(writer, Image.Image):
+            self.add_page(page_idx, writer)
+        else:
+            self.results[page_idx] = (self.close_band_writer(page_idx, writer),
+                                      np.array(preview) if preview is not None else None)
+
+    def finish(self):
+        ordered = [self.results[page_idx] for page_idx in sorted(self.results)]
+        self.paths = [save_path for save_path, _ in ordered]
+        previews = [page_to_float_array(preview) for _, preview in ordered if preview is not None]
+        preview_np = np.stack(previews, axis=0) if previews else np.zeros((1, 100, 100, 3), dtype=np.float32)
+        self.results = {}
+        return torch.from_numpy(preview_np)
+
+
+class DocumentPageSink(DiskPageSink):
+    """Appends every page to one multi-page PDF or TIFF as soon as it is rendered.
+
+    Pages must arrive in page order (the render loop hands them over in order; banded pages
+    need a single render worker). Lossless PDF pages rendered in strips are deflated band by
+    band; TIFF and JPEG pages are assembled first, so at most one page is held in memory.
+    ``paths`` holds the document path, which gets a ``_2``, ``_3``... suffix if the requested
+    name already exists; thumbnails work as in ``DiskPageSink``.
+    """
+
+    def __init__(self, path, document_format, compression="lossless (Deflate)", dpi=300, preview_side=256,
+                 max_previews=MAX_PREVIEW_PAGES):
+        pdf_filter, tiff_compression, jpeg_quality = DOCUMENT_COMPRESSIONS[compression]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 先占住文件名，写入器再打开这个（属于本次运行的）空文件
+        path = reserve_unique_path(path).replace("\\", "/")
+        super().__init__(os.path.dirname(path) or ".", (document_format, os.path.splitext(path)[1], {}),
+                         preview_side, max_previews)
+        self.path = path
+        self.next_page = 0
+        if document_format == "PDF":
+            self.document = StreamingPdfWriter(path, dpi, pdf_filter, jpeg_quality or 95)
+        else:
+            self.document = StreamingTiffWriter(path, dpi, tiff_compression, jpeg_quality or 95)
+
+    @staticmethod
+    def streams_bands(document_format, compression):
+        """条带渲染的页面能否不拼整页直接写入文档"""
+        return document_format == "PDF" and DOCUMENT_COMPRESSIONS[compression][0] == "FlateDecode"
+
+    def check_order(self, page_idx):
+        if page_idx != self.next_page:
+            raise RuntimeError(f"page {page_idx + 1} reached the document before page {self.next_page + 1}")
+        self.next_page += 1
+
+    def get_page_path(self, page_idx):
+        return self.path
+
+    def write_page(self, page_idx, page_img):
+        self.check_order(page_idx)
+        self.document.add_page(page_img)
+        return self.path
+
+    def open_band_writer(self, page_idx, width, height, mode):
+        if not self.document.streams_bands or self.open_pages:
+            return None
+        self.check_order(page_idx)
+        self.document.begin_page(width, height, mode)
+        return self.document
+
+    def close_band_writer(self, page_idx, writer):
+        writer.end_page()
+        return self.path
+
+    def close(self):
+        """写完文档尾部（中断时也调用，已写入的页面仍可打开）"""
+        self.document.close()
+
+    def finish(self):
+        self.close()
+        preview = super().finish()
+        self.paths = [self.path]
+        return preview
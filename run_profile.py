@@ -0,0 +1,84 @@
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+class StdoutHandler(logging.StreamHandler):
+    """每次写入时取当前的 sys.stdout，contextlib.redirect_stdout 等重定向对日志同样生效"""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+# 本插件的日志：消息自带 [✅]/[Warning]/[Error] 前缀，直接输出到 stdout，不经过根 logger 重复打印
+logger = logging.getLogger("ImageConcat")
+if not logger.handlers:
+    _handler = StdoutHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+LOG_LEVELS = {
+    "normal": logging.INFO,
+    "verbose": logging.DEBUG,
+    "quiet": logging.WARNING,
+}
+
+
+def set_log_level(level_name):
+    logger.setLevel(LOG_LEVELS.get(level_name, logging.INFO))
+
+
+class RunProfile:
+    """Per-phase wall time, call count and byte totals of one ``generate_concat`` run.
+
+    Phases timed from several render/tile threads add up, so a phase total can exceed the
+    run's wall time. Thread-safe; ``to_json`` is returned as the ``b8_run_profile`` output.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def add(self, phase, seconds, nbytes=0, calls=1):
+        with self.lock:
+            entry = self.phases.setdefault(phase, [0.0, 0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+            entry[2] += nbytes
+
+    @contextmanager
+    def phase(self, phase, nbytes=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start, nbytes)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self, **extra):
+        with self.lock:
+            phases = {phase: {"seconds": round(seconds, 4), "calls": calls, "bytes": nbytes}
+                      for phase, (seconds, calls, nbytes) in self.phases.items()}
+            counters = dict(self.counters)
+        result = {"total_seconds": round(time.perf_counter() - self.started, 4), "phases": phases,
+                  "counters": counters}
+        result.update(extra)
+        return result
+
+    def to_json(self, **extra):
+        return json.dumps(self.to_dict(**extra), ensure_ascii=False, indent=1)
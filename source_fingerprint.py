@@ -0,0 +1,48 @@
+import os
+import hashlib
+import torch
+from .dir_scan import directory_listings
+
+# IS_CHANGED 抽样哈希的元素数：与输入批次大小无关的常数开销
+SAMPLED_HASH_ELEMENTS = 65536
+
+
+def file_fingerprint(path):
+    """文件源图指纹：(绝对路径, 文件大小, mtime_ns)，文件被替换或修改后指纹随之改变"""
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+
+def tensor_fingerprint(frame):
+    """输入帧指纹：形状 + 像素内容哈希（缓存返回的是像素，因此对整帧取哈希而不是抽样）"""
+    frame_np = frame.detach().cpu().contiguous().numpy()
+    digest = hashlib.blake2b(frame_np.tobytes(), digest_size=16).hexdigest()
+    return "tensor", tuple(frame_np.shape), str(frame_np.dtype), digest
+
+
+def dir_fingerprint(image_dir, max_depth=0, include="", exclude=""):
+    """图片文件夹指纹：重新扫描一次（同时刷新列表缓存）取所有图片的 (相对路径, 大小, mtime_ns)，不打开任何文件。
+
+    增删、改名、覆盖写入都会改变指纹；文件夹不存在时返回固定的 "missing" 指纹。
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(os.path.abspath(image_dir).encode("utf-8", "surrogatepass"))
+    try:
+        entries = directory_listings.scan(image_dir, max_depth, include, exclude, sort_order="name", refresh=True)
+    except OSError:
+        return f"missing:{hasher.hexdigest()}"
+    for name, size, mtime_ns in entries:
+        hasher.update(f"{name}\0{size}\0{mtime_ns}\n".encode("utf-8", "surrogatepass"))
+    return f"dir:{len(entries)}:{hasher.hexdigest()}"
+
+
+def sampled_tensor_fingerprint(images, sample_elements=SAMPLED_HASH_ELEMENTS):
+    """输入批次的廉价指纹：形状/类型 + 等间距抽取的固定数量元素的哈希（不遍历整批像素）"""
+    flat = images.detach().reshape(-1)
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{tuple(images.shape)}|{images.dtype}".encode("utf-8"))
+    if flat.numel() > 0:
+        count = min(flat.numel(), sample_elements)
+        index = torch.linspace(0, flat.numel() - 1, steps=count, dtype=torch.float64).long().to(flat.device)
+        hasher.update(flat[index].cpu().contiguous().numpy().tobytes())
+    return f"tensor:{hasher.hexdigest()}"
@@ -0,0 +1,33 @@
+import numpy as np
+
+# 自动条带模式：单页像素数超过该值时按 DEFAULT_STRIP_ROWS 行一个条带渲染
+STRIP_AUTO_PIXELS = 64_000_000
+DEFAULT_STRIP_ROWS = 1024
+
+
+def resolve_strip_height(page_width, page_height, strip_height):
+    """返回实际条带高度；0 表示整页渲染（strip_height=0 时按页面像素数自动决定）"""
+    if strip_height <= 0:
+        return DEFAULT_STRIP_ROWS if page_width * page_height > STRIP_AUTO_PIXELS else 0
+    return strip_height if strip_height < page_height else 0
+
+
+def iter_bands(page_height, strip_height):
+    """产出 (top, bottom) 行区间；strip_height 为 0 时整页一个区间"""
+    step = strip_height or page_height
+    for top in range(0, page_height, step):
+        yield top, min(top + step, page_height)
+
+
+def max_tiles_per_band(plan, strip_height):
+    """所有页中与单个条带相交的最大图块数，用于确定需同时驻留的解码源图数量"""
+    most = 0
+    for page_idx in range(plan.page_count):
+        tiles = plan.page_tiles(page_idx)
+        if len(tiles) == 0:
+            continue
+        tile_top = np.minimum(tiles['img_y'], tiles['tile_y'])
+        tile_bottom = np.maximum(tiles['img_y'] + tiles['img_h'], tiles['tile_y'] + tiles['tile_h'])
+        for top, bottom in iter_bands(plan.page_height, strip_height):
+            most = max(most, int(np.count_nonzero((tile_top < bottom) & (tile_bottom > top))))
+    return most
@@ -0,0 +1,90 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+
+def frame_to_pil(frame):
+    """单帧 float 张量 (H, W, C, 0~1) -> uint8 PIL 图像；按需逐帧转换，不为整批输入保留 PIL 副本"""
+    frame_np = frame.cpu().numpy() * 255.0
+    return Image.fromarray(frame_np.clip(0, 255).astype(np.uint8))
+
+
+def fill_page_background(page_out, bg_color):
+    """用背景色填充预分配的页面张量 page_out[H, W, C]（bg_color 为 0~255 的 RGB/RGBA 元组）"""
+    page_out.copy_(torch.tensor(bg_color[:page_out.shape[-1]], dtype=page_out.dtype) / 255.0)
+
+
+def center_square_box(width, height):
+    """与 crop_center_square 相同的居中正方形裁剪框（PIL crop 对浮点坐标取 round）"""
+    square_size = min(width, height)
+    left = round((width - square_size) / 2)
+    top = round((height - square_size) / 2)
+    right = round((width + square_size) / 2)
+    bottom = round((height + square_size) / 2)
+    return left, top, right, bottom
+
+
+def paste_frames_into_page(page_out, frames, frame_indices, tiles, chunk_size=64):
+    """把一组目标尺寸相同的图块批量缩放后按切片写入 page_out[H, W, C]。
+
+    frames 为输入 IMAGE 批次 [N, H, W, C]（0~1），frame_indices 与 tiles 一一对应；
+    缩放在 frames 所在设备上以 chunk_size 为一批执行（CPU 上以 uint8 缩放），RGBA 页面的图块区域 alpha 置 1。
+    """
+    first = tiles[0]
+    target_size = (int(first.img_h), int(first.img_w))
+    page_h, page_w, page_c = page_out.shape
+
+    for start in range(0, len(tiles), chunk_size):
+        chunk_tiles = tiles[start:start + chunk_size]
+        chunk_indices = frame_indices[start:start + chunk_size]
+        if chunk_indices == list(range(chunk_indices[0], chunk_indices[0] + len(chunk_indices))):
+            batch = frames[chunk_indices[0]:chunk_indices[0] + len(chunk_indices), :, :, :3]  # 连续帧直接取视图
+        else:
+            index = torch.as_tensor(chunk_indices, dtype=torch.long, device=frames.device)
+            batch = frames.index_select(0, index)[..., :3]
+        if first.crop:
+            left, top, right, bottom = center_square_box(batch.shape[2], batch.shape[1])
+            batch = batch[:, top:bottom, left:right, :]
+        if batch.device.type == 'cpu':
+            # CPU 上先按原 PIL 路径的方式量化为 uint8（*255 截断），uint8 的抗锯齿 bicubic 有向量化快速路径
+            batch = batch.mul(255.0).clamp_(0.0, 255.0).to(torch.uint8)
+        batch = batch.permute(0, 3, 1, 2)
+        if tuple(batch.shape[2:]) != target_size:
+            batch = F.interpolate(batch if batch.dtype == torch.uint8 else batch.float(), size=target_size,
+                                  mode='bicubic', align_corners=False, antialias=True)
+        if batch.dtype == torch.uint8:
+            batch = batch.to(page_out.dtype).div_(255.0)
+        batch = batch.clamp_(0.0, 1.0).permute(0, 2, 3, 1).to(device=page_out.device, dtype=page_out.dtype)
+
+        for tile, tile_img in zip(chunk_tiles, batch):
+            x0, y0 = max(int(tile.img_x), 0), max(int(tile.img_y), 0)
+            x1 = min(int(tile.img_x) + target_size[1], page_w)
+            y1 = min(int(tile.img_y) + target_size[0], page_h)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            src = tile_img[y0 - tile.img_y:y1 - tile.img_y, x0 - tile.img_x:x1 - tile.img_x]
+            page_out[y0:y1, x0:x1, :3] = src
+            if page_c == 4:
+                page_out[y0:y1, x0:x1, 3] = 1.0
+
+
+def composite_overlay(page_out, overlay_img):
+    """把透明 RGBA 叠加层（边框、文件名）按 straight alpha 的 over 规则合成到 page_out，只处理有笔画的像素"""
+    overlay_np = np.asarray(overlay_img)
+    rows, cols = np.nonzero(overlay_np[:, :, 3])
+    if len(rows) == 0:
+        return
+    rows = torch.from_numpy(rows)
+    cols = torch.from_numpy(cols)
+    src = torch.from_numpy(overlay_np[overlay_np[:, :, 3] > 0].astype(np.float32) / 255.0)
+    alpha = src[:, 3:4]
+    dst = page_out[rows, cols]
+    if dst.shape[-1] == 4:
+        dst_alpha = dst[:, 3:4]
+        out_alpha = alpha + dst_alpha * (1.0 - alpha)
+        dst[:, :3] = (src[:, :3] * alpha + dst[:, :3] * dst_alpha * (1.0 - alpha)) / out_alpha.clamp(min=1e-6)
+        dst[:, 3:4] = out_alpha
+    else:
+        dst[:, :3] = dst[:, :3] * (1.0 - alpha) + src[:, :3] * alpha
+    page_out[rows, cols] = dst
@@ -0,0 +1,195 @@
+"""layout.py 中网格行数与 a4=1 基准尺寸求解器的回归测试 | Regression tests for the closed-form layout solvers.
+
+solve_rows_per_column 必须与原先从 100 向下搜索的结果完全一致；solve_fit_length 给出精确的最大基准尺寸，
+与原先每次减 10px 的循环相比：不需要缩小时结果相同，需要缩小时不小于旧结果、最多大 9px，并等于暴力搜索的最大值。
+
+Usage:
+    python -m pytest tests
+"""
+import os
+import sys
+import importlib
+import importlib.util
+import itertools
+import pytest
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "image_concat_tests"
+
+
+def load_module(name):
+    """以包的方式加载本插件的子模块（目录名可能含 '-'，且模块使用相对导入）"""
+    if PACKAGE_NAME not in sys.modules:
+        spec = importlib.util.spec_from_file_location(PACKAGE_NAME, os.path.join(PACKAGE_DIR, "__init__.py"),
+                                                      submodule_search_locations=[PACKAGE_DIR])
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[PACKAGE_NAME] = package
+        spec.loader.exec_module(package)
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
+
+
+layout = load_module("layout")
+solve_rows_per_column = layout.solve_rows_per_column
+solve_fit_length = layout.solve_fit_length
+MAX_ROWS_PER_PAGE = layout.MAX_ROWS_PER_PAGE
+
+PAGE_WIDTHS = [120, 512, 1000, 1920, 4000]
+PAGE_RATIOS = [(1, 1), (4, 3), (3, 4), (16, 9), (9, 16), (3, 1), (1, 3)]
+MARGINS = [0, 20]
+PADDINGS = [0, 1, 10, 37]
+# 源图宽高（含极端宽高比与小于页面的源图）
+SOURCE_SIZES = [(100, 100), (640, 480), (480, 640), (1920, 1080), (1080, 1920), (3000, 1000), (1000, 3000),
+                (4000, 7), (7, 4000), (37, 53), (6000, 4000)]
+
+
+def baseline_rows_per_column(height_use, tile_h, padding, has_outer_padding):
+    """原实现：从 100 行向下找第一个放得下的行数"""
+    n_per_col = 1
+    for n in range(100, 0, -1):
+        h_sum = n * tile_h + (n - 1) * padding
+        if has_outer_padding:
+            h_sum += (n + 1) * padding
+        if h_sum <= height_use:
+            n_per_col = n
+            break
+    return n_per_col
+
+
+def baseline_fit_length(start, src_len, src_other, limit):
+    """原实现：基准尺寸每次减 10px，直到换算后的另一边不超过 limit"""
+    base = start
+    while base > 0:
+        calc = int(base * (src_other / src_len)) if src_len > 0 else 100
+        if calc <= limit:
+            break
+        base -= 10
+    return base
+
+
+def brute_force_fit_length(max_len, src_len, src_other, limit):
+    ratio = src_other / src_len
+    for length in range(max_len, 0, -1):
+        if int(length * ratio) <= limit:
+            return length
+    return 0
+
+
+def page_use(page_width, ratio, margin):
+    """与 generate_concat 相同：页面可用宽高"""
+    page_height = int(page_width * ratio[1] / ratio[0])
+    return page_width - 2 * margin, page_height - 2 * margin
+
+
+def check_fit_length(max_len, src_len, src_other, limit):
+    result = solve_fit_length(max_len, src_len, src_other, limit)
+    old = baseline_fit_length(max_len, src_len, src_other, limit)
+    assert result == brute_force_fit_length(max_len, src_len, src_other, limit)
+    if int(max_len * (src_other / src_len)) <= limit:
+        # 无需缩小时与旧循环完全一致
+        assert result == old
+    else:
+        assert max(old, 0) <= result <= old + 9
+        assert result == 0 or int(result * (src_other / src_len)) <= limit
+
+
+@pytest.mark.parametrize("page_width,ratio,margin", list(itertools.product(PAGE_WIDTHS, PAGE_RATIOS, MARGINS)))
+@pytest.mark.parametrize("has_outer_padding", [False, True])
+def test_rows_per_column_matches_baseline(page_width, ratio, margin, has_outer_padding):
+    _, height_use = page_use(page_width, ratio, margin)
+    for padding in PADDINGS:
+        for tile_h in itertools.chain(range(0, 64), range(64, height_use + 50, 7)):
+            assert solve_rows_per_column(height_use, tile_h, padding, has_outer_padding) == \
+                   baseline_rows_per_column(height_use, tile_h, padding, has_outer_padding), (tile_h, padding)
+
+
+@pytest.mark.parametrize("has_outer_padding", [False, True])
+@pytest.mark.parametrize("padding", PADDINGS)
+def test_rows_per_column_exact_fit_boundaries(has_outer_padding, padding):
+    for tile_h, n in itertools.product([1, 9, 50, 333], [1, 2, 3, 17, 99]):
+        exact = n * tile_h + (n - 1) * padding + ((n + 1) * padding if has_outer_padding else 0)
+        for height_use in (exact - 1, exact, exact + 1):
+            expected = baseline_rows_per_column(height_use, tile_h, padding, has_outer_padding)
+            assert solve_rows_per_column(height_use, tile_h, padding, has_outer_padding) == expected
+        assert solve_rows_per_column(exact, tile_h, padding, has_outer_padding) == n
+
+
+def test_rows_per_column_edge_cases():
+    # 一行都放不下时仍为 1 行
+    assert solve_rows_per_column(100, 500, 10, False) == 1
+    assert solve_rows_per_column(100, 500, 10, True) == 1
+    assert solve_rows_per_column(0, 10, 0, False) == 1
+    assert solve_rows_per_column(-50, 10, 5, True) == baseline_rows_per_column(-50, 10, 5, True) == 1
+    # 行数上限
+    assert solve_rows_per_column(100000, 1, 0, False) == MAX_ROWS_PER_PAGE
+    assert solve_rows_per_column(100000, 1, 0, True) == MAX_ROWS_PER_PAGE
+    assert solve_rows_per_column(1000, 0, 0, False) == baseline_rows_per_column(1000, 0, 0, False) == MAX_ROWS_PER_PAGE
+    assert solve_rows_per_column(99, 1, 0, False) == 99
+    assert solve_rows_per_column(101, 1, 0, False) == MAX_ROWS_PER_PAGE
+
+
+@pytest.mark.parametrize("page_width,ratio,margin", list(itertools.product(PAGE_WIDTHS, PAGE_RATIOS, MARGINS)))
+@pytest.mark.parametrize("has_outer_padding", [False, True])
+def test_fit_length_matches_baseline(page_width, ratio, margin, has_outer_padding):
+    width_use, height_use = page_use(page_width, ratio, margin)
+    for padding, (src_w, src_h) in itertools.product(PADDINGS, SOURCE_SIZES):
+        outer = 2 * padding if has_outer_padding else 0
+        # 5.equal title width up_down / 6.equal title height left_right 的调用方式
+        check_fit_length(min(width_use, src_w), src_w, src_h, height_use - outer)
+        check_fit_length(min(height_use, src_h), src_h, src_w, width_use - outer)
+
+
+def test_fit_length_exact_fit_boundaries():
+    for src_len, src_other in [(3, 7), (7, 3), (1920, 1080), (1080, 1920), (4000, 7), (999, 1000)]:
+        ratio = src_other / src_len
+        for length in [1, 2, 10, 11, 97, 640, 1999]:
+            boundary = int(length * ratio)
+            # limit 恰好等于 length 换算出的另一边时，length 本身可用
+            assert solve_fit_length(length, src_len, src_other, boundary) == length
+            check_fit_length(length, src_len, src_other, boundary)
+            check_fit_length(length, src_len, src_other, boundary - 1)
+            check_fit_length(length + 5, src_len, src_other, boundary)
+
+
+def test_fit_length_nothing_fits():
+    # 任何正整数基准尺寸都放不下时返回 0（旧循环会得到负数）
+    assert solve_fit_length(25, 1, 100, 50) == 0
+    assert baseline_fit_length(25, 1, 100, 50) == -5
+    assert solve_fit_length(500, 100, 300, -1) == 0
+    assert solve_fit_length(500, 100, 300, 0) == 0
+    assert solve_fit_length(500, 100, 300, 100) == brute_force_fit_length(500, 100, 300, 100) == 33
+    assert solve_fit_length(1, 4000, 7, 0) == 1
+    assert solve_fit_length(0, 100, 100, 10) == 0
+
+
+@pytest.fixture(scope="module")
+def concat_node():
+    return load_module("node").ImageConcatNode()
+
+
+@pytest.mark.parametrize("page_width,ratio", list(itertools.product(PAGE_WIDTHS, PAGE_RATIOS)))
+@pytest.mark.parametrize("title_first_position", ["start_from margin", "start_from margin + padding"])
+def test_a4_1_base_size_matches_baseline(concat_node, page_width, ratio, title_first_position):
+    width_use, height_use = page_use(page_width, ratio, 20)
+    has_outer_padding = title_first_position != "start_from margin"
+    for padding, (src_w, src_h) in itertools.product(PADDINGS, SOURCE_SIZES):
+        image_files = ["first.png", "second.png"]
+        sizes = {"first.png": (src_w, src_h), "second.png": (src_h, src_w)}
+        # 首图尺寸直接给定，不读取文件
+        concat_node.get_image_size = sizes.get
+        outer = 2 * padding if has_outer_padding else 0
+
+        pages = concat_node.calc_vertical_title_groups_a4_1(
+            image_files, width_use, height_use, padding, title_first_position, "5.equal title width up_down")
+        base_w = pages[0]['meta']['width']
+        expected = baseline_fit_length(min(width_use, src_w), src_w, src_h, height_use - outer)
+        assert base_w == brute_force_fit_length(min(width_use, src_w), src_w, src_h, height_use - outer)
+        assert max(expected, 0) <= base_w <= expected + 9
+        assert sum(len(page['files']) for page in pages) == len(image_files)
+
+        pages = concat_node.calc_vertical_title_groups_a4_1(
+            image_files, width_use, height_use, padding, title_first_position, "6.equal title height left_right")
+        base_h = pages[0]['meta']['height']
+        expected = baseline_fit_length(min(height_use, src_h), src_h, src_w, width_use - outer)
+        assert base_h == brute_force_fit_length(min(height_use, src_h), src_h, src_w, width_use - outer)
+        assert max(expected, 0) <= base_h <= expected + 9
+        assert sum(len(page['files']) for page in pages) == len(image_files)
@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+
+# 缩放图块缓存的默认字节预算
+DEFAULT_TILE_CACHE_BYTES = 512 * 1024 * 1024
+# 代理预览的源图缩略图（与布局无关，同样存放在本缓存中）的长边上限
+PREVIEW_PROXY_SIDE = 512
+
+
+class ResizedTileCache:
+    """Process-wide LRU of resized tile images, bounded by total bytes.
+
+    Keys are (source fingerprint, target width, target height, crop, decode mode), so reruns that
+    only change margins, borders, filenames or background reuse the resized pixels and skip both
+    decoding and LANCZOS. Cached images are shared and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.items = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def image_bytes(img):
+        return img.width * img.height * len(img.getbands())
+
+    def set_budget(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max(0, int(max_bytes))
+            self.evict()
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and self.items:
+            _, evicted = self.items.popitem(last=False)
+            self.total_bytes -= self.image_bytes(evicted)
+
+    def get(self, key):
+        with self.lock:
+            img = self.items.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            return img
+
+    def put(self, key, img):
+        nbytes = self.image_bytes(img)
+        with self.lock:
+            if nbytes > self.max_bytes:
+                return
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.total_bytes -= self.image_bytes(old)
+            self.items[key] = img
+            self.total_bytes += nbytes
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.total_bytes = 0
+
+
+resized_tiles = ResizedTileCache()